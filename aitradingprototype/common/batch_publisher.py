@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPublisher:
+    """
+    Batch Publisher
+    ---------------
+    Buffers the events to publish and publishes them with a Redis pipeline, in a single round trip per batch.
+    A batch is flushed by a background thread when it has `batch_size` events or `max_wait` seconds after its
+    first event was buffered, whichever comes first. The events are encoded by the background thread too (`encode`),
+    so `publish` only appends to the buffer; it blocks while `max_buffered` events are waiting (backpressure).
+
+    A publishing error is raised by the next `publish`, `flush` or `close`.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        batch_size: int = 100,
+        max_wait: float = 0.05,
+        max_buffered: int = None,
+        encode=json.dumps,
+    ):
+        self.redis_client = redis_client
+        self.encode = encode
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_buffered = max_buffered or 10 * batch_size
+        self.published = 0
+        self.flushes = 0
+        self._events = []  # (channel, event)
+        self._first_event_time = None
+        self._in_flight = 0
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    @property
+    def buffered(self) -> int:
+        """
+        Events buffered or being published
+        """
+        with self._condition:
+            return len(self._events) + self._in_flight
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def publish(self, channel: str, event: dict):
+        """
+        Buffer the event to publish it to `channel`
+        """
+        with self._condition:
+            self._raise_error()
+            while len(self._events) >= self.max_buffered and self._error is None:
+                self._condition.wait()
+            self._raise_error()
+            if not self._events:
+                self._first_event_time = time.monotonic()
+            self._events.append((channel, event))
+            if len(self._events) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _next_batch(self) -> list:
+        """
+        Wait until a batch is due, return it (empty when closed without events)
+        """
+        with self._condition:
+            while not self._closed:
+                if len(self._events) >= self.batch_size:
+                    break
+                if self._events:
+                    timeout = self._first_event_time + self.max_wait - time.monotonic()
+                    if timeout <= 0:
+                        break
+                else:
+                    timeout = None
+                self._condition.wait(timeout)
+            batch = self._events[: self.batch_size]
+            del self._events[: self.batch_size]
+            self._first_event_time = time.monotonic() if self._events else None
+            self._in_flight = len(batch)
+            return batch
+
+    def _publish_batch(self, batch: list):
+        messages = [(channel, self.encode(event)) for channel, event in batch]
+        try:
+            self.redis_client.publish_messages(messages)
+            error = None
+        except Exception as publish_error:
+            error = publish_error
+        with self._condition:
+            self._in_flight = 0
+            if error is None:
+                self.published += len(batch)
+                self.flushes += 1
+            else:
+                logger.error(f"Can't publish {len(batch)} events ({error})")
+                self._error = error
+            self._condition.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._publish_batch(batch)
+            elif self._closed:
+                return
+
+    def flush(self):
+        """
+        Wait until all the buffered events are published
+        """
+        with self._condition:
+            if self._events:
+                self._first_event_time = 0  # the batch is due now
+            self._condition.notify_all()
+            while (self._events or self._in_flight) and self._error is None:
+                self._condition.wait()
+            self._raise_error()
+
+    def close(self):
+        """
+        Publish the buffered events and stop the background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._flusher.join()
+        with self._condition:
+            self._raise_error()
+
+    def stats(self) -> dict:
+        """
+        Return the published events, flushed batches and buffered events
+        """
+        with self._condition:
+            return {
+                "published": self.published,
+                "flushes": self.flushes,
+                "buffered": len(self._events) + self._in_flight,
+                "average_batch_size": (
+                    self.published / self.flushes if self.flushes else 0.0
+                ),
+            }
@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_POSITION_KEYS = {"offset", "inode", "line_hash"}
+
+
+class Checkpoint:
+    """
+    Checkpoint
+    ----------
+    Keeps the read position of a followed file (see `FileOperator.follow_line`) in `file_path`,
+    so that a restarted consumer resumes after the last line it processed.
+
+    The position is written every `every_lines` processed lines or `every_seconds` seconds, whichever comes first.
+    A background thread also writes the last position when the input goes idle for `every_seconds` seconds.
+    Each write is atomic (temporary file, fsync, rename), so a crash leaves either the previous or the new checkpoint.
+
+    `before_save` is called before each write, to flush the outputs of the processed lines (ex: buffered events),
+    so that the position is never saved ahead of them. Its error skips the write, it's raised by the next `update`
+    or `close` when the background thread got it.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        every_lines: int = 100,
+        every_seconds: float = 5,
+        before_save=None,
+    ):
+        self.file_path = file_path
+        self.every_lines = every_lines
+        self.every_seconds = every_seconds
+        self.before_save = before_save
+        self.position = None
+        self._error = None
+        self._pending_lines = 0
+        self._last_save_time = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._saver = None
+
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def load(self):
+        """
+        Return the saved position, `None` if there's no checkpoint yet or it can't be read
+        """
+        try:
+            with open(self.file_path, "r") as file:
+                position = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logger.warning(f"Can't read checkpoint '{self.file_path}' ({error})")
+            return None
+        if not isinstance(position, dict) or not _POSITION_KEYS <= position.keys():
+            logger.warning(
+                f"Checkpoint '{self.file_path}' isn't a position ({position}), ignoring it"
+            )
+            return None
+        self.position = position
+        return self.position
+
+    def _save_when_idle(self):
+        """
+        Save the last position every `every_seconds`, even if no new line is processed
+        """
+        while not self._closed.wait(self.every_seconds):
+            with self._lock:
+                if time.monotonic() - self._last_save_time >= self.every_seconds:
+                    try:
+                        self._save()
+                    except Exception as error:
+                        logger.error(
+                            f"Can't save checkpoint '{self.file_path}' ({error})"
+                        )
+                        self._error = error
+                        return
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def update(self, position: dict, lines: int = 1):
+        """
+        Record the position after the last processed `lines`, and save it if it's time to
+        """
+        with self._lock:
+            self._raise_error()
+            self.position = position
+            self._pending_lines += lines
+            if (
+                self._pending_lines >= self.every_lines
+                or time.monotonic() - self._last_save_time >= self.every_seconds
+            ):
+                self._save()
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_when_idle, daemon=True)
+            self._saver.start()
+
+    def _save(self):
+        if self.position is None or not self._pending_lines:
+            return
+        if self.before_save is not None:
+            self.before_save()
+        temporary_file_path = f"{self.file_path}.tmp"
+        with open(temporary_file_path, "w") as file:
+            json.dump(self.position, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_file_path, self.file_path)
+        self._pending_lines = 0
+        self._last_save_time = time.monotonic()
+        logger.debug(f"Saved checkpoint {self.position}")
+
+    def save(self):
+        """
+        Atomically write the last recorded position
+        """
+        with self._lock:
+            self._save()
+
+    def close(self):
+        """
+        Stop the background saves and write the last recorded position
+        """
+        self._closed.set()
+        with self._lock:
+            self._raise_error()
+            self._save()
@@ -0,0 +1,178 @@
+import json
+import math
+import struct
+
+from aitradingprototype.common.enums import Sentiment
+
+# Binary events start with this byte, JSON events with '{'
+MAGIC = 0xAE
+VERSION = 2
+_MAGIC_BYTE = bytes([MAGIC])
+
+# Header: magic, version, flags, sentiment, event id (UUID), event, collected, published and read times (ms)
+_HEADER = struct.Struct(">BBBB16sqqqq")
+_HEADERS = {1: struct.Struct(">BBBB16sqqq"), VERSION: _HEADER}  # the decoded versions
+_LATENCY = struct.Struct(">d")
+_LENGTHS = {
+    length_format: struct.Struct(length_format) for length_format in (">B", ">H", ">I")
+}
+_LEAN = 0x01  # the body only has the asset and duplicate_of
+_DUPLICATE = 0x02  # the body has the duplicate_of event id (UUID)
+_READ_TIME = 0x04  # the header read time is set
+
+_SENTIMENT_CODES = {
+    Sentiment.UNKNOWN.value: 0,
+    Sentiment.BULLISH.value: 1,
+    Sentiment.BEARISH.value: 2,
+}
+_SENTIMENTS = {code: sentiment for sentiment, code in _SENTIMENT_CODES.items()}
+
+ENCODINGS = ("json", "binary", "lean")
+
+
+def _pack_string(value: str, length_format: str) -> bytes:
+    data = (value or "").encode()
+    return _LENGTHS[length_format].pack(len(data)) + data
+
+
+def _unpack_string(data: bytes, offset: int, length_format: str):
+    length_struct = _LENGTHS[length_format]
+    (length,) = length_struct.unpack_from(data, offset)
+    start = offset + length_struct.size
+    end = start + length
+    return data[start:end].decode(), end
+
+
+def _uuid_bytes(value: str) -> bytes:
+    return bytes.fromhex(value.replace("-", ""))
+
+
+def _uuid_str(data: bytes) -> str:
+    """
+    Format 16 bytes as a UUID string, like `str(uuid.UUID(bytes=data))` but faster
+    """
+    value = data.hex()
+    return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}"
+
+
+def encode_binary(event: dict, lean: bool = False) -> bytes:
+    """
+    Encode the event with the binary format (version 2):
+        - header: magic byte, version, flags, sentiment code, event id (16 bytes), event, collected, published
+          and read times (signed 64 bits integers, the read time is 0 when it isn't set);
+        - asset (length-prefixed), then the duplicate_of event id (16 bytes) if it's set;
+        - unless `lean`: collected source, classified_by, headline (length-prefixed) and classification latency (ms).
+    The event ids must be UUIDs. Version 1 events, without the read time, are still decoded.
+    """
+    read_time = event.get("read_time")
+    flags = (
+        (_LEAN if lean else 0)
+        | (_DUPLICATE if event.get("duplicate_of") else 0)
+        | (_READ_TIME if read_time is not None else 0)
+    )
+    data = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        flags,
+        _SENTIMENT_CODES.get(event["sentiment"], 0),
+        _uuid_bytes(event["event_id"]),
+        event["event_time"],
+        event["collected_time"],
+        event["published_time"],
+        read_time or 0,
+    ) + _pack_string(event.get("asset"), ">B")
+    if flags & _DUPLICATE:
+        data += _uuid_bytes(event["duplicate_of"])
+    if lean:
+        return data
+    latency = event.get("classification_latency_ms")
+    return (
+        data
+        + _pack_string(event["collected_source"], ">H")
+        + _pack_string(event.get("classified_by"), ">B")
+        + _pack_string(event["headline"], ">I")
+        + _LATENCY.pack(math.nan if latency is None else latency)
+    )
+
+
+def encode_event(event: dict, encoding: str = "json"):
+    """
+    Encode the event as JSON (str), or with the binary format ('binary' or 'lean', bytes)
+    """
+    if encoding == "json":
+        return json.dumps(event)
+    return encode_binary(event, lean=encoding == "lean")
+
+
+def is_binary(data) -> bool:
+    """
+    Check if the event data has the binary format
+    """
+    return isinstance(data, bytes) and data[:1] == _MAGIC_BYTE
+
+
+def _decode_header(data: bytes):
+    """
+    Return the header fields, asset and duplicate_of of a binary event, the flags and the offset after them
+    """
+    header = _HEADERS.get(data[1])
+    if header is None:
+        raise ValueError(f"Binary event version {data[1]} isn't supported")
+    (
+        _,
+        _,
+        flags,
+        sentiment_code,
+        event_id,
+        event_time,
+        collected_time,
+        published_time,
+        *read_time,
+    ) = header.unpack_from(data)
+    asset, offset = _unpack_string(data, header.size, ">B")
+    duplicate_of = None
+    if flags & _DUPLICATE:
+        end = offset + 16
+        duplicate_of = _uuid_str(data[offset:end])
+        offset = end
+    event = {
+        "event_id": _uuid_str(event_id),
+        "event_time": event_time,
+        "collected_time": collected_time,
+        "published_time": published_time,
+        "sentiment": _SENTIMENTS.get(sentiment_code, Sentiment.UNKNOWN.value),
+        "asset": asset or None,
+        "duplicate_of": duplicate_of,
+    }
+    if flags & _READ_TIME:
+        event["read_time"] = read_time[0]
+    return event, flags, offset
+
+
+def decode_event_header(data) -> dict:
+    """
+    Decode the fields needed to trade on the event: ids, times (and the read time if it's set), sentiment,
+    asset and duplicate_of.
+    The headline of a binary event isn't decoded, a JSON event is fully decoded.
+    """
+    if not is_binary(data):
+        return json.loads(data)
+    return _decode_header(data)[0]
+
+
+def decode_event(data) -> dict:
+    """
+    Decode a JSON or binary event (str or bytes)
+    """
+    if not is_binary(data):
+        return json.loads(data)
+    event, flags, offset = _decode_header(data)
+    if flags & _LEAN:
+        return event
+    event["collected_source"], offset = _unpack_string(data, offset, ">H")
+    classified_by, offset = _unpack_string(data, offset, ">B")
+    event["classified_by"] = classified_by or None
+    event["headline"], offset = _unpack_string(data, offset, ">I")
+    (latency,) = _LATENCY.unpack_from(data, offset)
+    event["classification_latency_ms"] = None if math.isnan(latency) else latency
+    return event
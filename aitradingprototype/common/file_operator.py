@@ -1,4 +1,29 @@
-import time
+import hashlib
+import logging
+import os
+
+from aitradingprototype.common.file_watcher import create_file_watcher
+
+logger = logging.getLogger(__name__)
+
+# Bytes read at once when scanning the file backwards for a newline
+_SCAN_SIZE = 65536
+
+
+def _line_hash(raw_line: bytes) -> str:
+    return hashlib.sha256(raw_line).hexdigest()
+
+
+class FileLine(str):
+    """
+    Line yielded by `FileOperator.follow_line`, with the `position` of the file right after it:
+    {"offset": bytes, "inode": file inode, "line_hash": sha256 of the line}
+    """
+
+    def __new__(cls, line: str, position: dict):
+        file_line = super().__new__(cls, line)
+        file_line.position = position
+        return file_line
 
 
 class FileOperator:
@@ -11,21 +36,168 @@ class FileOperator:
         Initialize the FileOperator class with file name and mode
         """
         self.file_name = file_name
+        self.mode = mode
         self.file = open(file_name, mode)
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.offset = 0  # bytes of the complete lines yielded by `follow_line`
+
+    def _last_newline(self, end: int) -> int:
+        """
+        Return the offset of the last newline before `end`, -1 if there's none
+        """
+        while end > 0:
+            start = max(0, end - _SCAN_SIZE)
+            self.file.buffer.seek(start)
+            newline = self.file.buffer.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline
+            end = start
+        return -1
+
+    def _last_line_hash(self, offset: int):
+        """
+        Return the hash of the line ending right before `offset`, `None` if there's no newline before `offset`
+        """
+        self.file.buffer.seek(offset - 1)
+        if self.file.buffer.read(1) != b"\n":
+            return None
+        line_start = self._last_newline(offset - 1) + 1
+        self.file.buffer.seek(line_start)
+        return _line_hash(self.file.buffer.read(offset - 1 - line_start))
+
+    def _is_valid_position(self, position: dict) -> bool:
+        """
+        Check that the position is in the same file (inode) and after the same line (hash)
+        """
+        if position is None or position["inode"] != self.inode:
+            return False
+        if position["offset"] == 0:
+            return True
+        if os.fstat(self.file.fileno()).st_size < position["offset"]:
+            return False
+        return self._last_line_hash(position["offset"]) == position["line_hash"]
+
+    def _end_offset(self) -> int:
+        """
+        Return the offset after the last complete line of the file
+        """
+        return self._last_newline(os.fstat(self.file.fileno()).st_size) + 1
+
+    def seek_position(
+        self,
+        read_from: str = "checkpoint",
+        position: dict = None,
+        fallback: str = "start",
+    ) -> str:
+        """
+        Move where `follow_line` starts reading:
+            - 'start': from the start of the file;
+            - 'end': after the last complete line, only the new lines are read;
+            - 'checkpoint': after the line of `position` (see `FileLine`), from the start if there's no position.
+        If `position` doesn't match the file anymore (other file, truncated or changed content),
+        `fallback` tells where to start: 'start', 'end' or 'fail' (raises ValueError).
+        Returns where it starts: 'start', 'end' or 'checkpoint'.
+        """
+        if read_from == "checkpoint" and position is not None:
+            if self._is_valid_position(position):
+                return self._seek(position["offset"], "checkpoint")
+            message = f"Checkpoint {position} doesn't match '{self.file_name}'"
+            if fallback == "fail":
+                raise ValueError(message)
+            logger.warning(f"{message}, reading from its {fallback}")
+            read_from = fallback
+        if read_from == "end":
+            return self._seek(self._end_offset(), "end")
+        return self._seek(0, "start")
+
+    def _seek(self, offset: int, read_from: str) -> str:
+        self.file.buffer.seek(offset)
+        self.offset = offset
+        logger.info(f"Reading '{self.file_name}' from byte {offset} ({read_from})")
+        return read_from
+
+    def _split_lines(self, data: bytes):
+        """
+        Return the complete non-empty lines of `data`, as `FileLine`, and the partial line at its end.
+        `offset` is moved after the complete lines.
+        """
+        raw_lines = data.split(b"\n")
+        partial_line = raw_lines.pop()
+        lines = []
+        for raw_line in raw_lines:
+            self.offset += len(raw_line) + 1
+            line = raw_line.decode().strip()
+            if line:
+                position = {
+                    "offset": self.offset,
+                    "inode": self.inode,
+                    "line_hash": _line_hash(raw_line),
+                }
+                lines.append(FileLine(line, position))
+        return lines, partial_line
+
+    def _reopen(self, partial_line: bytes):
+        """
+        Reopen the file if it was rotated (replaced by a new file with the same name)
+        or seek to its start if it was truncated.
+        Returns None if neither happened, otherwise the last lines of the rotated file, whose last line
+        is complete even without its ending newline (none if the file was truncated).
+        """
+        try:
+            file_stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            return None  # rotation in progress, wait for the new file
+        opened_file_stat = os.fstat(self.file.fileno())
+        if file_stat.st_ino != opened_file_stat.st_ino:
+            logger.info(f"'{self.file_name}' was rotated, reading the new file")
+            last_lines = (partial_line + self.file.buffer.read()).split(b"\n")
+            self.file.close()
+            self.file = open(self.file_name, self.mode)
+            self.inode = file_stat.st_ino
+        elif opened_file_stat.st_size < self.file.buffer.tell():
+            logger.info(f"'{self.file_name}' was truncated, reading from its start")
+            last_lines = []
+            self.file.buffer.seek(0)
+        else:
+            return None
+        self.offset = 0
+        # the last lines of a rotated file are followed by the start of the new file
+        position = {"offset": 0, "inode": self.inode, "line_hash": None}
+        return [
+            FileLine(line, position)
+            for line in (raw_line.decode().strip() for raw_line in last_lines)
+            if line
+        ]
 
-    def follow_line(self, wait_time=1):
+    def follow_line(self, wait_time=1, chunk_size=65536):
         """
         This method is used to follow a file like "tail -f file_name", i.e:
-            - follows the file and yields line if there is any new line;
-            - if not, it waits for `wait_time` (default: 1 second) and checks again;
+            - reads the new data by chunks of up to `chunk_size` bytes and yields each new non-empty line;
+            - a line without its ending newline yet is kept until the rest of it is written;
+            - if there's no new data, it waits for the file to change (with inotify on Linux, otherwise by polling
+              with an increasing wait up to `wait_time` seconds, default: 1 second);
+            - if the file is truncated, it's read again from its start, and if it's rotated the new file is read.
+        The lines are `FileLine`, with the file position after them, to checkpoint the processed lines.
         """
+        watcher = create_file_watcher(self.file_name, max_wait=wait_time)
+        partial_line = b""
+        try:
+            while True:
+                data = self.file.buffer.read1(chunk_size)
+                if data:
+                    watcher.reset()
+                    lines, partial_line = self._split_lines(partial_line + data)
+                    yield from lines
+                    continue
 
-        while True:
-            line = self.file.readline().strip()
-            if not line:
-                time.sleep(wait_time)
-                continue
-            yield line
+                last_lines = self._reopen(partial_line)
+                if last_lines is None:
+                    watcher.wait()
+                    continue
+                partial_line = b""
+                yield from last_lines
+        finally:
+            watcher.close()
 
     def write_line(self, line: str):
         """
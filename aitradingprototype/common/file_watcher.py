@@ -0,0 +1,135 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class PollingWatcher:
+    """
+    Polling Watcher
+    ---------------
+    Waits for a file change by sleeping, with an adaptive backoff: the wait starts at `min_wait` seconds
+    and doubles up to `max_wait` seconds while the file doesn't change.
+    """
+
+    def __init__(self, min_wait: float = 0.01, max_wait: float = 1):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.current_wait = min_wait
+
+    def wait(self):
+        """
+        Wait before checking the file again
+        """
+        time.sleep(self.current_wait)
+        self.current_wait = min(self.current_wait * 2, self.max_wait)
+
+    def reset(self):
+        """
+        The file changed, check it again quickly
+        """
+        self.current_wait = self.min_wait
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Inotify Watcher
+    ---------------
+    Waits for a file change with Linux inotify, so that a new line is read as soon as it's written.
+    The file's directory is watched, so that the file being created, moved or deleted (rotation) also wakes it up.
+    It also wakes up every `max_wait` seconds, in case an event is missed (ex: some network file systems).
+    """
+
+    def __init__(self, file_name: str, max_wait: float = 1):
+        self.file_name = os.path.basename(file_name).encode()
+        self.max_wait = max_wait
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        directory = os.path.dirname(os.path.abspath(file_name))
+        if libc.inotify_add_watch(self.fd, directory.encode(), _WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error), directory)
+
+    def _read_events(self) -> bool:
+        """
+        Drain the pending events, return True if one of them is about the file
+        """
+        file_changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return file_changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                start = offset + _EVENT_HEADER.size
+                offset = start + name_length
+                name = data[start:offset].rstrip(b"\0")
+                file_changed = file_changed or name == self.file_name
+
+    def wait(self):
+        """
+        Wait until the file changes or `max_wait` seconds
+        """
+        deadline = time.monotonic() + self.max_wait
+        timeout = self.max_wait
+        while timeout > 0:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if readable and self._read_events():
+                return
+            timeout = deadline - time.monotonic()
+
+    def reset(self):
+        pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_file_watcher(file_name: str, max_wait: float = 1):
+    """
+    Return an inotify watcher on Linux, otherwise (or if inotify isn't available) a polling watcher
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(file_name, max_wait)
+        except (OSError, AttributeError) as error:
+            logger.warning(
+                f"Can't watch '{file_name}' with inotify ({error}), polling it instead"
+            )
+    return PollingWatcher(max_wait=max_wait)
@@ -0,0 +1,70 @@
+from typing import NamedTuple
+
+from aitradingprototype.common.utils import split_line
+
+_SEPARATOR = '","'
+
+
+class HeadlineRecord(NamedTuple):
+    """
+    Headline (4 fields) or sentiment (5 fields) file line:
+    "headline collected source","headline collected timestamp (ms)","headline published timestamp (ms)","headline"[,"sentiment"]
+    """
+
+    source: str
+    collected_time: int
+    published_time: int
+    headline: str
+    sentiment: str = None
+
+
+# faster than `HeadlineRecord(*fields)`
+_make_record = HeadlineRecord._make
+
+
+def parse_line(line: str) -> HeadlineRecord:
+    """
+    Parse a headline or sentiment line in a single split, the fields being wrapped with '"' and separated by ','.
+    A line whose fields aren't all wrapped with '"' is parsed with `split_line`.
+    Raises ValueError if the line doesn't have 4 or 5 fields or its timestamps aren't integers.
+    """
+    if line[:1] == '"' and line[-1:] == '"':
+        fields = line[1:-1].split(_SEPARATOR)
+    else:
+        fields = split_line(line)
+    if len(fields) == 4:
+        fields.append(None)
+    elif len(fields) != 5:
+        raise ValueError(f"Line '{line}' doesn't have 4 or 5 fields")
+    fields[1] = int(fields[1])
+    fields[2] = int(fields[2])
+    return _make_record(fields)
+
+
+def parse_lines(lines):
+    """
+    Parse the non-empty lines, yield a `HeadlineRecord` for each one
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield parse_line(line)
+
+
+def parse_file(file_path: str, chunk_size: int = 1 << 20):
+    """
+    Bulk mode: parse a whole headlines or sentiments file, read by chunks of `chunk_size` bytes,
+    yield a `HeadlineRecord` for each non-empty line
+    """
+    with open(file_path, "rb") as file:
+        partial_line = b""
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            data = partial_line + data
+            end = data.rfind(b"\n") + 1
+            partial_line = data[end:]
+            # a single decode and split for all the complete lines of the chunk
+            yield from parse_lines(data[:end].decode().split("\n"))
+        yield from parse_lines([partial_line.decode()])
@@ -0,0 +1,277 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets: values (microseconds) below 128 have their own bucket, above they're grouped by 64 buckets
+# per power of 2, so a bucket is at most 1/64 (1.6%) of its values wide
+_SUB_BUCKET_BITS = 7
+_HALF_SUB_BUCKETS = 1 << (_SUB_BUCKET_BITS - 1)
+
+_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _bucket_index(value: int) -> int:
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return shift * _HALF_SUB_BUCKETS + (value >> shift)
+
+
+def _bucket_value(index: int) -> int:
+    """
+    Return the middle value of the bucket
+    """
+    if index < 2 * _HALF_SUB_BUCKETS:
+        return index
+    shift = index // _HALF_SUB_BUCKETS - 1
+    mantissa = index - shift * _HALF_SUB_BUCKETS
+    return (mantissa << shift) + (1 << (shift - 1))
+
+
+class Histogram:
+    """
+    Histogram
+    ---------
+    HDR-style latency histogram: the durations are counted in log-linear buckets of microseconds,
+    so the percentiles are within 1.6% of the recorded values, with a small and bounded memory.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """
+        Record a duration (a negative one, ex: from clocks skew, is recorded as 0)
+        """
+        seconds = max(0.0, seconds)
+        index = _bucket_index(int(seconds * 1e6))
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """
+        Return the duration (seconds) below which `percent` % of the durations are
+        """
+        with self._lock:
+            if not self.count:
+                return 0.0
+            # rounded, so that 99.9% of 10000 is the 9990th duration and not the 9991th
+            rank = math.ceil(round(percent / 100 * self.count, 6))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(_bucket_value(index) / 1e6, self.max)
+            return self.max
+
+
+class Counter:
+    """
+    Counter
+    -------
+    Monotonic count of events
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """
+    Gauge
+    -----
+    Current value of a quantity, ex: a queue depth
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Metrics:
+    """
+    Metrics
+    -------
+    Registry of the latency histograms, counters and gauges, by name and labels.
+    They're exposed in the Prometheus text format (`render`, `start_server`) and in a summary log line (`summary`).
+    """
+
+    def __init__(self):
+        self._metrics = {}  # (name, labels): Histogram, Counter or Gauge
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_class, name: str, help_text: str, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, metric_class())
+                if help_text:
+                    self._help.setdefault(name, help_text)
+        return metric
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels)
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+        Record a duration in the `name` histogram
+        """
+        self.histogram(name, **labels).record(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """
+        Increment the `name` counter
+        """
+        self.counter(name, **labels).inc(amount)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        Set the `name` gauge value
+        """
+        self.gauge(name, **labels).set(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Record the duration of the `with` block in the `name` histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _labels_text(labels: tuple, **extra_labels) -> str:
+        pairs = list(labels) + list(extra_labels.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self) -> str:
+        """
+        Return the metrics in the Prometheus text format, the histograms as summaries (quantiles, sum and count)
+        """
+        lines, typed = [], set()
+        for (name, labels), metric in sorted(self._metrics.items()):
+            is_histogram = isinstance(metric, Histogram)
+            if name not in typed:
+                typed.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {_METRIC_TYPES[type(metric)]}")
+            if not is_histogram:
+                lines.append(f"{name}{self._labels_text(labels)} {metric.value}")
+                continue
+            for quantile in _QUANTILES:
+                quantile_labels = self._labels_text(labels, quantile=quantile)
+                lines.append(
+                    f"{name}{quantile_labels} {metric.percentile(quantile * 100):.6f}"
+                )
+            lines.append(f"{name}_sum{self._labels_text(labels)} {metric.sum:.6f}")
+            lines.append(f"{name}_count{self._labels_text(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        Return a single line summary: count, p50 and p99 (milliseconds) of each histogram, value of each counter and gauge
+        """
+        parts = []
+        for (name, labels), metric in sorted(self._metrics.items()):
+            metric_name = f"{name}{self._labels_text(labels)}"
+            if not isinstance(metric, Histogram):
+                parts.append(f"{metric_name}={metric.value}")
+            elif metric.count:
+                parts.append(
+                    f"{metric_name} n={metric.count} p50={metric.percentile(50) * 1000:.1f}ms "
+                    f"p99={metric.percentile(99) * 1000:.1f}ms"
+                )
+        return ", ".join(parts)
+
+    def start_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serve the metrics on http://<host>:<port>/metrics in a daemon thread
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+        return server
+
+    def start_summary_log(self, interval: float) -> threading.Event:
+        """
+        Log the summary every `interval` seconds in a daemon thread, until the returned event is set
+        """
+        stopped = threading.Event()
+
+        def log_summary():
+            while not stopped.wait(interval):
+                logger.info(f"Metrics: {self.summary()}")
+
+        threading.Thread(target=log_summary, daemon=True).start()
+        return stopped
+
+
+_METRIC_TYPES = {Histogram: "summary", Counter: "counter", Gauge: "gauge"}
+
+# Registry of the process metrics
+metrics = Metrics()
+
+
+def start_metrics(metrics_config: dict):
+    """
+    Start the metrics endpoint (`port`, `host`) and the summary log (`summary_interval` seconds)
+    from the `metrics` config, if it's set
+    """
+    if not metrics_config:
+        return
+    if metrics_config.get("port") is not None:
+        metrics.start_server(
+            metrics_config["port"], metrics_config.get("host", "127.0.0.1")
+        )
+    if metrics_config.get("summary_interval"):
+        metrics.start_summary_log(metrics_config["summary_interval"])
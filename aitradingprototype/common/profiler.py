@@ -0,0 +1,223 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from aitradingprototype.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILING_MODES = ("cprofile", "sampling")
+
+
+class _NullSpan:
+    """
+    Span used while the spans are disabled, entering and exiting it does nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Span:
+    """
+    Span recording the duration of its `with` block in a histogram
+    """
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_spans_enabled = False
+
+
+def span(name: str):
+    """
+    Time the `with` block in the `aitp_span_seconds{span=<name>}` histogram while the spans are enabled.
+    Disabled, it only costs a global lookup and an empty `with`.
+    """
+    if not _spans_enabled:
+        return _NULL_SPAN
+    return _Span(metrics.histogram("aitp_span_seconds", span=name))
+
+
+def enable_spans(enabled: bool = True):
+    global _spans_enabled
+    _spans_enabled = enabled
+
+
+class SamplingProfiler:
+    """
+    Sampling Profiler
+    -----------------
+    Samples the stacks of all the threads every `interval` seconds from a daemon thread,
+    the samples are counted by stack in the collapsed format of the flame graph tools.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        functions = []
+        while frame is not None:
+            code = frame.f_code
+            functions.append(
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+            )
+            frame = frame.f_back
+        return ";".join(reversed(functions))
+
+    def _sample(self):
+        sampler_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != sampler_id:
+                    thread_name = names.get(thread_id, thread_id)
+                    self.stacks[f"{thread_name};{self._collapse(frame)}"] += 1
+
+    def enable(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._sample, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def disable(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def dump_stats(self, file_path: str):
+        with open(file_path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Profiler
+    --------
+    Profiles a running process on demand: each `toggle` (ex: on `signal`) starts a profiling session or stops it
+    and dumps its stats to a file of `output_dir`, while a session runs the spans are enabled too.
+
+    The 'cprofile' mode profiles every function call of the main thread and dumps `pstats` stats (`.prof`),
+    the 'sampling' mode samples all the threads with a low overhead and dumps collapsed stacks (`.folded`).
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "./output/profiles",
+        mode: str = "cprofile",
+        sample_interval: float = 0.005,
+        spans: bool = False,
+    ):
+        if mode not in PROFILING_MODES:
+            raise ValueError(
+                f"Profiling mode '{mode}' isn't supported, options: {', '.join(PROFILING_MODES)}"
+            )
+        self.output_dir = output_dir
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.spans = spans  # spans enabled outside of the sessions
+        self.session = None
+        enable_spans(spans)
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None
+
+    def start(self):
+        if self.running:
+            return
+        if self.mode == "cprofile":
+            self.session = cProfile.Profile()
+        else:
+            self.session = SamplingProfiler(self.sample_interval)
+        self.session.enable()
+        enable_spans()
+        logger.info(f"Profiling started ({self.mode})")
+
+    def stop(self) -> str:
+        """
+        Stop the profiling session and return the stats file path
+        """
+        if not self.running:
+            return None
+        session, self.session = self.session, None
+        session.disable()
+        enable_spans(self.spans)
+        os.makedirs(self.output_dir, exist_ok=True)
+        extension = "prof" if self.mode == "cprofile" else "folded"
+        file_path = os.path.join(
+            self.output_dir,
+            f"profile_{os.getpid()}_{time.strftime('%Y%m%d-%H%M%S')}.{extension}",
+        )
+        session.dump_stats(file_path)
+        logger.info(f"Profiling stopped, stats written to '{file_path}'")
+        if self.mode == "cprofile":
+            stats = io.StringIO()
+            pstats.Stats(session, stream=stats).sort_stats("cumulative").print_stats(20)
+            logger.info(f"Profile top functions:\n{stats.getvalue()}")
+        return file_path
+
+    def toggle(self, *_):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def install_signal(self, signal_name: str = "SIGUSR1"):
+        """
+        Toggle the profiling on the `signal_name` signal (ex: `kill -USR1 <pid>`), from the main thread
+        """
+        signal_number = getattr(signal, signal_name, None)
+        if signal_number is None:
+            logger.warning(
+                f"Signal '{signal_name}' isn't available, profiling can't be toggled"
+            )
+            return
+        signal.signal(signal_number, self.toggle)
+        logger.info(f"Send {signal_name} to process {os.getpid()} to toggle profiling")
+
+
+def create_profiler(profiling_config: dict):
+    """
+    Create the profiler from the `profiling` config, if it's set: install its `signal` toggle (default: 'SIGUSR1')
+    and start profiling right away with `enabled`
+    """
+    if not profiling_config:
+        return None
+    profiler = Profiler(
+        output_dir=profiling_config.get("output_dir", "./output/profiles"),
+        mode=profiling_config.get("mode", "cprofile"),
+        sample_interval=profiling_config.get("sample_interval", 0.005),
+        spans=profiling_config.get("spans", False),
+    )
+    profiler.install_signal(profiling_config.get("signal", "SIGUSR1"))
+    if profiling_config.get("enabled"):
+        profiler.start()
+    return profiler
@@ -1,35 +1,310 @@
+import asyncio
 import logging
+import threading
 import time
+import uuid
+from collections import deque
+
+from aitradingprototype.common.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# KEYS: one hash per budget, ARGV: for each budget its capacity, refill rate (per second) and cost.
+# Every budget is refilled, then the costs are only taken if all the budgets have enough tokens,
+# otherwise nothing is taken and the time to wait is returned.
+_TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'tokens', 'time')
+    local available = tonumber(state[1]) or capacity
+    local last_time = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - last_time) * rate)
+    tokens[i] = available
+    if available < cost then
+        wait = math.max(wait, (cost - available) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    redis.call('HSET', key, 'tokens', tokens[i] - tonumber(ARGV[i * 3]), 'time', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+# KEYS: one sorted set per budget, ARGV: the acquisition id then, for each budget, its limit, interval (seconds) and cost.
+# Each sorted set holds the '<id>:<cost>' acquisitions of the last interval, scored by time.
+_SLIDING_WINDOW_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 3 - 1])
+    local interval = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - interval)
+    local entries = redis.call('ZRANGE', key, 0, -1, 'WITHSCORES')
+    local used = 0
+    for j = 1, #entries, 2 do
+        used = used + tonumber(string.match(entries[j], ':(%d+)$'))
+    end
+    local j = 1
+    while used + cost > limit and j < #entries do
+        used = used - tonumber(string.match(entries[j], ':(%d+)$'))
+        wait = math.max(wait, tonumber(entries[j + 1]) + interval - now)
+        j = j + 2
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[i * 3])
+    redis.call('ZADD', key, now, ARGV[1] .. ':' .. ARGV[i * 3 + 1])
+    redis.call('PEXPIRE', key, math.ceil(interval * 1000) + 1000)
+end
+return '0'
+"""
+
+
+class TokenBucketPolicy:
+    """
+    Token Bucket Policy
+    -------------------
+    Each budget is a bucket of `limit` tokens refilled at `limit / interval` tokens per second.
+    A burst can't exceed `limit`, then the acquisitions are spread evenly over the interval.
+    """
+
+    def __init__(self, limits: list, interval: float):
+        self.limits = limits
+        self.rates = [limit / interval for limit in limits]
+        self.tokens = list(limits)
+        self.last_time = None
+
+    def reserve(self, costs: list) -> float:
+        """
+        Take the costs from all the buckets and return 0, or take nothing and return the seconds to wait
+        """
+        now = time.monotonic()
+        elapsed = now - self.last_time if self.last_time is not None else 0
+        self.last_time = now
+        wait = 0
+        for index, (limit, rate) in enumerate(zip(self.limits, self.rates)):
+            self.tokens[index] = min(limit, self.tokens[index] + elapsed * rate)
+            if self.tokens[index] < costs[index]:
+                wait = max(wait, (costs[index] - self.tokens[index]) / rate)
+        if wait == 0:
+            self.tokens = [tokens - cost for tokens, cost in zip(self.tokens, costs)]
+        return wait
+
+
+class SlidingWindowPolicy:
+    """
+    Sliding Window Policy
+    ---------------------
+    Each budget allows no more than `limit` in any `interval` seconds, even across the fixed windows edges,
+    by keeping the time and cost of the acquisitions of the last interval.
+    """
+
+    def __init__(self, limits: list, interval: float):
+        self.limits = limits
+        self.interval = interval
+        self.acquisitions = deque()  # (time, costs)
+        self.used = [0] * len(limits)
+
+    def reserve(self, costs: list) -> float:
+        """
+        Record the costs in all the windows and return 0, or record nothing and return the seconds to wait
+        """
+        now = time.monotonic()
+        while self.acquisitions and self.acquisitions[0][0] <= now - self.interval:
+            _, expired_costs = self.acquisitions.popleft()
+            self.used = [used - cost for used, cost in zip(self.used, expired_costs)]
+
+        wait = 0
+        for index, limit in enumerate(self.limits):
+            used = self.used[index]
+            for acquisition_time, acquisition_costs in self.acquisitions:
+                if used + costs[index] <= limit:
+                    break
+                used -= acquisition_costs[index]
+                wait = max(wait, acquisition_time + self.interval - now)
+        if wait == 0:
+            self.acquisitions.append((now, costs))
+            self.used = [used + cost for used, cost in zip(self.used, costs)]
+        return wait
+
+
+class RedisPolicy:
+    """
+    Redis Policy
+    ------------
+    Token bucket or sliding window policy with the state kept in Redis under `key`,
+    so that several processes share the same budgets. Each reservation is a single atomic Lua script,
+    timed with the Redis server clock.
+    """
+
+    def __init__(
+        self,
+        limits: list,
+        interval: float,
+        redis_client,
+        key: str,
+        policy: str = "token_bucket",
+    ):
+        self.limits = limits
+        self.interval = interval
+        self.policy = policy
+        self.keys = [f"{key}:{policy}:{index}" for index in range(len(limits))]
+        script = (
+            _TOKEN_BUCKET_SCRIPT if policy == "token_bucket" else _SLIDING_WINDOW_SCRIPT
+        )
+        self.script = redis_client.register_script(script)
+
+    def reserve(self, costs: list) -> float:
+        """
+        Reserve the costs in all the shared budgets and return 0, or reserve nothing and return the seconds to wait
+        """
+        if self.policy == "token_bucket":
+            args = []
+            for limit, cost in zip(self.limits, costs):
+                args += [limit, limit / self.interval, cost]
+        else:
+            args = [uuid.uuid4().hex]
+            for limit, cost in zip(self.limits, costs):
+                args += [limit, self.interval, cost]
+        return float(self.script(keys=self.keys, args=args))
+
 
 class RateLimiter:
     """
     Rate limiter class to control API call limits
+
+    Each acquisition costs one call, out of `max_calls` per `interval` seconds, and, when `max_tokens` is set,
+    `tokens` out of `max_tokens` per `interval` seconds. An acquisition waits until both budgets allow it.
+
+    The `policy` is 'token_bucket' (smooth refill, bursts up to the limit) or 'sliding_window'
+    (never more than the limit in any interval). With a `redis_client`, the budgets are shared
+    by all the processes using the same `key`.
+
+    The time spent waiting is measured, see `stats` and the `aitp_rate_limiter_wait_seconds` metric.
     """
 
-    def __init__(self, max_calls: int, interval: int):
+    def __init__(
+        self,
+        max_calls: int,
+        interval: int,
+        max_tokens: int = None,
+        policy: str = "token_bucket",
+        redis_client=None,
+        key: str = "rate_limiter",
+    ):
+        if policy not in ("token_bucket", "sliding_window"):
+            raise ValueError(
+                f"Rate limiter policy '{policy}' isn't supported, options: 'token_bucket', 'sliding_window'"
+            )
         self.max_calls = max_calls
         self.interval = interval  # seconds
+        self.max_tokens = max_tokens
+        limits = [max_calls] + ([max_tokens] if max_tokens else [])
+        if redis_client is not None:
+            self.policy = RedisPolicy(limits, interval, redis_client, key, policy)
+        elif policy == "token_bucket":
+            self.policy = TokenBucketPolicy(limits, interval)
+        else:
+            self.policy = SlidingWindowPolicy(limits, interval)
+        self._lock = threading.Lock()
         self.calls_made = 0
-        self.last_call_time = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        Reserve one call and the tokens, return the seconds to wait before trying again if they're not available
+        """
+        costs = [1]
+        if self.max_tokens:
+            if tokens > self.max_tokens:
+                raise ValueError(
+                    f"Can't acquire {tokens} tokens, the limit is {self.max_tokens} tokens per {self.interval} seconds"
+                )
+            costs.append(tokens)
+        with self._lock:
+            return self.policy.reserve(costs)
+
+    def _record(self, start: float, waited: bool):
+        """
+        Record an acquisition and the time it waited since `start`
+        """
+        wait_time = time.monotonic() - start
+        metrics.observe("aitp_rate_limiter_wait_seconds", wait_time)
+        with self._lock:
+            self.calls_made += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def acquire(self, tokens: int = 0):
+        """
+        Wait until one call and `tokens` are available, then consume them
+        """
+        start = time.monotonic()
+        sleep_time = self._reserve(tokens)
+        waited = sleep_time > 0
+        while sleep_time > 0:
+            logger.debug(f"Rate limit reached. Waiting {sleep_time} seconds.")
+            time.sleep(sleep_time)
+            sleep_time = self._reserve(tokens)
+        self._record(start, waited)
+
+    async def aacquire(self, tokens: int = 0):
+        """
+        Asynchronous version of `acquire`, it waits without blocking the event loop
+        """
+        start = time.monotonic()
+        sleep_time = self._reserve(tokens)
+        waited = sleep_time > 0
+        while sleep_time > 0:
+            logger.debug(f"Rate limit reached. Waiting {sleep_time} seconds.")
+            await asyncio.sleep(sleep_time)
+            sleep_time = self._reserve(tokens)
+        self._record(start, waited)
 
     def rate_limiter(self):
         """
         Rate limiter to prevent exceeding API call limits
         """
-        current_time = time.time()
+        self.acquire()
 
-        if self.calls_made == self.max_calls:
-            time_elapsed = current_time - self.last_call_time
-            if time_elapsed < self.interval:
-                sleep_time = (
-                    self.interval - time_elapsed
-                )  # wait time until UTC new minute
-                logger.debug(f"Rate limit reached. Waiting {sleep_time} seconds.")
-                time.sleep(sleep_time)
-                self.calls_made = 0
+    async def async_rate_limiter(self):
+        """
+        Rate limiter for coroutines, it waits without blocking the event loop
+        """
+        await self.aacquire()
 
-        self.calls_made += 1
-        self.last_call_time = time.time()
+    def stats(self) -> dict:
+        """
+        Return the acquisitions count and the time spent waiting for the limits
+        """
+        with self._lock:
+            return {
+                "calls": self.calls_made,
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+                "average_wait_time": (
+                    self.wait_time / self.calls_made if self.calls_made else 0.0
+                ),
+            }
@@ -1,19 +1,120 @@
-import json
+import functools
 import logging
+import time
 
 import redis
 
+from aitradingprototype.common.batch_publisher import BatchPublisher
+from aitradingprototype.common.event_codec import ENCODINGS, encode_event
+from aitradingprototype.common.metrics import metrics
+
 logger = logging.getLogger(__name__)
 
+# KEYS: the key holding a decimal value, ARGV: the quantity to add scaled to an integer, then the decimals.
+# The value is added as scaled integers, so the sum is exact (no IEEE 754 extra digits as with INCRBYFLOAT),
+# and it's written back as a decimal string.
+_ADD_DECIMAL_SCRIPT = """
+local scale = 10 ^ tonumber(ARGV[2])
+local units = math.floor(tonumber(redis.call('GET', KEYS[1]) or '0') * scale + 0.5) + tonumber(ARGV[1])
+local value = string.format('%.' .. ARGV[2] .. 'f', units / scale)
+redis.call('SET', KEYS[1], value)
+return value
+"""
+
 
 class RedisClient:
     """
     Class for Redis operations
+
+    The connections come from a pool of up to `max_connections`, checked with a PING when they've been idle
+    for `health_check_interval` seconds. With `batch_size` greater than 1, the events are published
+    by batches with a `BatchPublisher`, see `publish_event`.
+
+    With `transport` 'stream', the events are added to Redis Streams (one stream per channel) instead of being
+    published to pub/sub channels, and consumed by consumer groups, see `consume_stream`. A stream is capped to
+    about `stream_maxlen` entries, and when `stream_max_lag` is set, adding waits while a consumer group
+    has that many entries not read or not acknowledged yet (backpressure, so unread entries aren't trimmed).
+
+    The events are encoded with `event_encoding`: 'json', or the 'binary' / 'lean' formats (see `event_codec`).
+    The received events data are bytes, with any encoding, see `event_codec.decode_event`.
     """
 
-    def __init__(self, host, port, channel: str):
-        self.client = redis.Redis(host=host, port=port, decode_responses=True)
+    def __init__(
+        self,
+        host,
+        port,
+        channel: str,
+        max_connections: int = None,
+        health_check_interval: int = 0,
+        batch_size: int = 1,
+        batch_max_wait: float = 0.05,
+        transport: str = "pubsub",
+        stream_maxlen: int = 100000,
+        stream_max_lag: int = None,
+        event_encoding: str = "json",
+    ):
+        if transport not in ("pubsub", "stream"):
+            raise ValueError(
+                f"Redis transport '{transport}' isn't supported, options: 'pubsub', 'stream'"
+            )
+        self.pool = redis.ConnectionPool(
+            host=host,
+            port=port,
+            decode_responses=True,
+            max_connections=max_connections,
+            health_check_interval=health_check_interval,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        self._event_client = None
+        self._add_decimal_script = self.client.register_script(_ADD_DECIMAL_SCRIPT)
         self.channel = channel
+        self.transport = transport
+        self.stream_maxlen = stream_maxlen
+        self.stream_max_lag = stream_max_lag
+        if event_encoding not in ENCODINGS:
+            raise ValueError(
+                f"Event encoding '{event_encoding}' isn't supported, options: {', '.join(ENCODINGS)}"
+            )
+        self.event_encoding = event_encoding
+        self.publisher = None
+        if batch_size > 1:
+            self.publisher = BatchPublisher(
+                self,
+                batch_size=batch_size,
+                max_wait=batch_max_wait,
+                encode=self.encode_event,
+            )
+
+    @property
+    def event_client(self):
+        """
+        Client receiving the events, without decoding the responses (the binary events aren't UTF-8)
+        """
+        if self._event_client is None:
+            self._event_client = redis.Redis(
+                connection_pool=redis.ConnectionPool(
+                    **{
+                        **self.pool.connection_kwargs,
+                        "decode_responses": False,
+                    }
+                )
+            )
+        return self._event_client
+
+    def warm_up(self):
+        """
+        Open and check the commands and events connections, and load the Lua script on the server,
+        so that the first trade doesn't pay for them
+        """
+        self.client.ping()
+        self.event_client.ping()
+        self.client.script_load(_ADD_DECIMAL_SCRIPT)
+
+    def ping(self):
+        """
+        Ping the server on a pooled connection, so that it doesn't go idle
+        """
+        self.client.ping()
 
     def exists_key(self, key):
         """
@@ -25,9 +126,11 @@ class RedisClient:
         """
         Get value from Redis by key, if key does not exist yet, create and set it to 0
         """
-        if not self.exists_key(key):
+        value = self.client.get(key)
+        if value is None:
             self.set_key(key, 0)
-        return float(self.client.get(key))
+            return 0.0
+        return float(value)
 
     def set_key(self, key, value: float):
         """
@@ -36,24 +139,32 @@ class RedisClient:
         self.client.set(key, value)
         logger.debug(f"New Redis {key}: {value}")
 
-    def increment_key(self, key, quantity: float):
+    def add_to_key(self, key, quantity: float, decimals: int = 8) -> float:
         """
-        Increment key's value by quantity in Redis
+        Add quantity to key's value in Redis, atomically and in a single round trip (Lua script),
+        exactly to `decimals` decimals, and return the new value. A missing key counts as 0.
 
-        This increment option doesn't add extra digits due to IEEE 754 as ithappens (https://redis.io/commands/incrbyfloat).
+        This addition doesn't add extra digits due to IEEE 754 as it happens with INCRBYFLOAT (https://redis.io/commands/incrbyfloat).
         """
-        existing_quantity = self.get_float_key(key)
-        new_quantity = existing_quantity + quantity
+        value = self._add_decimal_script(
+            keys=[key],
+            args=[round(quantity * 10**decimals), decimals],
+            client=self.client,
+        )
+        logger.debug(f"New Redis {key}: {value}")
+        return float(value)
 
-        self.set_key(key, new_quantity)
+    def increment_key(self, key, quantity: float):
+        """
+        Increment key's value by quantity in Redis, see `add_to_key`
+        """
+        return self.add_to_key(key, quantity)
 
     def decrement_key(self, key, quantity: float):
         """
-        Decrement key's value by quantity in Redis"""
-        existing_quantity = self.get_float_key(key)
-        new_quantity = existing_quantity - quantity
-
-        self.set_key(key, new_quantity)
+        Decrement key's value by quantity in Redis, see `add_to_key`
+        """
+        return self.add_to_key(key, -quantity)
 
     def publish_event(
         self,
@@ -64,10 +175,15 @@ class RedisClient:
         published_time: int,
         headline: str,
         sentiment: str,
+        channel: str = None,
+        **optional_fields,
     ):
         """
         Push headline sentiment event by using redis.publish for publish-subscribe messaging in Redis.
         It publishes a message to a specific channel in a "fire-and-forget" manner and any subscribers to that channel will receive the message.
+        The event is published to `channel` if it's given, otherwise to the client's channel.
+        `optional_fields` (ex: `asset`, `duplicate_of`) are added to the event when they're not None.
+        With a batch publisher, the event is only buffered, see `buffered_events`.
         """
 
         event_data = {
@@ -79,15 +195,231 @@ class RedisClient:
             "headline": headline,
             "sentiment": sentiment,
         }
-        json_data = json.dumps(event_data)
-        logger.info(f"Push event '{json_data}'")
-        self.client.publish(self.channel, json_data)
+        event_data.update(
+            {key: value for key, value in optional_fields.items() if value is not None}
+        )
+        if self.publisher is not None:
+            self.publisher.publish(channel or self.channel, event_data)
+            return
+        message = self.encode_event(event_data)
+        logger.debug(f"Push event '{event_data}'")
+        self.publish_messages([(channel or self.channel, message)])
+
+    def encode_event(self, event_data: dict):
+        """
+        Encode the event with the client's `event_encoding`
+        """
+        return encode_event(event_data, self.event_encoding)
+
+    def _stream_backlog(self, stream: str) -> int:
+        """
+        Return the most entries a consumer group of the stream hasn't read or acknowledged yet
+        """
+        try:
+            groups = self.client.xinfo_groups(stream)
+        except redis.ResponseError:
+            return 0  # the stream doesn't exist yet
+        return max(
+            (group["pending"] + (group.get("lag") or 0) for group in groups), default=0
+        )
 
-    def listen_for_events(self, event_handler):
-        # Subscribe to events channel
-        pubsub = self.client.pubsub()
-        pubsub.subscribe(self.channel)
+    def _wait_for_consumers(self, streams: set):
+        """
+        Wait while a consumer group of the streams is `stream_max_lag` entries behind
+        """
+        for stream in streams:
+            logged = False
+            while self._stream_backlog(stream) >= self.stream_max_lag:
+                if not logged:
+                    logger.warning(
+                        f"Stream '{stream}' consumers are {self.stream_max_lag} entries behind, waiting"
+                    )
+                    logged = True
+                time.sleep(0.1)
+
+    def publish_messages(self, messages: list):
+        """
+        Publish the (channel, message) pairs with a pipeline, in a single round trip.
+        With the 'stream' transport, each message is added to the channel stream as its `data` field.
+        """
+        if self.transport == "stream" and self.stream_max_lag:
+            self._wait_for_consumers({channel for channel, _ in messages})
+        pipeline = self.client.pipeline(transaction=False)
+        for channel, message in messages:
+            if self.transport == "stream":
+                pipeline.xadd(
+                    channel,
+                    {"data": message},
+                    maxlen=self.stream_maxlen,
+                    approximate=True,
+                )
+            else:
+                pipeline.publish(channel, message)
+        with metrics.timer("aitp_redis_publish_seconds"):
+            pipeline.execute()
+        metrics.inc("aitp_events_published_total", len(messages))
+        logger.debug(f"Pushed {len(messages)} events")
+
+    def buffered_events(self) -> int:
+        """
+        Return the number of events buffered by the batch publisher and not published yet
+        """
+        return self.publisher.buffered if self.publisher is not None else 0
+
+    def flush_events(self):
+        """
+        Wait until the events buffered by the batch publisher are published
+        """
+        if self.publisher is not None:
+            self.publisher.flush()
+
+    def close(self):
+        """
+        Publish the buffered events and release the connections
+        """
+        if self.publisher is not None:
+            self.publisher.close()
+            logger.info(f"Batch publisher stats: {self.publisher.stats()}")
+        self.pool.disconnect()
+        if self._event_client is not None:
+            self._event_client.connection_pool.disconnect()
+
+    def listen_for_events(self, event_handler, channels: list = None):
+        # Subscribe to events channels, default: the client's channel, on a single connection
+        pubsub = self.event_client.pubsub()
+        pubsub.subscribe(*(channels or [self.channel]))
 
         # Listen for new events
         for event in pubsub.listen():
             event_handler(event)
+
+    def _create_group(self, stream: str, group: str, replay_from: str = None):
+        """
+        Create the consumer group, reading the entries added from now on, or from `replay_from` (entry ID,
+        '0' for the whole stream). An existing group keeps its position, unless `replay_from` is given.
+        """
+        try:
+            self.event_client.xgroup_create(
+                stream, group, id=replay_from or "$", mkstream=True
+            )
+            logger.info(f"Created consumer group '{group}' of stream '{stream}'")
+        except redis.ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+            if replay_from is not None:
+                self.event_client.xgroup_setid(stream, group, replay_from)
+        if replay_from is not None:
+            logger.info(
+                f"Consumer group '{group}' replays '{stream}' from {replay_from}"
+            )
+
+    def _handle_entries(
+        self,
+        stream: str,
+        group: str,
+        entries: list,
+        event_handler,
+        defer_ack: bool = False,
+    ):
+        """
+        Hand each entry to `event_handler` as a pub/sub message event, then acknowledge it.
+        An entry whose handling fails isn't acknowledged, so it's delivered again.
+        With `defer_ack`, the entry isn't acknowledged: the event carries its `ack` function, called by the handler
+        once the entry is processed.
+        """
+        if isinstance(stream, bytes):
+            stream = stream.decode()
+        for entry_id, fields in entries:
+            if fields is None:
+                continue  # deleted (trimmed) while pending
+            event = {
+                "type": "message",
+                "pattern": None,
+                "channel": stream,
+                "id": entry_id,
+                "data": fields[b"data"],
+            }
+            if defer_ack:
+                event["ack"] = functools.partial(
+                    self.event_client.xack, stream, group, entry_id
+                )
+            event_handler(event)
+            if not defer_ack:
+                self.event_client.xack(stream, group, entry_id)
+
+    def _reclaim_entries(
+        self,
+        stream: str,
+        group: str,
+        consumer: str,
+        count: int,
+        claim_idle_ms: int,
+        event_handler,
+        defer_ack: bool = False,
+    ):
+        """
+        Claim and handle the entries pending for more than `claim_idle_ms` in the other consumers of the group
+        """
+        start_id = "0-0"
+        while True:
+            start_id, entries = self.event_client.xautoclaim(
+                stream, group, consumer, claim_idle_ms, start_id, count
+            )[:2]
+            if entries:
+                logger.info(f"Reclaimed {len(entries)} pending entries of '{stream}'")
+            self._handle_entries(stream, group, entries, event_handler, defer_ack)
+            if start_id in ("0-0", b"0-0"):
+                return
+
+    def consume_stream(
+        self,
+        event_handler,
+        group: str,
+        consumer: str,
+        replay_from: str = None,
+        count: int = 100,
+        block_ms: int = 5000,
+        claim_idle_ms: int = 60000,
+        streams: list = None,
+        defer_ack: bool = False,
+    ):
+        """
+        Consume the `streams` (default: the client's channel stream) as `consumer` of the consumer group `group`,
+        with a single read of all of them: several consumers of a group share the entries, each entry is handled
+        by only one of them.
+        On start, the entries delivered to `consumer` but not acknowledged (ex: before a restart) are handled first.
+        Then, the entries pending for more than `claim_idle_ms` in other consumers (ex: a stopped one)
+        are reclaimed every `claim_idle_ms`, and new entries are read by up to `count`.
+        With `defer_ack`, the handler acknowledges the entries, see `_handle_entries`.
+        """
+        streams = streams or [self.channel]
+        for stream in streams:
+            self._create_group(stream, group, replay_from)
+        pending = self.event_client.xreadgroup(
+            group, consumer, {stream: "0" for stream in streams}
+        )
+        for stream, entries in pending:
+            self._handle_entries(stream, group, entries, event_handler, defer_ack)
+        last_claim_time = time.monotonic()
+        while True:
+            if time.monotonic() - last_claim_time >= claim_idle_ms / 1000:
+                for stream in streams:
+                    self._reclaim_entries(
+                        stream,
+                        group,
+                        consumer,
+                        count,
+                        claim_idle_ms,
+                        event_handler,
+                        defer_ack,
+                    )
+                last_claim_time = time.monotonic()
+            reply = self.event_client.xreadgroup(
+                group,
+                consumer,
+                {stream: ">" for stream in streams},
+                count=count,
+                block=block_ms,
+            )
+            for stream, entries in reply or []:
+                self._handle_entries(stream, group, entries, event_handler, defer_ack)
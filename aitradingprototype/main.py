@@ -2,6 +2,7 @@ import argparse
 import logging
 import sys
 
+from aitradingprototype.common.profiler import create_profiler
 from aitradingprototype.common.utils import config_logging, load_config
 from aitradingprototype.sg import SentimentGenerator
 from aitradingprototype.tb import TradingBot
@@ -24,6 +25,12 @@ def _cmd_args():
         action="store_true",
         help="starts the sentiment generator process",
     )
+    group.add_argument(
+        "-bf",
+        "--backfill",
+        action="store_true",
+        help="generates the sentiments of the whole headlines file with the sentiment generator config, then exits",
+    )
     group.add_argument(
         "-tb",
         "--trading_bot",
@@ -31,6 +38,19 @@ def _cmd_args():
         help="starts the trading bot process",
     )
 
+    # Where to start reading the input file, overrides the `read_from` config
+    read_from_group = parser.add_mutually_exclusive_group()
+    read_from_group.add_argument(
+        "--from-start",
+        action="store_true",
+        help="reads the input file from its start, ignoring the checkpoint",
+    )
+    read_from_group.add_argument(
+        "--from-end",
+        action="store_true",
+        help="reads only the new lines of the input file, ignoring the checkpoint",
+    )
+
     parser.add_argument(
         "config_file",
         type=str,
@@ -46,6 +66,7 @@ def main() -> None:
     :return: None
     """
     return_code = 1
+    profiler = None
     try:
         args = _cmd_args()
 
@@ -54,8 +75,18 @@ def main() -> None:
         logging_level = config_file["logging_level"] or logging.INFO
         config_logging(logging_level)
 
+        profiler = create_profiler(config_file.get("profiling"))
+
+        if args.from_start:
+            config_file["read_from"] = "start"
+        elif args.from_end:
+            config_file["read_from"] = "end"
+
         if args.sentiment_generator:
             SentimentGenerator(config_file).start()
+        elif args.backfill:
+            SentimentGenerator(config_file).backfill()
+            return_code = 0
         elif args.trading_bot:
             TradingBot(config_file).start()
     except KeyboardInterrupt:
@@ -64,6 +95,8 @@ def main() -> None:
     except Exception as e:
         logger.exception(e)
     finally:
+        if profiler is not None:
+            profiler.stop()  # dumps the running session stats
         sys.exit(return_code)
 
 
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _LineReader(threading.Thread):
+    """
+    Daemon thread that pulls lines from a blocking iterator (ex: `FileOperator.follow_line`) on request,
+    so that waiting for new lines doesn't block the event loop nor the process exit.
+    """
+
+    def __init__(self, lines, loop: asyncio.AbstractEventLoop):
+        super().__init__(daemon=True)
+        self._lines = iter(lines)
+        self._loop = loop
+        self._requests = queue.Queue()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, line=None, error: Exception = None):
+        """
+        Set the future's line or error, unless it was cancelled meanwhile (ex: a worker failed and the pipeline stopped)
+        """
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(line)
+
+    def run(self):
+        while True:
+            future = self._requests.get()
+            error = None
+            try:
+                line = next(self._lines, None)
+            except Exception as e:
+                line, error = None, e
+            try:
+                self._loop.call_soon_threadsafe(self._resolve, future, line, error)
+            except RuntimeError:
+                return  # the event loop is closed, nobody waits for the line anymore
+            if line is None:
+                return
+
+    def read(self) -> asyncio.Future:
+        """
+        Request the next line, the returned future resolves to `None` when there are no more lines.
+        """
+        future = self._loop.create_future()
+        self._requests.put(future)
+        return future
+
+
+class AsyncPipeline:
+    """
+    Async Pipeline
+    --------------
+    Runs the `worker` coroutine over every line with up to `max_in_flight` lines being processed at once,
+    and hands the results to `on_result` in the same order as the lines were read.
+
+    The window is bounded: a new line is only read once the oldest result has been handed over,
+    so the reader can't run ahead of `max_in_flight` lines.
+    """
+
+    def __init__(self, worker, on_result, max_in_flight: int):
+        self.worker = worker
+        self.on_result = on_result
+        self.max_in_flight = max_in_flight
+
+    async def _produce(self, reader: _LineReader, tasks: asyncio.Queue, slots):
+        while True:
+            await slots.acquire()
+            line = await reader.read()
+            if line is None:
+                await tasks.put(None)
+                return
+            await tasks.put(asyncio.ensure_future(self.worker(line)))
+
+    async def _consume(self, tasks: asyncio.Queue, slots):
+        while True:
+            task = await tasks.get()
+            if task is None:
+                return
+            result = await task
+            self.on_result(result)
+            slots.release()
+
+    async def run(self, lines):
+        """
+        Process all the `lines` and return once the last result has been handed over.
+        """
+        reader = _LineReader(lines, asyncio.get_running_loop())
+        reader.start()
+        tasks = asyncio.Queue()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        logger.debug(f"Start async pipeline with {self.max_in_flight} lines in flight")
+        await asyncio.gather(
+            self._produce(reader, tasks, slots), self._consume(tasks, slots)
+        )
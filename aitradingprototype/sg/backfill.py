@@ -0,0 +1,117 @@
+import logging
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def line_aligned_chunks(data, chunk_size: int) -> list:
+    """
+    Split `data` (bytes-like, ex: mmap) into (start, end) chunks of about `chunk_size` bytes,
+    each one ending right after a newline (or at the end of the data), so that no line is split.
+    """
+    chunks = []
+    start, size = 0, len(data)
+    while start < size:
+        newline = data.find(b"\n", min(start + chunk_size, size) - 1)
+        end = newline + 1 if newline >= 0 else size
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+class Backfill:
+    """
+    Backfill
+    --------
+    Generates the sentiments of a whole (historical) headlines file, then finishes.
+
+    The file is memory-mapped and split into line-aligned chunks of about `chunk_size` bytes.
+    The chunks are classified by a pool of `workers` threads, which share the OpenAI client, so its rate limiter
+    is the global budget of all the workers. Up to `2 * workers` chunks are in flight, and their results are handed
+    to `on_sentiment_result` in the file order. The progress and ETA are logged every `progress_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        sentiment_generator,
+        workers: int = 4,
+        chunk_size: int = 1 << 20,
+        progress_interval: float = 10,
+    ):
+        self.sg = sentiment_generator
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.bytes_done = 0
+        self.headlines_done = 0
+
+    @staticmethod
+    def _lines(data: bytes) -> list:
+        lines = (raw_line.decode().strip() for raw_line in data.split(b"\n"))
+        return [line for line in lines if line]
+
+    def _classify(self, items: list) -> list:
+        """
+        Classify the chunk items by batches, returns the (batch items, sentiments by event id) of each batch
+        """
+        batch_size = self.sg.config.get("batch_size", 1)
+        starts = range(0, len(items), batch_size)
+        ends = range(batch_size, len(items) + batch_size, batch_size)
+        return [
+            (items[start:end], self.sg._create_sentiments(items[start:end]))
+            for start, end in zip(starts, ends)
+        ]
+
+    def _log_progress(self, total_bytes: int, start_time: float):
+        elapsed = time.monotonic() - start_time
+        rate = self.headlines_done / elapsed if elapsed else 0.0
+        bytes_rate = self.bytes_done / elapsed if elapsed else 0.0
+        eta = (total_bytes - self.bytes_done) / bytes_rate if bytes_rate else 0.0
+        logger.info(
+            f"Backfill {100 * self.bytes_done / total_bytes:.1f}% ({self.bytes_done}/{total_bytes} bytes), "
+            f"{self.headlines_done} headlines, {rate:.1f} headlines/s, ETA {eta:.0f}s"
+        )
+
+    def _emit(self, chunk_end: int, batches: list, on_sentiment_result):
+        for items, sentiments_by_event_id in batches:
+            self.sg._emit(items, sentiments_by_event_id, on_sentiment_result)
+            self.headlines_done += len(items)
+        self.bytes_done = chunk_end
+
+    def run(self, file_name: str, on_sentiment_result):
+        """
+        Generate the sentiments of all the headlines of `file_name`, see `SentimentGenerator.generate_sentiments`
+        for `on_sentiment_result`. Returns the number of headlines.
+        """
+        total_bytes = os.path.getsize(file_name)
+        if not total_bytes:
+            return 0
+        start_time = last_progress_time = time.monotonic()
+        with open(file_name, "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data, ThreadPoolExecutor(self.workers) as executor:
+            in_flight = deque()
+            for start, end in line_aligned_chunks(data, self.chunk_size):
+                # headlines are parsed (and checked for near-duplicates) in the file order,
+                # their (historical) read stage is kept apart from the live one
+                items = list(
+                    self.sg._headline_items(
+                        self._lines(data[start:end]), read_stage="backfill_read"
+                    )
+                )
+                in_flight.append((end, executor.submit(self._classify, items)))
+                if len(in_flight) >= 2 * self.workers:
+                    chunk_end, future = in_flight.popleft()
+                    self._emit(chunk_end, future.result(), on_sentiment_result)
+                if time.monotonic() - last_progress_time >= self.progress_interval:
+                    self._log_progress(total_bytes, start_time)
+                    last_progress_time = time.monotonic()
+            while in_flight:
+                chunk_end, future = in_flight.popleft()
+                self._emit(chunk_end, future.result(), on_sentiment_result)
+        self._log_progress(total_bytes, start_time)
+        return self.headlines_done
@@ -0,0 +1,2 @@
+from aitradingprototype.sg.classifier.classifier import SentimentClassifier
+from aitradingprototype.sg.classifier.lexicon_classifier import LexiconClassifier
@@ -0,0 +1,17 @@
+from abc import ABC, abstractmethod
+
+
+class SentimentClassifier(ABC):
+    """
+    Sentiment Classifier
+    --------------------
+    Base class to define a local sentiment classifier, which answers without calling OpenAI.
+    """
+
+    @abstractmethod
+    def classify(self, headline: str, asset: str) -> tuple:
+        """
+        Returns the (sentiment, confidence) of 'headline' about 'asset', with confidence from 0 to 1.
+        The sentiment is `None` when the classifier can't tell, ex: for an asset it doesn't know.
+        """
+        pass
@@ -0,0 +1,112 @@
+import logging
+import math
+import re
+from collections import Counter
+
+from aitradingprototype.common.enums import Sentiment
+from aitradingprototype.common.line_parser import parse_file
+from aitradingprototype.sg.classifier import SentimentClassifier
+
+logger = logging.getLogger(__name__)
+
+
+class LexiconClassifier(SentimentClassifier):
+    """
+    Lexicon Classifier
+    ------------------
+    CPU-only sentiment classifier, trained from labelled sentiment files (the Sentiment Generator output format).
+
+    For each asset, it learns a lexicon of word weights per sentiment (multinomial naive Bayes, i.e. a linear model
+    over the headline word counts). The confidence is the probability of the most likely sentiment,
+    so headlines with few or unknown words get a low confidence.
+    """
+
+    def __init__(self, smoothing: float = 1.0):
+        self.smoothing = smoothing
+        # asset -> {"priors": {sentiment: log p}, "weights": {word: {sentiment: log p}}, "unseen": {sentiment: log p}}
+        self.models = {}
+
+    @staticmethod
+    def _words(headline: str) -> list:
+        """
+        Return the words of the normalized headline (lowercases, without punctuation)
+        """
+        return re.findall(r"[a-z0-9]+", headline.lower())
+
+    def train(self, asset: str, labelled_headlines: list):
+        """
+        Train the asset model from (headline, sentiment) pairs
+        """
+        sentiments = [sentiment.value for sentiment in Sentiment]
+        headline_counts = Counter()
+        word_counts = {sentiment: Counter() for sentiment in sentiments}
+        for headline, sentiment in labelled_headlines:
+            if sentiment not in word_counts:
+                continue
+            headline_counts[sentiment] += 1
+            word_counts[sentiment].update(self._words(headline))
+
+        total_headlines = sum(headline_counts.values())
+        if not total_headlines:
+            logger.warning(f"No labelled headlines to train the '{asset}' model")
+            return
+
+        vocabulary = set().union(*word_counts.values())
+        priors, unseen, weights = {}, {}, {}
+        for sentiment in sentiments:
+            priors[sentiment] = math.log(
+                (headline_counts[sentiment] + self.smoothing)
+                / (total_headlines + self.smoothing * len(sentiments))
+            )
+            total_words = sum(word_counts[sentiment].values())
+            denominator = total_words + self.smoothing * len(vocabulary)
+            unseen[sentiment] = math.log(self.smoothing / denominator)
+            for word, count in word_counts[sentiment].items():
+                weights.setdefault(word, {})[sentiment] = math.log(
+                    (count + self.smoothing) / denominator
+                )
+
+        self.models[asset.lower()] = {
+            "priors": priors,
+            "weights": weights,
+            "unseen": unseen,
+        }
+        logger.info(
+            f"Trained '{asset}' lexicon model with {total_headlines} headlines and {len(vocabulary)} words"
+        )
+
+    def train_from_files(self, asset: str, file_paths: list):
+        """
+        Train the asset model from sentiment files, line format:
+        "headline collected source","headline collected timestamp (ms)","headline published timestamp (ms)","headline","sentiment"
+        """
+        labelled_headlines = [
+            (record.headline, record.sentiment)
+            for file_path in file_paths
+            for record in parse_file(file_path)
+        ]
+        self.train(asset, labelled_headlines)
+
+    def classify(self, headline: str, asset: str) -> tuple:
+        """
+        Returns the most likely (sentiment, probability) of 'headline' about 'asset',
+        (None, 0.0) if there's no model for the asset.
+        """
+        model = self.models.get(asset.lower())
+        if model is None:
+            return None, 0.0
+
+        scores = dict(model["priors"])
+        for word in self._words(headline):
+            word_weights = model["weights"].get(word)
+            if word_weights is None:
+                continue  # unknown words don't tell anything
+            for sentiment in scores:
+                scores[sentiment] += word_weights.get(
+                    sentiment, model["unseen"][sentiment]
+                )
+
+        best_score = max(scores.values())
+        total = sum(math.exp(score - best_score) for score in scores.values())
+        sentiment = max(scores, key=scores.get)
+        return sentiment, 1 / total
@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import random
+import re
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class HeadlineDeduplicator:
+    """
+    Headline Deduplicator
+    ---------------------
+    Detects near-duplicate headlines, i.e. the same story from several sources with slightly different wording.
+
+    Each headline is fingerprinted with a MinHash signature over its word shingles, and two headlines are near-duplicates
+    when the estimated Jaccard similarity of their shingles is at least `similarity`.
+    The signatures are indexed with locality-sensitive hashing bands, so that a headline is only compared with the
+    likely similar ones instead of all the headlines in the window.
+
+    Only the headlines of the last `window` seconds are kept, and no more than `max_entries`, to bound the memory usage.
+    """
+
+    def __init__(
+        self,
+        window: float = 600,
+        similarity: float = 0.7,
+        max_entries: int = 10000,
+        shingle_size: int = 1,
+        num_hashes: int = 64,
+        bands: int = 16,
+    ):
+        self.window = window
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = num_hashes // bands
+        rng = random.Random(0)  # same permutations on every run
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(self.rows * bands)
+        ]
+        self._entries = deque()
+        self._entries_by_event_id = {}
+        self._band_index = defaultdict(set)
+        self._latest_time = 0
+
+    def _shingles(self, headline: str) -> set:
+        """
+        Return the word shingles of the normalized headline (lowercases, without punctuation)
+        """
+        words = re.findall(r"[a-z0-9]+", headline.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        return {
+            " ".join(words[start:end])
+            for start, end in zip(range(len(words)), range(size, len(words) + 1))
+        }
+
+    def signature(self, headline: str) -> tuple:
+        """
+        Return the MinHash signature of the headline
+        """
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+            for s in self._shingles(headline)
+        ] or [0]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._permutations
+        )
+
+    def _band_keys(self, signature: tuple) -> list:
+        """
+        Return the LSH keys of the signature, one per band of `rows` hashes
+        """
+        starts = range(0, self.rows * self.bands, self.rows)
+        ends = range(self.rows, self.rows * (self.bands + 1), self.rows)
+        return [
+            (band, signature[start:end])
+            for band, (start, end) in enumerate(zip(starts, ends))
+        ]
+
+    def _expire(self):
+        """
+        Forget the headlines older than `window` seconds and the oldest ones above `max_entries`
+        """
+        while self._entries and (
+            self._entries[0]["time"] < self._latest_time - self.window
+            or len(self._entries) > self.max_entries
+        ):
+            entry = self._entries.popleft()
+            del self._entries_by_event_id[entry["event_id"]]
+            for key in self._band_keys(entry["signature"]):
+                self._band_index[key].discard(entry["event_id"])
+                if not self._band_index[key]:
+                    del self._band_index[key]
+
+    def _most_similar(self, signature: tuple):
+        """
+        Return the event id of the most similar headline in the window, if it's similar enough
+        """
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._band_index.get(key, ()))
+
+        best_event_id, best_similarity = None, self.similarity
+        for event_id in candidates:
+            other = self._entries_by_event_id[event_id]["signature"]
+            similarity = sum(a == b for a, b in zip(signature, other)) / len(signature)
+            if similarity >= best_similarity:
+                best_event_id, best_similarity = event_id, similarity
+        return best_event_id
+
+    def find_duplicate(self, headline: str, event_id: str, timestamp: float):
+        """
+        Return the event id of the original headline if `headline` is a near-duplicate of a headline in the window,
+        otherwise register `headline` as an original with `event_id` and return `None`.
+        `timestamp` is the headline time in seconds.
+        """
+        self._latest_time = max(self._latest_time, timestamp)
+        self._expire()
+
+        signature = self.signature(headline)
+        original_event_id = self._most_similar(signature)
+        if original_event_id is not None:
+            return original_event_id
+
+        entry = {
+            "event_id": event_id,
+            "time": timestamp,
+            "signature": signature,
+            "sentiments": None,
+        }
+        self._entries.append(entry)
+        self._entries_by_event_id[event_id] = entry
+        for key in self._band_keys(signature):
+            self._band_index[key].add(event_id)
+        self._expire()
+        return None
+
+    def set_sentiments(self, event_id: str, sentiments: dict):
+        """
+        Keep the sentiment of each asset for an original headline, to be reused by its near-duplicates
+        """
+        entry = self._entries_by_event_id.get(event_id)
+        if entry is not None:
+            entry["sentiments"] = sentiments
+
+    def get_sentiments(self, event_id: str):
+        """
+        Return the sentiment of each asset of an original headline, `None` if it's unknown or no longer in the window
+        """
+        entry = self._entries_by_event_id.get(event_id)
+        return entry["sentiments"] if entry is not None else None
@@ -0,0 +1,71 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_END_OF_LINES = object()
+
+
+class LineBatcher:
+    """
+    Line Batcher
+    ------------
+    Groups the lines of a blocking iterator (ex: `FileOperator.follow_line`) into batches.
+    A batch is emitted once it has `batch_size` lines, or `max_wait` seconds after its first line was read,
+    whichever comes first, so that a slow trickle of headlines isn't held back waiting for a full batch.
+    """
+
+    def __init__(self, batch_size: int, max_wait: float):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+    def _read_lines(self, lines, buffer: queue.Queue):
+        """
+        Move lines into `buffer`, blocking while it's full.
+        A reading error is passed through `buffer` to be raised by `batches`.
+        """
+        try:
+            for line in lines:
+                buffer.put(line)
+        except Exception as e:
+            buffer.put(e)
+        else:
+            buffer.put(_END_OF_LINES)
+
+    def _get(self, buffer: queue.Queue, timeout=None):
+        """
+        Get the next line from `buffer`, raise the reading error if there was one
+        """
+        line = buffer.get(timeout=timeout)
+        if isinstance(line, Exception):
+            raise line
+        return line
+
+    def batches(self, lines):
+        """
+        Yield lists of up to `batch_size` lines, in the lines order
+        """
+        buffer = queue.Queue(maxsize=self.batch_size)
+        threading.Thread(
+            target=self._read_lines, args=(lines, buffer), daemon=True
+        ).start()
+
+        while True:
+            line = self._get(buffer)
+            if line is _END_OF_LINES:
+                return
+            batch = [line]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    line = self._get(buffer, max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if line is _END_OF_LINES:
+                    yield batch
+                    return
+                batch.append(line)
+            logger.debug(f"Batch of {len(batch)} lines")
+            yield batch
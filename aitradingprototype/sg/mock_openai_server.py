@@ -0,0 +1,245 @@
+"""
+Local stand-in for OpenAI's chat completions endpoint, to test and benchmark without API costs.
+
+> python -m aitradingprototype.sg.mock_openai_server --port 8080 --latency 0.2 --distribution lognormal
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aitradingprototype.common.enums import Sentiment
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+_LABELS = [
+    Sentiment.BULLISH.value,
+    Sentiment.BEARISH.value,
+    Sentiment.UNKNOWN.value,
+]
+
+
+def label_for(headline: str, asset: str) -> str:
+    """
+    Deterministic sentiment of the headline about the asset, the one the mock server replies
+    """
+    digest = hashlib.sha256(f"{headline}\n{asset}".encode()).digest()
+    return _LABELS[digest[0] % len(_LABELS)]
+
+
+class MockOpenAiServer(ThreadingHTTPServer):
+    """
+    Mock OpenAI Server
+    ------------------
+    Replies to the chat completion requests of `OpenAiClient` with the deterministic `label_for` sentiments,
+    after a latency drawn from `distribution` ('fixed', 'uniform', 'normal', 'lognormal' or 'exponential')
+    with a `latency` mean (seconds) and a `jitter` (standard deviation, or half range for 'uniform').
+
+    A share of the requests fail: `rate_limit_rate` with a 429 reply (with a `retry_after` seconds header)
+    and `error_rate` with a 500 reply. The random draws are seeded with `seed`, see `stats` for the counts.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        latency: float = 0.2,
+        distribution: str = "fixed",
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.0,
+        seed: int = 0,
+    ):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Latency distribution '{distribution}' isn't supported, options: {', '.join(LATENCY_DISTRIBUTIONS)}"
+            )
+        super().__init__(address, MockOpenAiHandler)
+        self.latency = latency
+        self.distribution = distribution
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def _sample_latency(self) -> float:
+        if self.distribution == "uniform":
+            return self._random.uniform(
+                self.latency - self.jitter, self.latency + self.jitter
+            )
+        if self.distribution == "normal":
+            return self._random.gauss(self.latency, self.jitter)
+        if self.distribution == "lognormal" and self.latency > 0:
+            # the lognormal distribution has a `latency` mean and a `jitter` standard deviation
+            sigma2 = math.log(1 + (self.jitter / self.latency) ** 2)
+            return self._random.lognormvariate(
+                math.log(self.latency) - sigma2 / 2, sigma2**0.5
+            )
+        if self.distribution == "exponential" and self.latency > 0:
+            return self._random.expovariate(1 / self.latency)
+        return self.latency
+
+    def draw(self):
+        """
+        Draw the latency and the outcome of a request: 'ok', 'rate_limited' or 'error'
+        """
+        with self._lock:
+            self.requests += 1
+            latency = max(0.0, self._sample_latency())
+            draw = self._random.random()
+            if draw < self.rate_limit_rate:
+                self.rate_limited += 1
+                return latency, "rate_limited"
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return latency, "error"
+            return latency, "ok"
+
+    def stats(self) -> dict:
+        """
+        Return the requests count and how many of them got an injected error or 429 reply
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+            }
+
+
+class MockOpenAiHandler(BaseHTTPRequestHandler):
+    """
+    Replies to a single headline request with its sentiment, to a batch request (numbered headlines) with
+    one '<number>: <sentiment>' line per headline, and to a multi asset request with one
+    '<number> <asset>: <sentiment>' line per headline and asset.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    @staticmethod
+    def _reply_content(request: dict) -> str:
+        user_content = request["messages"][-1]["content"]
+        first_line, _, numbered_headlines = user_content.partition("\n")
+        assets = re.findall(r'"([^"]+)"', first_line)
+        headlines = re.findall(r"^(\d+)\. (.*)$", numbered_headlines, re.MULTILINE)
+        if not headlines:
+            match = re.match(
+                r'For this "(.*)", generate sentiment about "(.*)"$',
+                user_content,
+                re.DOTALL,
+            )
+            return label_for(match[1], match[2])
+        if "about each of" in first_line:
+            return "\n".join(
+                f"{number} {asset}: {label_for(headline, asset)}"
+                for number, headline in headlines
+                for asset in assets
+            )
+        return "\n".join(
+            f"{number}: {label_for(headline, assets[0])}"
+            for number, headline in headlines
+        )
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        latency, outcome = self.server.draw()
+        time.sleep(latency)
+        if outcome == "rate_limited":
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                {"Retry-After": str(self.server.retry_after)},
+            )
+            return
+        if outcome == "error":
+            self._send_json(
+                500, {"error": {"message": "Mock server error", "type": "server_error"}}
+            )
+            return
+        self._send_json(
+            200,
+            {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": self._reply_content(request),
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+            },
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 0, latency: float = 0.2, **kwargs) -> MockOpenAiServer:
+    """
+    Start the mock server in a daemon thread and return it, `server.server_port` has the bound port.
+    `kwargs` are the other `MockOpenAiServer` settings.
+    """
+    server = MockOpenAiServer(("127.0.0.1", port), latency=latency, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions API")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds")
+    parser.add_argument(
+        "--distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = MockOpenAiServer(
+        ("127.0.0.1", args.port),
+        latency=args.latency,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f"Mock OpenAI API on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
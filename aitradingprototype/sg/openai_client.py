@@ -1,27 +1,116 @@
+import asyncio
 import logging
+import re
+import time
+from contextlib import asynccontextmanager
 
+import aiohttp
 import openai
 
 from aitradingprototype.common import RateLimiter
 from aitradingprototype.common.enums import Sentiment
+from aitradingprototype.common.metrics import metrics
+from aitradingprototype.sg.sentiment_cache import SentimentCache
 
 logger = logging.getLogger(__name__)
 
+SENTIMENT_VALUES = {sentiment.value for sentiment in Sentiment}
+
+# Transient errors, the request is sent again
+_RETRIED_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain,
+)
+
+# Part of the sentiment cache key, increment it when the prompts change so that cached sentiments aren't reused
+PROMPT_VERSION = 1
+
 
 class OpenAiClient:
     """
     OpenAI Client
     -------------
     This class interacts with OpenAI API to generate market sentiment based on the given headline.
+
+    Several headlines can be classified in a single request with `request_sentiments`,
+    the headlines with a malformed label in the reply are asked again up to `batch_retries` times,
+    then they get the `unknown` sentiment.
+
+    With a `cache`, the sentiments are looked up before requesting them, and a cache hit doesn't consume the rate limit.
+
+    The requests are limited by `rate_limiter` (default: `num_requests` per minute), each request also acquires
+    its estimated tokens, for the limiters with a tokens budget.
+
+    A request failing with a transient error (429, 5xx, connection error or timeout) is sent again up to
+    `api_retries` times, after its `Retry-After` header or an exponential backoff from `api_retry_wait` seconds.
     """
 
     def __init__(
-        self, api_key: str, num_requests: int = 3, openai_model: str = "gpt-3.5-turbo"
+        self,
+        api_key: str,
+        num_requests: int = 3,
+        openai_model: str = "gpt-3.5-turbo",
+        api_base: str = "",
+        batch_retries: int = 2,
+        cache: SentimentCache = None,
+        rate_limiter: RateLimiter = None,
+        api_retries: int = 3,
+        api_retry_wait: float = 1.0,
     ):
         openai.api_key = api_key
+        if api_base:
+            openai.api_base = api_base
 
-        self.min_rate_limiter = RateLimiter(num_requests, 60)
+        self.min_rate_limiter = rate_limiter or RateLimiter(num_requests, 60)
         self.openai_model = openai_model
+        self.batch_retries = batch_retries
+        self.cache = cache
+        self.api_retries = api_retries
+        self.api_retry_wait = api_retry_wait
+        self.api_errors = 0
+
+    def _retry_wait(self, error, attempt: int) -> float:
+        """
+        Return the seconds to wait before sending the failed request again, or raise the error after the last attempt
+        """
+        self.api_errors += 1
+        if attempt == self.api_retries:
+            raise error
+        retry_after = (getattr(error, "headers", None) or {}).get("Retry-After")
+        try:
+            wait = float(retry_after)
+        except (TypeError, ValueError):
+            wait = self.api_retry_wait * 2**attempt
+        logger.warning(
+            f"OpenAI request failed ({error.__class__.__name__}: {error}), retrying in {wait} seconds"
+        )
+        return wait
+
+    def _create(self, request: dict):
+        """
+        Send the ChatCompletion request, again after a transient error
+        """
+        for attempt in range(self.api_retries + 1):
+            try:
+                with metrics.timer("aitp_openai_request_seconds"):
+                    return openai.ChatCompletion.create(**request)
+            except _RETRIED_ERRORS as error:
+                time.sleep(self._retry_wait(error, attempt))
+
+    async def _acreate(self, request: dict):
+        """
+        Asynchronous version of `_create`
+        """
+        for attempt in range(self.api_retries + 1):
+            try:
+                with metrics.timer("aitp_openai_request_seconds"):
+                    return await openai.ChatCompletion.acreate(**request)
+            except _RETRIED_ERRORS as error:
+                await asyncio.sleep(self._retry_wait(error, attempt))
 
     def _optimize_accuracy(self, result):
         """
@@ -29,16 +118,10 @@ class OpenAiClient:
         """
         return result.replace(".", "").lower()
 
-    def detect_sentiment(self, headline: str, asset: str):
+    def _build_request(self, headline: str, asset: str) -> dict:
         """
-        Given 'headline', this method uses OpenAI's API to generate one word market sentiment about 'asset' cryptocurrency.
-        Returns sentiment as string.
-
-        OpenAI API endpoint: https://platform.openai.com/docs/api-reference/chat-completions/create
-        Endpoint parameters are set with default values to improve the result accuracy.
-        For more information about the parameters, please refer to https://platform.openai.com/docs/api-reference/chat/create
+        Build the ChatCompletion parameters to generate one word market sentiment about 'asset' for 'headline'.
         """
-
         system_content = (
             f"You are a contextual sentiment indicator that replies:"
             f"\n- only one word ('{Sentiment.BULLISH.value}', '{Sentiment.BEARISH.value}', or '{Sentiment.UNKNOWN.value}')"
@@ -50,19 +133,413 @@ class OpenAiClient:
         user_content = f'For this "{headline}", generate sentiment about "{asset}"'
         user_role_msg = {"role": "user", "content": user_content}
 
-        response = openai.ChatCompletion.create(
-            messages=[system_role_msg, user_role_msg],
-            model=self.openai_model,
-            temperature=0,  # no randomness
-            max_tokens=2,  # sentiment word has max 2 tokens
-            n=1,  # number of chat completion choices
-        )
+        return {
+            "messages": [system_role_msg, user_role_msg],
+            "model": self.openai_model,
+            "temperature": 0,  # no randomness
+            "max_tokens": 2,  # sentiment word has max 2 tokens
+            "n": 1,  # number of chat completion choices
+        }
+
+    def _parse_response(self, response) -> str:
+        """
+        Extract the sentiment from the ChatCompletion response
+        """
         logger.debug(f"OpenAI response: {response}")
         return self._optimize_accuracy(response["choices"][0]["message"]["content"])
 
+    def _build_batch_request(self, headlines: list, asset: str) -> dict:
+        """
+        Build the ChatCompletion parameters to generate one word market sentiment about 'asset' for each headline.
+        The headlines are numbered from 1 and the reply is expected to be one '<number>: <sentiment>' line per headline.
+        """
+        system_content = (
+            f"You are a contextual sentiment indicator that replies, for each numbered headline, one line:"
+            f"\n- '<headline number>: <sentiment>'"
+            f"\n- sentiment is only one word ('{Sentiment.BULLISH.value}', '{Sentiment.BEARISH.value}', or '{Sentiment.UNKNOWN.value}')"
+            f"\n- without punctuation"
+            f"\n- in lowercases"
+        )
+        system_role_msg = {"role": "system", "content": system_content}
+
+        numbered_headlines = "\n".join(
+            f"{number}. {headline}" for number, headline in enumerate(headlines, 1)
+        )
+        user_content = (
+            f'For each of these headlines, generate sentiment about "{asset}":'
+            f"\n{numbered_headlines}"
+        )
+        user_role_msg = {"role": "user", "content": user_content}
+
+        return {
+            "messages": [system_role_msg, user_role_msg],
+            "model": self.openai_model,
+            "temperature": 0,  # no randomness
+            "max_tokens": 6
+            * len(headlines),  # '<number>: <sentiment>' line has max 6 tokens
+            "n": 1,  # number of chat completion choices
+        }
+
+    def _parse_batch_response(self, response, count: int) -> list:
+        """
+        Extract the sentiments from the batch ChatCompletion response, in the headlines order.
+        A headline gets `None` when its line is missing, malformed, has an invalid sentiment or conflicts with another line.
+        """
+        logger.debug(f"OpenAI response: {response}")
+        content = response["choices"][0]["message"]["content"]
+        sentiments = [None] * count
+        conflicts = set()
+        for row in content.splitlines():
+            match = re.fullmatch(r"\s*(\d+)\s*[:.)]\s*([A-Za-z]+)\.?\s*", row)
+            if not match:
+                continue
+            index, sentiment = int(match[1]) - 1, match[2].lower()
+            if not 0 <= index < count or sentiment not in SENTIMENT_VALUES:
+                continue
+            if sentiments[index] not in (None, sentiment):
+                conflicts.add(index)
+            sentiments[index] = sentiment
+        for index in conflicts:
+            sentiments[index] = None
+        return sentiments
+
+    def _build_multi_asset_request(self, headlines: list, assets: list) -> dict:
+        """
+        Build the ChatCompletion parameters to generate one word market sentiment about each of the 'assets' for each headline.
+        The headlines are numbered from 1 and the reply is expected to be one '<number> <asset>: <sentiment>' line per headline and asset.
+        """
+        system_content = (
+            f"You are a contextual sentiment indicator that replies, for each numbered headline and each asset, one line:"
+            f"\n- '<headline number> <asset>: <sentiment>'"
+            f"\n- sentiment is only one word ('{Sentiment.BULLISH.value}', '{Sentiment.BEARISH.value}', or '{Sentiment.UNKNOWN.value}')"
+            f"\n- without punctuation"
+            f"\n- in lowercases"
+        )
+        system_role_msg = {"role": "system", "content": system_content}
+
+        numbered_headlines = "\n".join(
+            f"{number}. {headline}" for number, headline in enumerate(headlines, 1)
+        )
+        quoted_assets = ", ".join(f'"{asset}"' for asset in assets)
+        user_content = (
+            f"For each of these headlines, generate sentiment about each of {quoted_assets}:"
+            f"\n{numbered_headlines}"
+        )
+        user_role_msg = {"role": "user", "content": user_content}
+
+        return {
+            "messages": [system_role_msg, user_role_msg],
+            "model": self.openai_model,
+            "temperature": 0,  # no randomness
+            # '<number> <asset>: <sentiment>' line has max 8 tokens
+            "max_tokens": 8 * len(headlines) * len(assets),
+            "n": 1,  # number of chat completion choices
+        }
+
+    def _parse_multi_asset_response(self, response, count: int, assets: list) -> list:
+        """
+        Extract the sentiment of each asset (dict) from the multi asset ChatCompletion response, in the headlines order.
+        An asset gets `None` when its line is missing, malformed, has an invalid sentiment or conflicts with another line.
+        """
+        logger.debug(f"OpenAI response: {response}")
+        content = response["choices"][0]["message"]["content"]
+        asset_by_name = {asset.lower(): asset for asset in assets}
+        sentiments = [dict.fromkeys(assets) for _ in range(count)]
+        conflicts = set()
+        for row in content.splitlines():
+            match = re.fullmatch(
+                r"\s*(\d+)\.?\s+\"?([A-Za-z0-9]+)\"?\s*:\s*([A-Za-z]+)\.?\s*", row
+            )
+            if not match:
+                continue
+            index, asset = int(match[1]) - 1, asset_by_name.get(match[2].lower())
+            sentiment = match[3].lower()
+            if not 0 <= index < count or asset is None:
+                continue
+            if sentiment not in SENTIMENT_VALUES:
+                continue
+            if sentiments[index][asset] not in (None, sentiment):
+                conflicts.add((index, asset))
+            sentiments[index][asset] = sentiment
+        for index, asset in conflicts:
+            sentiments[index][asset] = None
+        return sentiments
+
+    def detect_sentiment(self, headline: str, asset: str):
+        """
+        Given 'headline', this method uses OpenAI's API to generate one word market sentiment about 'asset' cryptocurrency.
+        Returns sentiment as string.
+
+        OpenAI API endpoint: https://platform.openai.com/docs/api-reference/chat-completions/create
+        Endpoint parameters are set with default values to improve the result accuracy.
+        For more information about the parameters, please refer to https://platform.openai.com/docs/api-reference/chat/create
+        """
+        response = self._create(self._build_request(headline, asset))
+        return self._parse_response(response)
+
+    async def adetect_sentiment(self, headline: str, asset: str):
+        """
+        Asynchronous version of `detect_sentiment`, so that several requests can be in flight at once.
+        """
+        response = await self._acreate(self._build_request(headline, asset))
+        return self._parse_response(response)
+
+    def detect_sentiments(self, headlines: list, asset: str) -> list:
+        """
+        Given 'headlines', this method uses a single OpenAI's API request to generate one word market sentiment about 'asset' for each headline.
+        Returns the sentiments in the headlines order, `None` for the headlines without a valid sentiment in the reply.
+        """
+        response = self._create(self._build_batch_request(headlines, asset))
+        return self._parse_batch_response(response, len(headlines))
+
+    async def adetect_sentiments(self, headlines: list, asset: str) -> list:
+        """
+        Asynchronous version of `detect_sentiments`
+        """
+        response = await self._acreate(self._build_batch_request(headlines, asset))
+        return self._parse_batch_response(response, len(headlines))
+
+    def detect_asset_sentiments(self, headlines: list, assets: list) -> list:
+        """
+        Given 'headlines', this method uses a single OpenAI's API request to generate one word market sentiment about each of the 'assets' for each headline.
+        Returns the sentiment of each asset (dict) in the headlines order, `None` for the assets without a valid sentiment in the reply.
+        """
+        if len(assets) == 1:
+            sentiments = self.detect_sentiments(headlines, assets[0])
+            return [{assets[0]: sentiment} for sentiment in sentiments]
+        response = self._create(self._build_multi_asset_request(headlines, assets))
+        return self._parse_multi_asset_response(response, len(headlines), assets)
+
+    async def adetect_asset_sentiments(self, headlines: list, assets: list) -> list:
+        """
+        Asynchronous version of `detect_asset_sentiments`
+        """
+        if len(assets) == 1:
+            sentiments = await self.adetect_sentiments(headlines, assets[0])
+            return [{assets[0]: sentiment} for sentiment in sentiments]
+        response = await self._acreate(
+            self._build_multi_asset_request(headlines, assets)
+        )
+        return self._parse_multi_asset_response(response, len(headlines), assets)
+
+    def _asset_request(self, headlines: list, assets: list) -> dict:
+        """
+        Return the ChatCompletion parameters that `detect_asset_sentiments` sends for the headlines and assets
+        """
+        if len(assets) == 1:
+            return self._build_batch_request(headlines, assets[0])
+        return self._build_multi_asset_request(headlines, assets)
+
+    def _estimate_tokens(self, request: dict) -> int:
+        """
+        Estimate the tokens used by the request, about 4 characters per prompt token plus the maximum reply tokens.
+        An estimate above the rate limiter tokens budget is capped to the budget, so that long headlines
+        only wait for a full budget instead of failing.
+        """
+        characters = sum(len(message["content"]) for message in request["messages"])
+        tokens = characters // 4 + request["max_tokens"]
+        max_tokens = self.min_rate_limiter.max_tokens
+        if max_tokens and tokens > max_tokens:
+            logger.warning(
+                f"Request of about {tokens} tokens exceeds the {max_tokens} tokens budget, waiting for the full budget"
+            )
+            return max_tokens
+        return tokens
+
+    def check_tokens_budget(self, batch_size: int, assets: list):
+        """
+        Raise ValueError if the reply of a full batch (`batch_size` headlines about all the `assets`)
+        alone doesn't fit the rate limiter tokens budget
+        """
+        max_tokens = self.min_rate_limiter.max_tokens
+        if not max_tokens:
+            return
+        request = self._asset_request([""] * batch_size, assets)
+        if request["max_tokens"] > max_tokens:
+            raise ValueError(
+                f"A batch of {batch_size} headline(s) about {len(assets)} asset(s) needs up to {request['max_tokens']} reply tokens, "
+                f"more than the {max_tokens} tokens per minute budget, reduce `batch_size` or increase `tokens_min`"
+            )
+
+    def _get_cached(self, headline: str, asset: str):
+        """
+        Return the cached sentiment, or `None` when there's no cache or no entry for the headline
+        """
+        if self.cache is None:
+            return None
+        key = SentimentCache.build_key(
+            headline, asset, self.openai_model, PROMPT_VERSION
+        )
+        return self.cache.get(key)
+
+    def _put_cached(self, headline: str, asset: str, sentiment: str):
+        """
+        Cache the sentiment if it's a valid one
+        """
+        if self.cache is None or sentiment not in SENTIMENT_VALUES:
+            return
+        key = SentimentCache.build_key(
+            headline, asset, self.openai_model, PROMPT_VERSION
+        )
+        self.cache.put(key, sentiment)
+
+    def _cached_sentiments(self, headlines: list, assets: list):
+        """
+        Return the cached sentiments per asset in the headlines order (`None` for a cache miss)
+        and the (headline index, asset) pairs of the cache misses
+        """
+        sentiments = [
+            {asset: self._get_cached(headline, asset) for asset in assets}
+            for headline in headlines
+        ]
+        missed = [
+            (index, asset)
+            for index, asset_sentiments in enumerate(sentiments)
+            for asset, sentiment in asset_sentiments.items()
+            if sentiment is None
+        ]
+        return sentiments, missed
+
+    def _cache_sentiments(self, headlines: list, sentiments: list, pairs: list):
+        """
+        Cache the generated sentiments for the (headline index, asset) `pairs`
+        """
+        for index, asset in pairs:
+            if sentiments[index][asset] is not None:
+                self._put_cached(headlines[index], asset, sentiments[index][asset])
+
+    def _pending_request(self, assets: list, pending: list):
+        """
+        Return the headlines indexes and the assets to request for the pending (headline index, asset) pairs
+        """
+        indexes = sorted({index for index, _ in pending})
+        pending_assets = {asset for _, asset in pending}
+        return indexes, [asset for asset in assets if asset in pending_assets]
+
+    def _merge_sentiments(
+        self, sentiments: list, pending: list, indexes: list, results: list
+    ):
+        """
+        Fill `sentiments` with the valid `results` of the `indexes` headlines for the pending (headline index, asset) pairs,
+        and return the pairs still pending
+        """
+        result_by_index = dict(zip(indexes, results))
+        still_pending = []
+        for index, asset in pending:
+            result = result_by_index[index].get(asset)
+            if result is None:
+                still_pending.append((index, asset))
+            else:
+                sentiments[index][asset] = result
+        return still_pending
+
+    def _fill_unknown(self, sentiments: list, pending: list) -> list:
+        """
+        Set the `unknown` sentiment for the headlines that didn't get a valid one after all the attempts
+        """
+        if pending:
+            logger.warning(
+                f"No valid sentiment for {len(pending)} headline(s) after {self.batch_retries} retries, set to '{Sentiment.UNKNOWN.value}'"
+            )
+        for index, asset in pending:
+            sentiments[index][asset] = Sentiment.UNKNOWN.value
+        return sentiments
+
+    def request_asset_sentiments(self, headlines: list, assets: list) -> list:
+        """
+        Rate limit the batch market sentiment API calls and return the sentiment of each asset (dict) in the headlines order.
+        Only the headlines and assets with a malformed sentiment are asked again.
+        """
+        sentiments, missed = self._cached_sentiments(headlines, assets)
+        pending = missed
+        for _ in range(1 + self.batch_retries):
+            if not pending:
+                break
+            indexes, pending_assets = self._pending_request(assets, pending)
+            pending_headlines = [headlines[i] for i in indexes]
+            self.min_rate_limiter.acquire(
+                self._estimate_tokens(
+                    self._asset_request(pending_headlines, pending_assets)
+                )
+            )
+            results = self.detect_asset_sentiments(pending_headlines, pending_assets)
+            pending = self._merge_sentiments(sentiments, pending, indexes, results)
+        self._cache_sentiments(headlines, sentiments, missed)
+        return self._fill_unknown(sentiments, pending)
+
+    async def arequest_asset_sentiments(self, headlines: list, assets: list) -> list:
+        """
+        Asynchronous version of `request_asset_sentiments`
+        """
+        sentiments, missed = self._cached_sentiments(headlines, assets)
+        pending = missed
+        for _ in range(1 + self.batch_retries):
+            if not pending:
+                break
+            indexes, pending_assets = self._pending_request(assets, pending)
+            pending_headlines = [headlines[i] for i in indexes]
+            await self.min_rate_limiter.aacquire(
+                self._estimate_tokens(
+                    self._asset_request(pending_headlines, pending_assets)
+                )
+            )
+            results = await self.adetect_asset_sentiments(
+                pending_headlines, pending_assets
+            )
+            pending = self._merge_sentiments(sentiments, pending, indexes, results)
+        self._cache_sentiments(headlines, sentiments, missed)
+        return self._fill_unknown(sentiments, pending)
+
+    def request_sentiments(self, headlines: list, asset: str) -> list:
+        """
+        Rate limit the batch market sentiment API calls and return the sentiments in the headlines order.
+        Only the headlines with a malformed sentiment are asked again.
+        """
+        sentiments = self.request_asset_sentiments(headlines, [asset])
+        return [asset_sentiments[asset] for asset_sentiments in sentiments]
+
+    async def arequest_sentiments(self, headlines: list, asset: str) -> list:
+        """
+        Asynchronous version of `request_sentiments`
+        """
+        sentiments = await self.arequest_asset_sentiments(headlines, [asset])
+        return [asset_sentiments[asset] for asset_sentiments in sentiments]
+
     def request_sentiment(self, headline: str, asset: str):
         """
         Rate limit the market sentiment API call and return the sentiment
         """
-        self.min_rate_limiter.rate_limiter()
-        return self.detect_sentiment(headline, asset)
+        sentiment = self._get_cached(headline, asset)
+        if sentiment is None:
+            self.min_rate_limiter.acquire(
+                self._estimate_tokens(self._build_request(headline, asset))
+            )
+            sentiment = self.detect_sentiment(headline, asset)
+            self._put_cached(headline, asset, sentiment)
+        return sentiment
+
+    async def arequest_sentiment(self, headline: str, asset: str):
+        """
+        Rate limit the asynchronous market sentiment API call and return the sentiment
+        """
+        sentiment = self._get_cached(headline, asset)
+        if sentiment is None:
+            await self.min_rate_limiter.aacquire(
+                self._estimate_tokens(self._build_request(headline, asset))
+            )
+            sentiment = await self.adetect_sentiment(headline, asset)
+            self._put_cached(headline, asset, sentiment)
+        return sentiment
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Share one HTTP connection pool between all the asynchronous requests made inside this context,
+        instead of opening a new connection per request.
+        """
+        async with aiohttp.ClientSession() as session:
+            token = openai.aiosession.set(session)
+            try:
+                yield
+            finally:
+                openai.aiosession.reset(token)
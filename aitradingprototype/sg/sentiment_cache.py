@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SentimentCache:
+    """
+    Sentiment Cache
+    ---------------
+    Two tiers cache of the generated sentiments, so that a headline already classified isn't paid for again:
+        - in-memory LRU tier of up to `memory_size` entries;
+        - on-disk SQLite tier in `file_path` of up to `max_size` entries, which survives restarts.
+    Entries older than `ttl` seconds are evicted from both tiers.
+
+    The cache key is built from the normalized headline hash, the asset, the OpenAI model and the prompt version,
+    so that a new model or prompt doesn't reuse sentiments generated by the previous ones.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        memory_size: int = 10000,
+        max_size: int = 1000000,
+        ttl: int = 7 * 24 * 3600,
+    ):
+        self.file_path = file_path
+        self.memory_size = memory_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(file_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sentiments (key TEXT PRIMARY KEY, sentiment TEXT NOT NULL, created_time REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS sentiments_created_time ON sentiments (created_time)"
+        )
+        self._evict_disk()
+
+    @staticmethod
+    def build_key(headline: str, asset: str, model: str, prompt_version: int) -> str:
+        """
+        Build the cache key, the headline is normalized (lowercases and single spaces) so that
+        the same headline with different letter case or spacing gets the same key.
+        """
+        normalized_headline = " ".join(headline.lower().split())
+        headline_hash = hashlib.sha256(normalized_headline.encode()).hexdigest()
+        return f"{headline_hash}:{asset.lower()}:{model}:v{prompt_version}"
+
+    def _get_memory(self, key: str, now: float):
+        """
+        Get the sentiment from the in-memory tier and mark it as most recently used
+        """
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        sentiment, created_time = entry
+        if now - created_time > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return sentiment
+
+    def _put_memory(self, key: str, sentiment: str, created_time: float):
+        """
+        Put the sentiment in the in-memory tier and evict the least recently used entries
+        """
+        self._memory[key] = (sentiment, created_time)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """
+        Delete the expired entries and the oldest ones above `max_size` from the on-disk tier
+        """
+        self._db.execute(
+            "DELETE FROM sentiments WHERE created_time < ?", (time.time() - self.ttl,)
+        )
+        self._db.execute(
+            "DELETE FROM sentiments WHERE key IN (SELECT key FROM sentiments ORDER BY created_time DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+        self._db.commit()
+
+    def get(self, key: str):
+        """
+        Return the cached sentiment or `None` if there's no valid entry for the key
+        """
+        now = time.time()
+        with self._lock:
+            sentiment = self._get_memory(key, now)
+            if sentiment is None:
+                row = self._db.execute(
+                    "SELECT sentiment, created_time FROM sentiments WHERE key = ? AND created_time >= ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+                if row:
+                    sentiment = row[0]
+                    self._put_memory(key, sentiment, row[1])
+
+            if sentiment is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return sentiment
+
+    def put(self, key: str, sentiment: str):
+        """
+        Cache the sentiment in both tiers
+        """
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, sentiment, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO sentiments (key, sentiment, created_time) VALUES (?, ?, ?)",
+                (key, sentiment, now),
+            )
+            self._puts += 1
+            if self._puts % 1000 == 0:
+                self._evict_disk()
+            else:
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Return the cache hit and miss counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        """
+        Close the on-disk tier
+        """
+        with self._lock:
+            self._db.close()
@@ -1,10 +1,22 @@
+import asyncio
 import logging
 import os
 import time
 
-from aitradingprototype.common import FileOperator, RedisClient
-from aitradingprototype.common.utils import build_uuid, split_line
+from aitradingprototype.common import FileOperator, RateLimiter, RedisClient
+from aitradingprototype.common.checkpoint import Checkpoint
+from aitradingprototype.common.enums import Sentiment
+from aitradingprototype.common.line_parser import HeadlineRecord, parse_line
+from aitradingprototype.common.metrics import metrics, start_metrics
+from aitradingprototype.common.profiler import span
+from aitradingprototype.common.utils import build_uuid
 from aitradingprototype.sg import OpenAiClient
+from aitradingprototype.sg.async_pipeline import AsyncPipeline
+from aitradingprototype.sg.backfill import Backfill
+from aitradingprototype.sg.classifier import LexiconClassifier
+from aitradingprototype.sg.headline_deduplicator import HeadlineDeduplicator
+from aitradingprototype.sg.line_batcher import LineBatcher
+from aitradingprototype.sg.sentiment_cache import SentimentCache
 
 logger = logging.getLogger(__name__)
 
@@ -30,32 +42,396 @@ class SentimentGenerator:
             "collected_time": 1686376494108,
             "published_time": 1685376494108,
             "headline": "headline",
-            "sentiment": "bullish"
+            "sentiment": "bullish",
+            "asset": "BTC"
         }
     ```
+
+    `asset` can be a single asset or a list of assets. With a list, each headline is classified for all the assets
+    with a single OpenAI request, and the sentiments are written to `./output/sentiments_<asset>.csv` files
+    or pushed to `<redis_channel>_<asset>` channels, one per asset.
+
+    With `max_concurrent_requests` greater than 1, up to that many headlines are classified at once,
+    while the results are still written or pushed in the headlines file order.
+    With `batch_size` greater than 1, up to that many headlines are classified with a single OpenAI request.
     """
 
     def __init__(self, config: dict):
         self.config = config
+        self.multi_asset = isinstance(config["asset"], list)
+        self.assets = config["asset"] if self.multi_asset else [config["asset"]]
+        self.checkpoint = self._create_checkpoint()
         self.headlines_file_operator = FileOperator(config["headlines_file"], "r")
+        self.headlines_read_from = self._seek_headlines_position()
         self.openai = OpenAiClient(
-            self.config["openai_api_key"], self.config["reqs_min"]
+            self.config["openai_api_key"],
+            self.config["reqs_min"],
+            api_base=self.config.get("openai_api_base", ""),
+            batch_retries=self.config.get("batch_retries", 2),
+            cache=self._create_sentiment_cache(),
+            rate_limiter=self._create_rate_limiter(),
+            api_retries=self.config.get("api_retries", 3),
+            api_retry_wait=self.config.get("api_retry_wait", 1.0),
         )
+        self.openai.check_tokens_budget(self.config.get("batch_size", 1), self.assets)
+        self.deduplicator = self._create_deduplicator()
+        self.local_classifier = self._create_local_classifier()
         self.redis = None
 
+    def _seek_headlines_position(self) -> str:
+        """
+        Move where the headlines file starts being read, see `FileOperator.seek_position`.
+        With a checkpoint that doesn't match the file, it starts from `checkpoint.on_mismatch` (default: 'start').
+        """
+        position, fallback = None, "start"
+        if self.checkpoint is not None:
+            position = self.checkpoint.load()
+            fallback = self.config["checkpoint"].get("on_mismatch", "start")
+        return self.headlines_file_operator.seek_position(
+            self.config.get("read_from", "checkpoint"), position, fallback
+        )
+
+    def _create_checkpoint(self):
+        """
+        Create the headlines file checkpoint from the `checkpoint` config, if it's set.
+        The buffered events are published before each checkpoint save, see `_flush_events`.
+        """
+        checkpoint_config = self.config.get("checkpoint")
+        if not checkpoint_config:
+            return None
+        return Checkpoint(
+            checkpoint_config["file"],
+            every_lines=checkpoint_config.get("every_lines", 100),
+            every_seconds=checkpoint_config.get("every_seconds", 5),
+            before_save=self._flush_events,
+        )
+
+    def _flush_events(self):
+        """
+        Publish the events buffered by the Redis batch publisher, so that the checkpoint doesn't get ahead of them:
+        after a crash, the headlines of the lost buffered events are read again
+        """
+        if self.redis is not None:
+            self.redis.flush_events()
+
+    def _create_rate_limiter(self):
+        """
+        Create the OpenAI rate limiter from `reqs_min` and the optional `rate_limit` config
+        """
+        rate_limit_config = self.config.get("rate_limit") or {}
+        redis_client = None
+        if rate_limit_config.get("shared"):
+            redis_client = RedisClient(
+                self.config["redis_host"],
+                self.config["redis_port"],
+                self.config["redis_channel"],
+            ).client
+        return RateLimiter(
+            self.config["reqs_min"],
+            60,
+            max_tokens=rate_limit_config.get("tokens_min"),
+            policy=rate_limit_config.get("policy", "token_bucket"),
+            redis_client=redis_client,
+            key=rate_limit_config.get("key", "sg_openai_rate_limit"),
+        )
+
+    def _create_local_classifier(self):
+        """
+        Create and train the local classifier from the `local_classifier` config, if it's set
+        """
+        classifier_config = self.config.get("local_classifier")
+        if not classifier_config:
+            return None
+        classifier = LexiconClassifier()
+        for asset, file_paths in classifier_config["training_files"].items():
+            classifier.train_from_files(asset, file_paths)
+        return classifier
+
+    def _create_deduplicator(self):
+        """
+        Create the near-duplicate headlines detector from the `headline_dedup` config, if it's set
+        """
+        dedup_config = self.config.get("headline_dedup")
+        if not dedup_config:
+            return None
+        return HeadlineDeduplicator(
+            window=dedup_config.get("window", 600),
+            similarity=dedup_config.get("similarity", 0.7),
+            max_entries=dedup_config.get("max_entries", 10000),
+            shingle_size=dedup_config.get("shingle_size", 1),
+        )
+
+    def _create_sentiment_cache(self):
+        """
+        Create the sentiment cache from the `sentiment_cache` config, if it's set
+        """
+        cache_config = self.config.get("sentiment_cache")
+        if not cache_config:
+            return None
+        logger.info(f"Using sentiment cache '{cache_config['file']}'")
+        return SentimentCache(
+            cache_config["file"],
+            memory_size=cache_config.get("memory_size", 10000),
+            max_size=cache_config.get("max_size", 1000000),
+            ttl=cache_config.get("ttl", 7 * 24 * 3600),
+        )
+
+    def _build_sentiment_line(self, record: HeadlineRecord, sentiment: str) -> str:
+        """
+        Build the sentiment file line from the headline line record and the sentiment
+        """
+        return f'"{record.source}","{record.collected_time}","{record.published_time}","{record.headline}","{sentiment}"'
+
     def _create_sentiment_line(self, line):
         """
         Process each line from headlines file and generate sentiment based on the headline
         """
-        source, collected_time, published_time, headline = split_line(line)
-        sentiment = self.openai.request_sentiment(headline, self.config["asset"])
-        return f'"{source}","{collected_time}","{published_time}","{headline}","{sentiment}"'
+        record = parse_line(line)
+        sentiment = self.openai.request_sentiment(record.headline, self.assets[0])
+        return self._build_sentiment_line(record, sentiment)
+
+    def _mark_duplicate(self, item: dict) -> bool:
+        """
+        Set the item's `duplicate_of` when its headline is a near-duplicate of a recent one.
+        Returns True when the item has to be dropped.
+        """
+        headline = item["record"].headline
+        original_event_id = self.deduplicator.find_duplicate(
+            headline, item["event_id"], item["record"].collected_time / 1000
+        )
+        if original_event_id is None:
+            return False
+        item["duplicate_of"] = original_event_id
+        action = self.config["headline_dedup"].get("action", "tag")
+        logger.info(
+            f"Headline '{headline}' is a near-duplicate of event '{original_event_id}', {action} it"
+        )
+        return action == "drop"
 
-    def _create_sentiments_output_file_path(self):
+    def _headline_items(self, lines, read_stage: str = "read"):
+        """
+        Yield an item for each headline line: the line record, its read time (seconds), a new event id,
+        for a near-duplicate headline, the event id of the original one (`duplicate_of`)
+        and the headlines file position after the line (if the line has one, see `FileLine`).
+        The collection to read time is recorded as the `read_stage` stage.
+        """
+        for line in lines:
+            logger.debug(f"Read '{line}'")
+            with span("parse"):
+                record = parse_line(line)
+            item = {
+                "record": record,
+                "read_time": time.time(),
+                "event_id": build_uuid(),
+                "duplicate_of": None,
+                "position": getattr(line, "position", None),
+            }
+            self._record_read(item, read_stage)
+            if self.deduplicator is not None and self._mark_duplicate(item):
+                continue
+            yield item
+
+    def _record_read(self, item: dict, read_stage: str = "read"):
+        """
+        Record the headline stages before the generator: publication to collection and collection to read
+        (`read_stage`)
+        """
+        record = item["record"]
+        metrics.inc("aitp_headlines_total")
+        metrics.observe(
+            "aitp_stage_seconds",
+            (record.collected_time - record.published_time) / 1000,
+            stage="collect",
+        )
+        metrics.observe(
+            "aitp_stage_seconds",
+            item["read_time"] - record.collected_time / 1000,
+            stage=read_stage,
+        )
+
+    def _headlines(self, items: list) -> list:
+        return [item["record"].headline for item in items]
+
+    def _classify_locally(self, items: list):
+        """
+        Classify the original items with the local classifier, when it's confident enough for all the assets.
+        Returns the local sentiments by event id and the original items to escalate to OpenAI.
+        """
+        local_sentiments, escalated = {}, []
+        if self.local_classifier is not None:
+            min_confidence = self.config["local_classifier"].get("min_confidence", 0.9)
+        for item in items:
+            if item["duplicate_of"] is not None:
+                item["classified_by"] = "duplicate"
+                item["classification_latency_ms"] = 0.0
+                continue
+            if self.local_classifier is None:
+                escalated.append(item)
+                continue
+
+            start = time.perf_counter()
+            headline = item["record"].headline
+            sentiments = {}
+            for asset in self.assets:
+                sentiment, confidence = self.local_classifier.classify(headline, asset)
+                if sentiment is None or confidence < min_confidence:
+                    break
+                sentiments[asset] = sentiment
+            else:
+                local_sentiments[item["event_id"]] = sentiments
+                item["classified_by"] = "local"
+                item["classification_latency_ms"] = (time.perf_counter() - start) * 1000
+                continue
+            escalated.append(item)
+        return local_sentiments, escalated
+
+    def _openai_sentiments(self, items: list, sentiments: list, start: float) -> dict:
+        """
+        Record the OpenAI route and latency of the escalated items and return their sentiments by event id
+        """
+        latency_ms = (time.perf_counter() - start) * 1000
+        for item in items:
+            item["classified_by"] = "openai"
+            item["classification_latency_ms"] = latency_ms
+        return {
+            item["event_id"]: item_sentiments
+            for item, item_sentiments in zip(items, sentiments)
+        }
+
+    def _create_sentiments(self, items: list) -> dict:
+        """
+        Generate the sentiment of each asset for a batch of items. Returns the sentiments by event id.
+        Items are classified by the local classifier when it's confident, the others with a single OpenAI request
+        for the whole batch and all the assets.
+        The near-duplicates aren't classified, they get their original's sentiments in `_emit`.
+        """
+        with span("classify"):
+            sentiments_by_event_id, escalated = self._classify_locally(items)
+            start = time.perf_counter()
+            if not escalated:
+                sentiments = []
+            elif len(escalated) == 1 and len(self.assets) == 1:
+                headline = self._headlines(escalated)[0]
+                sentiment = self.openai.request_sentiment(headline, self.assets[0])
+                sentiments = [{self.assets[0]: sentiment}]
+            else:
+                sentiments = self.openai.request_asset_sentiments(
+                    self._headlines(escalated), self.assets
+                )
+            sentiments_by_event_id.update(
+                self._openai_sentiments(escalated, sentiments, start)
+            )
+        return sentiments_by_event_id
+
+    async def _acreate_sentiments(self, items: list) -> dict:
+        """
+        Asynchronous version of `_create_sentiments`
+        """
+        with span("classify"):
+            sentiments_by_event_id, escalated = self._classify_locally(items)
+            start = time.perf_counter()
+            if not escalated:
+                sentiments = []
+            elif len(escalated) == 1 and len(self.assets) == 1:
+                headline = self._headlines(escalated)[0]
+                sentiment = await self.openai.arequest_sentiment(
+                    headline, self.assets[0]
+                )
+                sentiments = [{self.assets[0]: sentiment}]
+            else:
+                sentiments = await self.openai.arequest_asset_sentiments(
+                    self._headlines(escalated), self.assets
+                )
+            sentiments_by_event_id.update(
+                self._openai_sentiments(escalated, sentiments, start)
+            )
+        return sentiments_by_event_id
+
+    def _emit(self, items: list, sentiments_by_event_id: dict, on_sentiment_result):
+        """
+        Hand the sentiment of each asset to `on_sentiment_result`, in the items order.
+        A near-duplicate gets the sentiments of its original headline, which was emitted before it.
+        """
+        for item in items:
+            metrics.observe(
+                "aitp_classification_seconds",
+                item["classification_latency_ms"] / 1000,
+                classified_by=item["classified_by"],
+            )
+            sentiments = sentiments_by_event_id.get(item["event_id"])
+            if self.deduplicator is not None:
+                if item["duplicate_of"] is None:
+                    self.deduplicator.set_sentiments(item["event_id"], sentiments)
+                else:
+                    sentiments = self.deduplicator.get_sentiments(item["duplicate_of"])
+            for asset in self.assets:
+                sentiment = (sentiments or {}).get(asset, Sentiment.UNKNOWN.value)
+                on_sentiment_result(
+                    {
+                        "event_id": item["event_id"],
+                        "duplicate_of": item["duplicate_of"],
+                        "asset": asset,
+                        "record": item["record"],
+                        "read_time": item["read_time"],
+                        "sentiment": sentiment,
+                        "sentiment_line": self._build_sentiment_line(
+                            item["record"], sentiment
+                        ),
+                        "classified_by": item["classified_by"],
+                        "classification_latency_ms": item["classification_latency_ms"],
+                    }
+                )
+
+    async def _agenerate_sentiments(self, batches, on_results, max_in_flight):
+        """
+        Generate the sentiments with up to `max_in_flight` concurrent OpenAI requests
+        """
+
+        async def create_sentiments(items):
+            return items, await self._acreate_sentiments(items)
+
+        pipeline = AsyncPipeline(create_sentiments, on_results, max_in_flight)
+        async with self.openai.session():
+            await pipeline.run(batches)
+
+    def _batch_items(self, items):
+        """
+        Group the items into batches of `batch_size` items, or wait at most `batch_max_wait` seconds to fill a batch
+        """
+        batch_size = self.config.get("batch_size", 1)
+        if batch_size > 1:
+            batcher = LineBatcher(batch_size, self.config.get("batch_max_wait", 1))
+            return batcher.batches(items)
+        return ([item] for item in items)
+
+    def generate_sentiments(self, lines, on_sentiment_result):
+        """
+        Generate the sentiment of each asset for each headline line and hand it to `on_sentiment_result`, in the lines order.
+        `on_sentiment_result` receives a dict with the `event_id`, `duplicate_of` (original event id of a near-duplicate headline or None),
+        `asset`, `sentiment_line`, `classified_by` ('local', 'openai' or 'duplicate') and `classification_latency_ms`.
+        """
+
+        def on_results(batch_results):
+            items, sentiments_by_event_id = batch_results
+            self._emit(items, sentiments_by_event_id, on_sentiment_result)
+            if self.checkpoint is not None and items[-1]["position"] is not None:
+                self.checkpoint.update(items[-1]["position"], len(items))
+            if self.openai.cache is not None:
+                logger.debug(f"Sentiment cache {self.openai.cache.stats()}")
+
+        batches = self._batch_items(self._headline_items(lines))
+        max_in_flight = self.config.get("max_concurrent_requests", 1)
+        if max_in_flight > 1:
+            asyncio.run(self._agenerate_sentiments(batches, on_results, max_in_flight))
+        else:
+            for items in batches:
+                on_results((items, self._create_sentiments(items)))
+
+    def _create_sentiments_output_file_path(self, asset: str):
         """
         Create a './output/sentiments_<asset>.csv' if it doesn't exist already
         """
-        asset = self.config["asset"].lower()
+        asset = asset.lower()
         output_directory = "./output/"
         output_file = f"sentiments_{asset}.csv"
 
@@ -64,59 +440,146 @@ class SentimentGenerator:
 
         return os.path.join(output_directory, output_file)
 
+    def _sentiment_line_writer(self, mode: str, log_level: int = logging.INFO):
+        """
+        Open the `./output/sentiments_<asset>.csv` files with `mode` and return a `on_sentiment_result` callback
+        that writes the sentiment lines to them
+        """
+        file_operators = {}
+        for asset in self.assets:
+            output_file_path = self._create_sentiments_output_file_path(asset)
+            file_operators[asset] = FileOperator(output_file_path, mode)
+            logger.info(f"Writing to '{output_file_path}'...")
+
+        def write_sentiment_line(sentiment_result: dict):
+            if sentiment_result["duplicate_of"] is not None:
+                return  # the file line format can't tell near-duplicates apart
+            sentiment_line = sentiment_result["sentiment_line"]
+            logger.log(log_level, f"Write '{sentiment_line}'")
+            file_operators[sentiment_result["asset"]].write_line(sentiment_line + "\n")
+
+        return write_sentiment_line
+
     def write_file(self):
         """
         Write headlines with sentiments to a file
         """
-        output_file_path = self._create_sentiments_output_file_path()
-        file_operator = FileOperator(output_file_path, "w+")
-        logger.info(f"Writing to '{output_file_path}'...")
-        for line in self.headlines_file_operator.follow_line():
-            logger.debug(f"Read '{line}'")
-            sentiment_line = self._create_sentiment_line(line)
-            logger.info(f"Write '{sentiment_line}'")
-            file_operator.write_line(sentiment_line + "\n")
+        # the sentiments of the already processed headlines are only replaced when reading the headlines from the start
+        mode = "w+" if self.headlines_read_from == "start" else "a"
+        self.generate_sentiments(
+            self.headlines_file_operator.follow_line(),
+            self._sentiment_line_writer(mode),
+        )
 
-    def push_redis(self):
+    def backfill(self):
         """
-        Push headlines with sentiments to redis
+        Write the sentiments of the whole headlines file to the output files, then return (see `Backfill`).
+        The `backfill` config sets the `workers`, `chunk_size` (bytes) and `progress_interval` (seconds).
         """
-        for line in self.headlines_file_operator.follow_line():
-            sentiment_line = self._create_sentiment_line(line)
-            (
-                collected_source,
-                collected_time,
-                published_time,
-                headline,
-                sentiment,
-            ) = split_line(sentiment_line)
-            event_push_time = int(time.time() * 1000)
-
-            if self.redis is None:
-                self.redis = RedisClient(
-                    self.config["redis_host"],
-                    self.config["redis_port"],
-                    self.config["redis_channel"],
-                )
+        backfill_config = self.config.get("backfill") or {}
+        backfill = Backfill(
+            self,
+            workers=backfill_config.get("workers", 4),
+            chunk_size=backfill_config.get("chunk_size", 1 << 20),
+            progress_interval=backfill_config.get("progress_interval", 10),
+        )
+        logger.info(f"Backfill '{self.headlines_file_operator.file_name}'...")
+        headlines = backfill.run(
+            self.headlines_file_operator.file_name,
+            self._sentiment_line_writer("w+", logging.DEBUG),
+        )
+        logger.info(f"Backfill done, {headlines} headlines")
+
+    def _redis_channel(self, asset: str) -> str:
+        """
+        Return the channel to push the asset sentiments: `redis_channel` for a single asset,
+        `<redis_channel>_<asset>` for each asset of a list
+        """
+        if self.multi_asset:
+            return f"{self.config['redis_channel']}_{asset.lower()}"
+        return self.config["redis_channel"]
+
+    def _create_redis_publisher(self):
+        """
+        Create the Redis client publishing the sentiment events, from the optional `redis_publisher` config:
+        its connection pool size and health checks, and the events batching.
+        With the `redis_stream` config, the events are added to Redis Streams instead of pub/sub channels.
+        The events are encoded with `event_encoding` (default: 'json'), see `event_codec`.
+        """
+        publisher_config = self.config.get("redis_publisher") or {}
+        stream_config = self.config.get("redis_stream")
+        return RedisClient(
+            self.config["redis_host"],
+            self.config["redis_port"],
+            self.config["redis_channel"],
+            max_connections=publisher_config.get("max_connections", 4),
+            health_check_interval=publisher_config.get("health_check_interval", 30),
+            batch_size=publisher_config.get("batch_size", 1),
+            batch_max_wait=publisher_config.get("batch_max_wait", 0.05),
+            transport="stream" if stream_config else "pubsub",
+            stream_maxlen=(stream_config or {}).get("maxlen", 100000),
+            stream_max_lag=(stream_config or {}).get("max_lag"),
+            event_encoding=self.config.get("event_encoding", "json"),
+        )
+
+    def _publish_sentiment_line(self, sentiment_result: dict):
+        """
+        Publish the asset sentiment as a sentiment event to redis.
+        The event carries the headline read time (`read_time`, ms) so that the trading bot can measure the whole pipeline.
+        """
+        asset = sentiment_result["asset"]
+        record = sentiment_result["record"]
+        now = time.time()
+        event_push_time = int(now * 1000)
+        metrics.observe(
+            "aitp_stage_seconds", now - sentiment_result["read_time"], stage="generate"
+        )
+
+        if self.redis is None:
+            self.redis = self._create_redis_publisher()
+        with span("publish"):
             self.redis.publish_event(
-                build_uuid(),
+                sentiment_result["event_id"],
                 event_push_time,
-                collected_source,
-                int(collected_time),
-                int(published_time),
-                headline,
-                sentiment,
+                record.source,
+                record.collected_time,
+                record.published_time,
+                record.headline,
+                sentiment_result["sentiment"],
+                asset=asset,
+                channel=self._redis_channel(asset),
+                duplicate_of=sentiment_result["duplicate_of"],
+                read_time=int(sentiment_result["read_time"] * 1000),
+                classified_by=sentiment_result["classified_by"],
+                classification_latency_ms=round(
+                    sentiment_result["classification_latency_ms"], 3
+                ),
             )
 
+    def push_redis(self):
+        """
+        Push headlines with sentiments to redis
+        """
+        self.generate_sentiments(
+            self.headlines_file_operator.follow_line(), self._publish_sentiment_line
+        )
+
     def start(self):
         """
         Start sentiment generator
         """
 
         logger.info("Start sentiment generator")
+        start_metrics(self.config.get("metrics"))
         logger.info(f"Reading from file '{self.headlines_file_operator.file_name}'...")
         output_option = self.config["output_option"]
-        if output_option == "file":
-            self.write_file()
-        else:
-            self.push_redis()
+        try:
+            if output_option == "file":
+                self.write_file()
+            else:
+                self.push_redis()
+        finally:
+            if self.redis is not None:
+                self.redis.close()  # publishes the buffered events
+            if self.checkpoint is not None:
+                self.checkpoint.close()
@@ -1,13 +1,16 @@
 import logging
 import os
 import sys
+import time
 
 from binance.error import ClientError
 from binance.spot import Spot as Client
 
 from aitradingprototype.__init__ import __version__
+from aitradingprototype.common.metrics import metrics
 from aitradingprototype.tb.enums import TradingError
-from aitradingprototype.tb.filter_manager import FilterManager
+from aitradingprototype.tb.filter_manager import ExchangeInfoCache, FilterManager
+from aitradingprototype.tb.websocket_api_client import WebSocketApiClient
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +20,17 @@ class BinanceClient:
     Binance Client
     --------------
     Class to manage trading on Binance exchange
+
+    The client can trade several `symbols` (default: the `trading_strategy_config` symbol) over the same
+    HTTP session. Their exchange filters are fetched once, see `get_filter_manager`, with the optional
+    `exchange_filters` config: `cache_file`, `ttl` (seconds) and `refresh_interval` (seconds).
+
+    Unless `pre_trade_check` is disabled, an order is checked against the cached filters before posting it,
+    with the last known price (last fill, or ticker price fetched again after `price_ttl` seconds):
+    its quantity is rounded down to the `stepSize` and an order Binance would reject isn't posted.
+
+    With the optional `websocket_api` config (`url`, `timeout`, `reconnect_wait`), the orders are placed
+    over Binance's WebSocket API on a persistent connection, instead of a REST request each.
     """
 
     def __init__(
@@ -27,6 +41,9 @@ class BinanceClient:
         secret_key,
         private_key_path="",
         private_key_password="",
+        exchange_filters: dict = None,
+        websocket_api: dict = None,
+        symbols: list = None,
     ):
         if private_key_path and os.path.exists(private_key_path):
             with open(private_key_path, "rb") as f:
@@ -50,33 +67,162 @@ class BinanceClient:
         )
         self.symbol = trading_strategy_config["symbol"]
         self.base_asset = trading_strategy_config["base_asset"]
+        self.symbols = symbols or [self.symbol]
+        self.exchange_filters = exchange_filters or {}
+        self.pre_trade_check = self.exchange_filters.get("pre_trade_check", True)
+        self.price_ttl = self.exchange_filters.get("price_ttl", 10)
         self.fm = None
+        self._prices = {}  # symbol: (last known price, its monotonic time)
+        self.time_offset = 0  # ms, server time - local time
+        # client placing the orders
+        self.order_client = (
+            self._create_websocket_api_client(api_key, websocket_api) or self.client
+        )
+
+    def _create_websocket_api_client(self, api_key, websocket_api_config: dict):
+        """
+        Create the WebSocket API client, if the `websocket_api` config is set.
+        Its requests are signed as the REST requests are, with the secret or private key.
+        """
+        if not websocket_api_config:
+            return None
+        return WebSocketApiClient(
+            websocket_api_config["url"],
+            api_key,
+            self.client._get_sign,
+            timeout=websocket_api_config.get("timeout", 10),
+            reconnect_wait=websocket_api_config.get("reconnect_wait", 1),
+        )
 
     def get_filter_manager(self):
         """
-        Get filter manager
+        Get filter manager, with the exchange info of the traded symbols only, from the `cache_file` if it's
+        younger than `ttl` seconds, and refreshed every `refresh_interval` seconds when it's set
         """
         if not self.fm:
-            self.fm = FilterManager(self.symbol, self.client.exchange_info())
+            exchange_info_cache = ExchangeInfoCache(
+                self.client,
+                self.symbols,
+                cache_file=self.exchange_filters.get("cache_file"),
+                ttl=self.exchange_filters.get("ttl", 3600),
+            )
+            self.fm = FilterManager(self.symbol, exchange_info_cache.get())
+            refresh_interval = self.exchange_filters.get("refresh_interval")
+            if refresh_interval:
+                self.fm.start_refresh(exchange_info_cache, refresh_interval)
 
         return self.fm
 
+    def sync_time(self) -> int:
+        """
+        Measure the local clock offset (ms) from the server time, halfway through the request, and apply it
+        to the WebSocket API requests. The REST requests use the local time, Binance rejects a request
+        more than 1 second ahead of its time, so the local clock must be synchronized (NTP).
+        """
+        start = time.time()
+        server_time = self.client.time()["serverTime"]
+        self.time_offset = server_time - int((start + time.time()) / 2 * 1000)
+        if self.order_client is not self.client:
+            self.order_client.time_offset = self.time_offset
+        if abs(self.time_offset) >= 1000:
+            logger.warning(
+                f"Local clock is {self.time_offset} ms off the Binance server time, synchronize it (NTP)"
+            )
+        return self.time_offset
+
+    def warm_up(self):
+        """
+        Open the HTTP (and WebSocket API) connection and sync the server time, load the exchange filters and,
+        for the pre-trade check, the prices of the symbols
+        """
+        self.sync_time()
+        if self.order_client is not self.client:
+            self.order_client.ping()
+        fm = self.get_filter_manager()
+        logger.info(f"Loaded the exchange filters of {', '.join(fm.filters)}")
+        if self.pre_trade_check:
+            for symbol in self.symbols:
+                self.recent_price(symbol)
+
+    def keep_alive(self):
+        """
+        Use the HTTP (and WebSocket API) connection, so that it doesn't go idle, and sync the server time again
+        """
+        self.sync_time()
+        if self.order_client is not self.client:
+            self.order_client.ping()
+
+    def _set_price(self, price, symbol: str = None):
+        self._prices[symbol or self.symbol] = (price, time.monotonic())
+
+    def recent_price(self, symbol: str = None) -> str:
+        """
+        Return the last known price of the symbol (default: the client's symbol), fetching the ticker price
+        when it's older than `price_ttl` seconds
+        """
+        symbol = symbol or self.symbol
+        price, price_time = self._prices.get(symbol, (None, None))
+        if price is None or time.monotonic() - price_time >= self.price_ttl:
+            price = self.client.ticker_price(symbol)["price"]
+            self._set_price(price, symbol)
+        return price
+
+    def _check_order(self, args: dict):
+        """
+        Validate the order against the cached exchange filters, return its arguments with the quantity
+        rounded down to the `stepSize`, or None when Binance would reject it.
+        Without a price, the NOTIONAL filter isn't checked (Binance still does).
+        """
+        try:
+            price = self.recent_price(args["symbol"])
+        except Exception as error:
+            logger.warning(
+                f"No recent price, the NOTIONAL filter isn't checked ({error})"
+            )
+            price = None
+        quantity, reason = self.get_filter_manager().validate_quantity(
+            args["quantity"], price, args["symbol"], args.get("type", "MARKET")
+        )
+        if reason is not None:
+            logger.error(TradingError.PRE_TRADE_CHECK.value.format(reason))
+            metrics.inc("aitp_orders_rejected_total", reason="pre_trade_check")
+            return None
+        return {**args, "quantity": format(quantity.normalize(), "f")}
+
     def post_order(self, args):
         """
-        Post order to Binance
+        Post order to Binance, after the pre-trade check.
+        Returns the order response, or None when the order was rejected by a filter, the other errors are raised.
         """
+        if self.pre_trade_check:
+            args = self._check_order(args)
+            if args is None:
+                return None
         try:
             logger.info(f"Post order '{args}'")
-            return self.client.new_order(**args)
+            response = self.order_client.new_order(**args)
+            if response.get("fills"):
+                self._set_price(response["fills"][-1]["price"], args["symbol"])
+            return response
 
         except ClientError as error:
             if (
                 error.error_code == -1013
                 and error.error_message == "Filter failure: NOTIONAL"
             ):
-                ticker_price = (self.client.ticker_price(self.symbol))["price"]
-                min_qty = self.get_filter_manager().calc_min_qty(ticker_price)
+                min_qty = self.get_filter_manager().calc_min_qty(
+                    self.recent_price(args["symbol"]), args["symbol"]
+                )
                 logger.error((TradingError.NOTIONAL_FILTER.value).format(min_qty))
             else:
                 logger.error(error)
-                sys.exit(1)
+                raise
+
+    def close(self):
+        """
+        Stop the exchange filters refresh and close the WebSocket API connection
+        """
+        if self.fm is not None:
+            self.fm.stop_refresh()
+        if self.order_client is not self.client:
+            self.order_client.close()
@@ -3,6 +3,7 @@ from enum import Enum
 
 class TradingError(Enum):
     NOTIONAL_FILTER = "Filter failure: NOTIONAL, the minimum quantity should be {}."
+    PRE_TRADE_CHECK = "Order rejected before posting it, {}."
 
 
 class OrderAction(Enum):
@@ -1,26 +1,146 @@
+import json
+import logging
+import os
+import threading
+import time
 from decimal import Decimal
 
 from aitradingprototype.common.utils import round_up
 
+logger = logging.getLogger(__name__)
+
+
+class ExchangeInfoCache:
+    """
+    Exchange Info Cache
+    -------------------
+    Binance's /exchangeInfo payload of the `symbols` only, kept in `cache_file` (optional) for `ttl` seconds,
+    so that a restart doesn't fetch it again.
+    """
+
+    def __init__(
+        self, client, symbols: list, cache_file: str = None, ttl: float = 3600
+    ):
+        self.client = client
+        self.symbols = sorted(set(symbols))
+        self.cache_file = cache_file
+        self.ttl = ttl
+
+    def _read(self):
+        """
+        Return the cached exchange info, if it's recent enough and has all the symbols.
+        An unreadable or invalid (ex: truncated, edited) cache file is ignored, the exchange info is fetched again.
+        """
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, "r") as file:
+                cache = json.load(file)
+            expired = time.time() - cache["fetched_time"] >= self.ttl
+            if expired or not set(self.symbols).issubset(cache["symbols"]):
+                return None
+            exchange_info = cache["exchange_info"]
+            if not isinstance(exchange_info, dict) or not isinstance(
+                exchange_info.get("symbols"), list
+            ):
+                raise ValueError("the exchange info has no symbols")
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logger.warning(
+                f"Invalid exchange info cache '{self.cache_file}' ({error!r}), fetching it again"
+            )
+            return None
+        return exchange_info
+
+    def _write(self, exchange_info: dict):
+        """
+        Atomically write the exchange info to the cache file
+        """
+        directory = os.path.dirname(self.cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_file_path = f"{self.cache_file}.tmp"
+        with open(temporary_file_path, "w") as file:
+            json.dump(
+                {
+                    "fetched_time": time.time(),
+                    "symbols": self.symbols,
+                    "exchange_info": exchange_info,
+                },
+                file,
+            )
+        os.replace(temporary_file_path, self.cache_file)
+
+    def get(self, refresh: bool = False) -> dict:
+        """
+        Return the exchange info, from the cache file unless it's expired or `refresh` is set
+        """
+        exchange_info = None if refresh else self._read()
+        if exchange_info is None:
+            logger.info(f"Fetch exchange info of {', '.join(self.symbols)}")
+            exchange_info = self.client.exchange_info(symbols=self.symbols)
+            if self.cache_file:
+                self._write(exchange_info)
+        return exchange_info
+
 
 class FilterManager:
     """
     Filter Manager
     --------------
     Class to manage the symbol's trading rules (Filters) according to Binance's /exchangeInfo endpoint.
+    The filters are indexed by symbol and filterType once, so a lookup doesn't scan the exchange info.
+    The exchange info can be refreshed in the background, see `start_refresh`.
     """
 
     def __init__(self, symbol, exchange_info):
         self.symbol = symbol
+        self.update(exchange_info)
+        self._refresh_stopped = None
+
+    def update(self, exchange_info):
+        """
+        Replace the exchange info and its index
+        """
+        self.filters = {
+            s["symbol"]: {f["filterType"]: f for f in s["filters"]}
+            for s in exchange_info["symbols"]
+        }
         self.exchange_info = exchange_info
 
+    def start_refresh(self, exchange_info_cache: ExchangeInfoCache, interval: float):
+        """
+        Fetch the exchange info again every `interval` seconds in a daemon thread, until `stop_refresh`
+        """
+        self._refresh_stopped = threading.Event()
+
+        def refresh(stopped):
+            while not stopped.wait(interval):
+                try:
+                    self.update(exchange_info_cache.get(refresh=True))
+                except Exception as error:
+                    logger.warning(f"Can't refresh the exchange info ({error})")
+
+        threading.Thread(
+            target=refresh, args=(self._refresh_stopped,), daemon=True
+        ).start()
+
+    def stop_refresh(self):
+        if self._refresh_stopped is not None:
+            self._refresh_stopped.set()
+
     def _clamp_quantity(self, n, min_n, max_n):
         """
         Clamp n to max and min bounds
         """
         return min(max_n, max(min_n, n))
 
-    def get_lot_size_filter(self):
+    def get_filter(self, filter_type: str, symbol: str = None):
+        """
+        Get the `filter_type` filter of the symbol (default: the manager's symbol), None if it has none
+        """
+        return self.filters.get(symbol or self.symbol, {}).get(filter_type)
+
+    def get_lot_size_filter(self, symbol: str = None):
         """
         Get LOT_SIZE filter from exchange info:
         {
@@ -30,15 +150,9 @@ class FilterManager:
             "stepSize": "0.00100000" // intervals that a quantity/icebergQty can be increased/decreased by
         }
         """
-        lot_size_filter = None
-        for s in self.exchange_info["symbols"]:
-            if s["symbol"] == self.symbol:
-                for f in s["filters"]:
-                    if f["filterType"] == "LOT_SIZE":
-                        lot_size_filter = f
-        return lot_size_filter
+        return self.get_filter("LOT_SIZE", symbol)
 
-    def get_notional_filter(self):
+    def get_notional_filter(self, symbol: str = None):
         """
         Get MIN_NOTIONAL filter from exchange info:
         {
@@ -48,23 +162,17 @@ class FilterManager:
             "avgPriceMins": 5
         }
         """
-        notional_filter = None
-        for s in self.exchange_info["symbols"]:
-            if s["symbol"] == self.symbol:
-                for f in s["filters"]:
-                    if f["filterType"] == "NOTIONAL":
-                        notional_filter = f
-        return notional_filter
+        return self.get_filter("NOTIONAL", symbol)
 
-    def calc_min_qty(self, ticker_price):
+    def calc_min_qty(self, ticker_price, symbol: str = None):
         """
         Calculate min quantity based on minNotional and last price.
         """
         last_price = Decimal(ticker_price)
-        min_notional = Decimal(self.get_notional_filter()["minNotional"])
+        min_notional = Decimal(self.get_notional_filter(symbol)["minNotional"])
         market_min_qty = min_notional / last_price
 
-        filter = self.get_lot_size_filter()
+        filter = self.get_lot_size_filter(symbol)
 
         step_size_num = filter["stepSize"][1::].find("1")
         step_sized_min_qty = round_up(market_min_qty, step_size_num)
@@ -75,3 +183,67 @@ class FilterManager:
         return Decimal(
             self._clamp_quantity(step_sized_min_qty, filter_min_qty, filter_max_qty)
         )
+
+    def _check_lot_size(
+        self, quantity: Decimal, symbol: str, filter_type: str = "LOT_SIZE"
+    ):
+        """
+        Round the quantity down to the `filter_type` (LOT_SIZE or MARKET_LOT_SIZE) `stepSize`,
+        return it with the reason it breaks the filter (or None)
+        """
+        lot_size_filter = self.get_filter(filter_type, symbol)
+        if lot_size_filter is None:
+            return quantity, None
+        step_size = Decimal(lot_size_filter["stepSize"])
+        if step_size > 0:
+            quantity = quantity // step_size * step_size
+        min_qty = Decimal(lot_size_filter["minQty"])
+        max_qty = Decimal(lot_size_filter["maxQty"])
+        if quantity < min_qty:
+            return (
+                quantity,
+                f"quantity {quantity} is below the {filter_type} minQty {min_qty}",
+            )
+        if quantity > max_qty:
+            return (
+                quantity,
+                f"quantity {quantity} is above the {filter_type} maxQty {max_qty}",
+            )
+        return quantity, None
+
+    def _check_notional(self, quantity: Decimal, price, symbol: str):
+        """
+        Return the reason the MARKET order notional (quantity * price) breaks the NOTIONAL filter, or None
+        """
+        notional_filter = self.get_notional_filter(symbol)
+        if notional_filter is None:
+            return None
+        notional = quantity * Decimal(price)
+        min_notional = Decimal(notional_filter["minNotional"])
+        if notional_filter.get("applyMinToMarket", True) and notional < min_notional:
+            return (
+                f"notional {notional} is below the NOTIONAL minNotional {min_notional}, "
+                f"the minimum quantity should be {self.calc_min_qty(price, symbol)}"
+            )
+        max_notional = Decimal(notional_filter.get("maxNotional", "Infinity"))
+        if notional_filter.get("applyMaxToMarket", False) and notional > max_notional:
+            return (
+                f"notional {notional} is above the NOTIONAL maxNotional {max_notional}"
+            )
+        return None
+
+    def validate_quantity(
+        self, quantity, price=None, symbol: str = None, order_type: str = "MARKET"
+    ):
+        """
+        Round an order quantity down to the LOT_SIZE `stepSize`, then check it against the LOT_SIZE filter,
+        the MARKET_LOT_SIZE filter for a MARKET order and, when the price is given, the NOTIONAL filter,
+        as Binance does, without any request.
+        Returns the rounded quantity (Decimal) and None, or the rounded quantity and the reason it would be rejected.
+        """
+        quantity, reason = self._check_lot_size(Decimal(str(quantity)), symbol)
+        if reason is None and order_type == "MARKET":
+            quantity, reason = self._check_lot_size(quantity, symbol, "MARKET_LOT_SIZE")
+        if reason is None and price is not None:
+            reason = self._check_notional(quantity, price, symbol)
+        return quantity, reason
@@ -0,0 +1,54 @@
+import logging
+import time
+
+from aitradingprototype.common import RedisClient
+
+logger = logging.getLogger(__name__)
+
+
+class HoldingLedger:
+    """
+    Holding Ledger
+    --------------
+    Base asset holding quantity kept in Redis under `key`. Each trade updates it atomically in a single round trip
+    (see `RedisClient.add_to_key`), so that the bots sharing the key don't lose each other's updates.
+
+    A write-through local copy answers `quantity` without a Redis request. It's read again from Redis after
+    `cache_ttl` seconds, to see the updates of the other bots sharing the key (None: never, the key is only
+    updated by this bot).
+    """
+
+    def __init__(self, redis: RedisClient, key: str, cache_ttl: float = None):
+        self.redis = redis
+        self.key = key
+        self.cache_ttl = cache_ttl
+        self._quantity = None
+        self._cached_time = None
+
+    def _cache(self, quantity: float) -> float:
+        self._quantity = quantity
+        self._cached_time = time.monotonic()
+        return quantity
+
+    def quantity(self) -> float:
+        """
+        Return the holding quantity, from the local copy when it's still valid
+        """
+        if self._quantity is None or (
+            self.cache_ttl is not None
+            and time.monotonic() - self._cached_time >= self.cache_ttl
+        ):
+            return self._cache(self.redis.get_float_key(self.key))
+        return self._quantity
+
+    def add(self, quantity: float) -> float:
+        """
+        Add the (negative to subtract) quantity to the holding quantity, return the new holding quantity
+        """
+        return self._cache(self.redis.add_to_key(self.key, quantity))
+
+    def invalidate(self):
+        """
+        Read the holding quantity from Redis next time
+        """
+        self._quantity = None
@@ -0,0 +1,287 @@
+"""
+Local stand-in for Binance's order endpoints, the REST `POST /api/v3/order` and the WebSocket API `order.place`
+(and the `GET /api/v3/time` and `ping` connectivity checks),
+to test and compare the order transports without an exchange.
+
+> python -m aitradingprototype.tb.mock_binance_server --port 8090 --latency 0.005
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_OPCODE_TEXT = 0x1
+_OPCODE_CLOSE = 0x8
+_OPCODE_PING = 0x9
+_OPCODE_PONG = 0xA
+
+
+class MockBinanceServer(ThreadingHTTPServer):
+    """
+    Mock Binance Server
+    -------------------
+    Fills the MARKET orders at `price` after `latency` seconds, on the REST API (`/api/v3/order`) and on the
+    WebSocket API (`/ws-api/v3`, the requests of a connection are answered in order).
+    An order below the `min_notional` is rejected with the -1013 'Filter failure: NOTIONAL' error, and
+    with `secret_key` the HMAC signatures are verified (-1022 error).
+
+    `drop_connections` closes the open WebSocket connections, see `stats` for the counts.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        latency: float = 0.0,
+        price: str = "25000.00000000",
+        min_notional: str = "10.00000000",
+        secret_key: str = None,
+    ):
+        super().__init__(address, MockBinanceHandler)
+        self.latency = latency
+        self.price = Decimal(price)
+        self.min_notional = Decimal(min_notional)
+        self.secret_key = secret_key
+        self._order_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sockets = set()
+        self.orders = 0
+        self.connections = 0
+
+    def _verify(self, payload: str, signature: str) -> bool:
+        if self.secret_key is None:
+            return True
+        expected = hmac.new(
+            self.secret_key.encode(), payload.encode(), hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature or "")
+
+    def place_order(self, params: dict, payload: str):
+        """
+        Return the status and the FULL response of the order, or the error
+        """
+        time.sleep(self.latency)
+        if not self._verify(payload, params.get("signature")):
+            return 400, {
+                "code": -1022,
+                "msg": "Signature for this request is not valid.",
+            }
+        quantity = Decimal(params["quantity"])
+        if quantity * self.price < self.min_notional:
+            return 400, {"code": -1013, "msg": "Filter failure: NOTIONAL"}
+        with self._lock:
+            self.orders += 1
+            order_id = next(self._order_ids)
+        now = int(time.time() * 1000)
+        return 200, {
+            "symbol": params["symbol"],
+            "orderId": order_id,
+            "orderListId": -1,
+            "clientOrderId": f"mock-{order_id}",
+            "transactTime": now,
+            "price": "0.00000000",
+            "origQty": params["quantity"],
+            "executedQty": params["quantity"],
+            "cummulativeQuoteQty": f"{quantity * self.price:.8f}",
+            "status": "FILLED",
+            "timeInForce": "GTC",
+            "type": params["type"],
+            "side": params["side"],
+            "workingTime": now,
+            "fills": [
+                {
+                    "price": f"{self.price:.8f}",
+                    "qty": params["quantity"],
+                    "commission": "0.00000000",
+                    "commissionAsset": "BNB",
+                    "tradeId": order_id,
+                }
+            ],
+            "selfTradePreventionMode": "NONE",
+        }
+
+    def add_socket(self, sock):
+        with self._lock:
+            self._sockets.add(sock)
+            self.connections += 1
+
+    def remove_socket(self, sock):
+        with self._lock:
+            self._sockets.discard(sock)
+
+    def drop_connections(self):
+        """
+        Close the open WebSocket connections, without a close frame
+        """
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "orders": self.orders,
+                "connections": self.connections,
+                "open_connections": len(self._sockets),
+            }
+
+
+class MockBinanceHandler(BaseHTTPRequestHandler):
+    """
+    Serves the REST order requests, and the WebSocket API on an upgraded connection
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # the headers and the body are sent apart
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/api/v3/order":
+            self._send_json(404, {"code": -1000, "msg": "Unknown endpoint"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode()
+        query = url.query or body
+        params = dict(parse_qsl(query))
+        payload = query.rsplit("&signature=", 1)[0]
+        self._send_json(*self.server.place_order(params, payload))
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/api/v3/time":
+            self._send_json(200, {"serverTime": int(time.time() * 1000)})
+            return
+        if self.headers.get("Upgrade", "").lower() != "websocket":
+            self._send_json(404, {"code": -1000, "msg": "Unknown endpoint"})
+            return
+        accept = base64.b64encode(
+            hashlib.sha1(
+                (self.headers["Sec-WebSocket-Key"] + _WEBSOCKET_GUID).encode()
+            ).digest()
+        ).decode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.server.add_socket(self.connection)
+        try:
+            self._serve_websocket()
+        except (OSError, struct.error):
+            pass
+        finally:
+            self.server.remove_socket(self.connection)
+            self.close_connection = True
+
+    def _read_frame(self):
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return _OPCODE_CLOSE, b""
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            (length,) = struct.unpack(">H", self.rfile.read(2))
+        elif length == 127:
+            (length,) = struct.unpack(">Q", self.rfile.read(8))
+        mask = self.rfile.read(4) if header[1] & 0x80 else b"\0\0\0\0"
+        data = self.rfile.read(length)
+        return opcode, bytes(byte ^ mask[i % 4] for i, byte in enumerate(data))
+
+    def _send_frame(self, opcode: int, data: bytes):
+        length = len(data)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        self.wfile.write(header + data)
+
+    def _reply(self, request: dict) -> dict:
+        if request.get("method") == "ping":
+            return {"id": request.get("id"), "status": 200, "result": {}}
+        if request.get("method") != "order.place":
+            return {
+                "id": request.get("id"),
+                "status": 400,
+                "error": {"code": -1000, "msg": "Unknown method"},
+            }
+        params = request["params"]
+        payload = "&".join(
+            f"{key}={value}"
+            for key, value in sorted(params.items())
+            if key != "signature"
+        )
+        status, result = self.server.place_order(params, payload)
+        reply = {"id": request["id"], "status": status, "rateLimits": []}
+        reply["result" if status == 200 else "error"] = result
+        return reply
+
+    def _serve_websocket(self):
+        while True:
+            opcode, data = self._read_frame()
+            if opcode == _OPCODE_CLOSE:
+                self._send_frame(_OPCODE_CLOSE, data[:2])
+                return
+            if opcode == _OPCODE_PING:
+                self._send_frame(_OPCODE_PONG, data)
+            elif opcode == _OPCODE_TEXT:
+                reply = self._reply(json.loads(data))
+                self._send_frame(_OPCODE_TEXT, json.dumps(reply).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 0, latency: float = 0.0, **kwargs) -> MockBinanceServer:
+    """
+    Start the mock server in a daemon thread and return it, `server.server_port` has the bound port.
+    `kwargs` are the other `MockBinanceServer` settings.
+    """
+    server = MockBinanceServer(("127.0.0.1", port), latency=latency, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Binance order endpoints")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--price", default="25000.00000000")
+    parser.add_argument("--min-notional", default="10.00000000")
+    parser.add_argument("--secret-key", default=None)
+    args = parser.parse_args()
+    server = MockBinanceServer(
+        ("127.0.0.1", args.port),
+        latency=args.latency,
+        price=args.price,
+        min_notional=args.min_notional,
+        secret_key=args.secret_key,
+    )
+    print(
+        f"Mock Binance API on http://127.0.0.1:{args.port} and ws://127.0.0.1:{args.port}/ws-api/v3"
+    )
+    server.serve_forever()
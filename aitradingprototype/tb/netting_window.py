@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class NettingWindow:
+    """
+    Netting Window
+    --------------
+    Gathers the items added within `window_ms` milliseconds of the first one, then hands them all
+    to `on_window` from a background thread, in their arrival order.
+
+    An `on_window` error stops the background thread, it's raised by the next `add` or `close`.
+    `close` hands the gathered items right away and stops the background thread.
+    """
+
+    def __init__(self, on_window, window_ms: float = 200):
+        self.on_window = on_window
+        self.window = window_ms / 1000
+        self.windows = 0
+        self._items = []
+        self._close_time = None
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._window_loop, daemon=True)
+        self._thread.start()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def add(self, item):
+        """
+        Add the item to the current window, or open a window with it
+        """
+        with self._condition:
+            self._raise_error()
+            if not self._thread.is_alive():
+                raise RuntimeError("The netting window is closed")
+            if not self._items:
+                self._close_time = time.monotonic() + self.window
+                self._condition.notify_all()
+            self._items.append(item)
+
+    def _next_window(self) -> list:
+        """
+        Wait until the window closes, return its items (empty when closed without items)
+        """
+        with self._condition:
+            while not self._closed:
+                if self._items:
+                    timeout = self._close_time - time.monotonic()
+                    if timeout <= 0:
+                        break
+                else:
+                    timeout = None
+                self._condition.wait(timeout)
+            items, self._items = self._items, []
+            return items
+
+    def _window_loop(self):
+        while True:
+            items = self._next_window()
+            if not items:
+                return
+            try:
+                self.on_window(items)
+            except Exception as error:
+                logger.error(f"Netting window stopped ({error})")
+                with self._condition:
+                    self._error = error
+                return
+            self.windows += 1
+
+    def close(self):
+        """
+        Hand the gathered items and stop the background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        with self._condition:
+            self._raise_error()
@@ -28,6 +28,17 @@ class SuccessiveStrategy(Strategy):
         self.order_qty = trading_specs["order_quantity"]
         self.total_qty_limit = trading_specs["total_quantity_limit"]
 
+    def _market_order(self, side: OrderSide, quantity: float) -> dict:
+        return {
+            "action": OrderAction.POST_ORDER,
+            "order": {
+                "symbol": self.symbol,
+                "side": side.value,
+                "type": OrderType.MARKET.value,
+                "quantity": quantity,
+            },
+        }
+
     def order_strategy(self, sentiment: str, holding_quantity: float) -> dict:
         """
         This method implements the strategy logic mentioned in the class docstring.
@@ -37,15 +48,7 @@ class SuccessiveStrategy(Strategy):
 
         if sentiment == Sentiment.BULLISH.value:
             if (holding_quantity + self.order_qty) <= self.total_qty_limit:
-                return {
-                    "action": OrderAction.POST_ORDER,
-                    "order": {
-                        "symbol": self.symbol,
-                        "side": OrderSide.BUY.value,
-                        "type": OrderType.MARKET.value,
-                        "quantity": self.order_qty,
-                    },
-                }
+                return self._market_order(OrderSide.BUY, self.order_qty)
             else:
                 return {
                     "action": OrderAction.SKIP_ORDER,
@@ -58,15 +61,7 @@ class SuccessiveStrategy(Strategy):
 
         elif sentiment == Sentiment.BEARISH.value:
             if holding_quantity - self.order_qty >= 0:
-                return {
-                    "action": OrderAction.POST_ORDER,
-                    "order": {
-                        "symbol": self.symbol,
-                        "side": OrderSide.SELL.value,
-                        "type": OrderType.MARKET.value,
-                        "quantity": self.order_qty,
-                    },
-                }
+                return self._market_order(OrderSide.SELL, self.order_qty)
             else:
                 return {
                     "action": OrderAction.SKIP_ORDER,
@@ -83,3 +78,32 @@ class SuccessiveStrategy(Strategy):
                     "sentiment is {}".format(sentiment)
                 ),
             }
+
+    def net_order_strategy(self, sentiments: list, holding_quantity: float):
+        """
+        Net the orders of successive sentiments into a single order. Each sentiment is decided by `order_strategy`
+        as if the orders of the previous ones were filled, so `total_quantity_limit` and the holding quantity
+        are respected at every step, then the BUY and SELL quantities are netted.
+        Returns the net strategy order and the strategy order of each sentiment.
+        """
+        orders = []
+        quantity = holding_quantity
+        for sentiment in sentiments:
+            order = self.order_strategy(sentiment, quantity)
+            orders.append(order)
+            if order["action"] == OrderAction.POST_ORDER:
+                if order["order"]["side"] == OrderSide.BUY.value:
+                    quantity += order["order"]["quantity"]
+                else:
+                    quantity -= order["order"]["quantity"]
+        net_quantity = round(quantity - holding_quantity, 8)
+        if net_quantity > 0:
+            return self._market_order(OrderSide.BUY, net_quantity), orders
+        if net_quantity < 0:
+            return self._market_order(OrderSide.SELL, -net_quantity), orders
+        return {
+            "action": OrderAction.SKIP_ORDER,
+            "reason": OrderAction.SKIP_ORDER.value.format(
+                f"the orders of {len(sentiments)} sentiments net to 0"
+            ),
+        }, orders
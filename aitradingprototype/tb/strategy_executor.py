@@ -1,8 +1,10 @@
 import logging
 
 from aitradingprototype.common import RedisClient
+from aitradingprototype.common.metrics import metrics
 from aitradingprototype.tb import BinanceClient
 from aitradingprototype.tb.enums import OrderAction, OrderSide
+from aitradingprototype.tb.holding_ledger import HoldingLedger
 
 logger = logging.getLogger(__name__)
 
@@ -16,15 +18,21 @@ class StrategyExecutor:
 
     Note:
         "holding quantity" - The total base asset quantity that is incremented or decremented by trades net quantity.
+        It's kept by a `HoldingLedger`, with a local copy read again from Redis after `holding_cache_ttl` seconds.
     """
 
     def __init__(
-        self, binance: BinanceClient, redis: RedisClient, holding_qty_key: str
+        self,
+        binance: BinanceClient,
+        redis: RedisClient,
+        holding_qty_key: str,
+        holding_cache_ttl: float = None,
     ):
         self.binance = binance
         self.redis = redis
         # total base asset quantity the account is currently holding for this bot's strategy
         self.holding_qty_key = holding_qty_key
+        self.holding_ledger = HoldingLedger(redis, holding_qty_key, holding_cache_ttl)
 
     def _calc_net_quantity(self, order_response) -> float:
         """
@@ -41,23 +49,32 @@ class StrategyExecutor:
         net_qty = self._calc_net_quantity(order_response)
         if order_response["side"] == OrderSide.BUY.value:
             logger.debug(f"Increment Redis {self.holding_qty_key}: {net_qty}")
-            self.redis.increment_key(self.holding_qty_key, net_qty)
+            self.holding_ledger.add(net_qty)
         else:
             logger.debug(f"Decrement Redis {self.holding_qty_key}: {net_qty}")
-            self.redis.decrement_key(self.holding_qty_key, net_qty)
+            self.holding_ledger.add(-net_qty)
 
     def holding_qty(self) -> float:
         """
-        Return the current base asset holding quantity from Redis.
+        Return the current base asset holding quantity, see `HoldingLedger.quantity`.
         """
-        return float(self.redis.get_float_key(self.holding_qty_key))
+        return self.holding_ledger.quantity()
 
-    def execute_order(self, strategy_order: dict) -> None:
+    def execute_order(self, strategy_order: dict):
         """
         Execute order strategy.
+        Returns the order response when an order was posted, None when it was skipped or rejected.
         """
         if strategy_order["action"] == OrderAction.SKIP_ORDER:
             logger.info(strategy_order["reason"])
         elif strategy_order["action"] == OrderAction.POST_ORDER:
-            response = self.binance.post_order(args=strategy_order["order"])
-            self._response_handler(response)
+            with metrics.timer("aitp_stage_seconds", stage="order"):
+                response = self.binance.post_order(args=strategy_order["order"])
+            if response is None:
+                logger.info("Order not filled, the holding quantity is unchanged")
+                return None
+            metrics.inc("aitp_orders_total", side=response["side"])
+            with metrics.timer("aitp_stage_seconds", stage="holding_update"):
+                self._response_handler(response)
+            return response
+        return None
@@ -1,77 +1,199 @@
-import json
 import logging
+import os
+import socket
+import threading
+import time
 
 from aitradingprototype.common import FileOperator, RedisClient
+from aitradingprototype.common.checkpoint import Checkpoint
 from aitradingprototype.common.enums import Sentiment
-from aitradingprototype.common.utils import split_line
+from aitradingprototype.common.event_codec import decode_event_header
+from aitradingprototype.common.line_parser import parse_line
+from aitradingprototype.common.metrics import metrics, start_metrics
 from aitradingprototype.tb import BinanceClient
 from aitradingprototype.tb.enums import OrderAction
-from aitradingprototype.tb.strategy import SuccessiveStrategy
+from aitradingprototype.tb.netting_window import NettingWindow
+from aitradingprototype.tb.strategy import Strategy, SuccessiveStrategy
 from aitradingprototype.tb.strategy_executor import StrategyExecutor
+from aitradingprototype.tb.trading_instance import TradingInstance
+from aitradingprototype.tb.work_queue import WorkQueue
 
 logger = logging.getLogger(__name__)
 
+STRATEGIES = ("successive",)
+
 
 class TradingBot:
     """
     Trading Bot
     -----------
     This class is responsible for the trading on Binance based on received sentiments and defined strategy.
+
+    It trades the `trading_strategy` pair or, with `trading_strategies`, a set of (symbol, strategy) instances
+    in one process: the instances share the event intake, the Redis and Binance clients (connection pools),
+    the events are routed to the instances of their `asset`, and each instance keeps its own holding quantity key.
     """
 
     def __init__(self, config: dict):
         self.config = config
-        self.redis = self.redis = RedisClient(
+        trading_specs = config.get("trading_strategies") or [config["trading_strategy"]]
+        self.redis = RedisClient(
             self.config["redis_host"],
             self.config["redis_port"],
             self.config["redis_channel"],
         )
         self.binance = BinanceClient(
             base_url=config["base_url"],
-            trading_strategy_config=config["trading_strategy"],
+            trading_strategy_config=trading_specs[0],
             api_key=config["api_key"],
             secret_key=config["secret_key"],
             private_key_path=config["private_key_path"],
             private_key_password=config["private_key_password"],
+            exchange_filters=config.get("exchange_filters"),
+            websocket_api=config.get("websocket_api"),
+            symbols=[trading_spec["symbol"] for trading_spec in trading_specs],
         )
-        self.strategy = SuccessiveStrategy(self.config["trading_strategy"])
+        self.instances = [
+            self._create_instance(trading_spec) for trading_spec in trading_specs
+        ]
+        self._check_holding_keys()
+        self.instances_by_asset = {}
+        for instance in self.instances:
+            self.instances_by_asset.setdefault(instance.asset, []).append(instance)
+        self.work_queue = None
+        self._ack_lock = threading.Lock()
+        self.ready = threading.Event()  # set once warmed up, until the trading stops
 
-        base_asset = config["trading_strategy"]["base_asset"]
-        holding_qty_key = f"aitp_{self.strategy.__class__.__name__.lower()}_holding_qty_{base_asset.lower()}"
-        self.strategy_executor = StrategyExecutor(
-            self.binance, self.redis, holding_qty_key
+    def _create_strategy(self, trading_spec: dict) -> Strategy:
+        strategy_name = trading_spec.get("name", "successive")
+        if strategy_name not in STRATEGIES:
+            raise ValueError(
+                f"Strategy '{strategy_name}' isn't supported, options: {', '.join(STRATEGIES)}"
+            )
+        return SuccessiveStrategy(trading_spec)
+
+    def _create_instance(self, trading_spec: dict) -> TradingInstance:
+        """
+        Create the trading instance of the trading spec, trading the sentiments of its `asset` (default: `base_asset`).
+        Its holding quantity key is `aitp_<strategyname>_holding_qty_<base_asset>`, followed by `_<instance_id>` if it's set.
+        """
+        strategy = self._create_strategy(trading_spec)
+        base_asset = trading_spec["base_asset"]
+        holding_qty_key = f"aitp_{strategy.__class__.__name__.lower()}_holding_qty_{base_asset.lower()}"
+        if trading_spec.get("instance_id"):
+            holding_qty_key += f"_{trading_spec['instance_id']}"
+        strategy_executor = StrategyExecutor(
+            self.binance,
+            self.redis,
+            holding_qty_key,
+            holding_cache_ttl=self.config.get("holding_cache_ttl"),
         )
+        asset = trading_spec.get("asset", base_asset).upper()
+        return TradingInstance(asset, strategy, strategy_executor)
+
+    def _check_holding_keys(self):
+        """
+        Check that the instances don't share a holding quantity key, they would trade each other's holdings
+        """
+        holding_keys = [
+            instance.strategy_executor.holding_qty_key for instance in self.instances
+        ]
+        for holding_key in set(holding_keys):
+            if holding_keys.count(holding_key) > 1:
+                raise ValueError(
+                    f"Several trading strategies have the holding quantity key '{holding_key}', "
+                    "set a different `instance_id` to each of them"
+                )
 
-    def _process_sentimet(self, sentiment: str):
+    def _route(self, event_data: dict) -> list:
         """
-        Process known sentiments and skip unknown ones.
+        Return the instances trading the event: the instances of its asset, or the single instance
         """
-        if sentiment == Sentiment.UNKNOWN.value:
+        if len(self.instances) == 1:
+            return self.instances
+        asset = (event_data.get("asset") or "").upper()
+        instances = self.instances_by_asset.get(asset, [])
+        if not instances:
             logger.info(
                 OrderAction.SKIP_ORDER.value.format(
-                    f"sentiment is {Sentiment.UNKNOWN.value}"
+                    f"no strategy trades asset '{asset}'"
                 )
             )
-        elif (
-            sentiment == Sentiment.BULLISH.value or sentiment == Sentiment.BEARISH.value
-        ):
-            holding_quantity = self.strategy_executor.holding_qty()
-            logger.info(
-                f"Current {self.strategy_executor.holding_qty_key}: {holding_quantity}"
-            )
-            strategy_order = self.strategy.order_strategy(sentiment, holding_quantity)
-            logger.debug(f"Strategy order specification: {strategy_order}")
-            self.strategy_executor.execute_order(strategy_order)
-        else:
-            logger.warning(
-                OrderAction.AVOID_ORDER.value.format(f"invalid sentiment {sentiment}"),
+        return instances
+
+    def _record_received(self, event_data: dict):
+        """
+        Record the event transport time, from its publication by the sentiment generator
+        """
+        metrics.inc("aitp_events_received_total")
+        if event_data.get("event_time") is not None:
+            metrics.observe(
+                "aitp_stage_seconds",
+                time.time() - event_data["event_time"] / 1000,
+                stage="transport",
             )
 
+    def _record_filled(self, event_data: dict):
+        """
+        Record the end to end times of an event that posted an order: from the headline publication
+        and, when the event carries it, from the headline read by the sentiment generator
+        """
+        now = time.time()
+        for name, field in (
+            ("aitp_headline_to_fill_seconds", "published_time"),
+            ("aitp_read_to_fill_seconds", "read_time"),
+        ):
+            if event_data.get(field) is not None:
+                metrics.observe(name, now - event_data[field] / 1000)
+
+    def _process_event(self, event_data: dict):
+        """
+        Trade based on the event sentiment with the instances of its asset, or add the event to their netting window.
+        A stream entry added to netting windows is acknowledged once netted by all of them, see `_ack_netted_events`.
+        """
+        instances = self._route(event_data)
+        if "ack" in event_data:
+            if not instances:
+                event_data.pop("ack")()
+                return
+            event_data["netting_windows"] = len(instances)
+        for instance in instances:
+            if instance.netting_window is not None:
+                instance.netting_window.add(event_data)
+                continue
+            response = instance.process_sentiment(event_data["sentiment"])
+            if response is not None:
+                self._record_filled(event_data)
+
+    def _process_netted_events(self, instance: TradingInstance, events: list):
+        """
+        Trade the netting window events of the instance once, see `TradingInstance.process_netted_events`
+        """
+        for event_data in instance.process_netted_events(events):
+            self._record_filled(event_data)
+        self._ack_netted_events(events)
+
+    def _ack_netted_events(self, events: list):
+        """
+        Acknowledge the stream entries of the events netted by all their instances' netting windows
+        """
+        acks = []
+        with self._ack_lock:
+            for event_data in events:
+                if "ack" not in event_data:
+                    continue
+                event_data["netting_windows"] -= 1
+                if not event_data["netting_windows"]:
+                    acks.append(event_data.pop("ack"))
+        for ack in acks:
+            ack()
+
     def _event_handler(self, event):
         """
         Handle different types of JSON events and processes them accordingly.
         If event type is `subscribe`, logs the sucessful subscription.
-        If event type is `message`, processes the event message.
+        If event type is `message`, processes the event message, unless its headline is a near-duplicate (`duplicate_of`) of an already received one.
+        With a work queue, the event message is queued and processed by the queue worker.
         Example of event:
         {
             'type': 'message',
@@ -90,40 +212,274 @@ class TradingBot:
         """
         logger.info(f"Received event '{event}'")
         if event["type"] == "subscribe":
-            logger.info(f"Subscribed to channel '{self.config['redis_channel']}'")
+            channel = event["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            logger.info(f"Subscribed to channel '{channel}'")
         elif event["type"] == "message":
-            event_data = event["data"]
-            sentiment = (json.loads(event_data))["sentiment"]
-            self._process_sentimet(sentiment)
+            # the headline isn't needed, a binary event's headline isn't decoded
+            event_data = decode_event_header(event["data"])
+            if event_data.get("duplicate_of"):
+                logger.info(
+                    OrderAction.SKIP_ORDER.value.format(
+                        f"headline is a near-duplicate of event {event_data['duplicate_of']}"
+                    )
+                )
+                if "ack" in event:
+                    event["ack"]()
+                return
+            if "ack" in event:
+                event_data["ack"] = event["ack"]
+            self._record_received(event_data)
+            if self.work_queue is not None:
+                self.work_queue.put(event_data)
+            else:
+                self._process_event(event_data)
         else:
             logger.warning(f"Unknown event type '{event['type']}'")
 
+    def _create_checkpoint(self):
+        """
+        Create the sentiments file checkpoint from the `checkpoint` config, if it's set
+        """
+        checkpoint_config = self.config.get("checkpoint")
+        if not checkpoint_config:
+            return None
+        return Checkpoint(
+            checkpoint_config["file"],
+            every_lines=checkpoint_config.get("every_lines", 1),
+            every_seconds=checkpoint_config.get("every_seconds", 1),
+        )
+
     def trade_based_on_file(self):
         """
-        Read sentiments from file and trades based on them
+        Read sentiments from file and trades based on them.
+        With a `checkpoint`, it resumes after the last processed line, so that a restart doesn't trade again
+        on the already processed sentiments. If the checkpoint doesn't match the file anymore, it starts from
+        `checkpoint.on_mismatch`: 'end' (default, only the new sentiments are traded), 'start' or 'fail'.
+        The sentiments file is traded by a single trading strategy, its lines don't have the asset.
         """
+        if len(self.instances) > 1:
+            raise ValueError(
+                "The 'file' input option trades a single trading strategy, use the 'redis' input option"
+            )
+        instance = self.instances[0]
         input_file = self.config["sentiments_file"]
         logger.info(f"Reading from file '{input_file }'...")
         file_operator = FileOperator(input_file, "r")
+        checkpoint = self._create_checkpoint()
+        position, fallback = None, "end"
+        if checkpoint is not None:
+            position = checkpoint.load()
+            fallback = self.config["checkpoint"].get("on_mismatch", "end")
+        file_operator.seek_position(
+            self.config.get("read_from", "checkpoint"), position, fallback
+        )
 
-        for line in file_operator.follow_line():
-            logger.info(f"Read '{line}'")
-            sentiment = split_line(line)[-1]
-            self._process_sentimet(sentiment)
+        try:
+            for line in file_operator.follow_line():
+                logger.info(f"Read '{line}'")
+                sentiment = parse_line(line).sentiment
+                instance.process_sentiment(sentiment)
+                if checkpoint is not None:
+                    checkpoint.update(line.position)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+    def _create_work_queue(self):
+        """
+        Create the work queue from the `work_queue` config, if it's set: its `max_size` and `overflow` policy,
+        the events of the same asset are coalesced
+        """
+        queue_config = self.config.get("work_queue")
+        if not queue_config:
+            return None
+        return WorkQueue(
+            self._process_event,
+            max_size=queue_config.get("max_size", 1000),
+            overflow=queue_config.get("overflow", "block"),
+            coalesce_key=lambda event_data: event_data.get("asset"),
+            name="tb-events",
+        )
+
+    def _listen_for_events(self):
+        """
+        Listen for the pub/sub events. With the `work_queue` config, the events are queued by the read loop
+        and traded by the queue worker, the queued events are still traded on shutdown, for up to `drain_timeout` seconds.
+        """
+        self.work_queue = self._create_work_queue()
+        channels = self._event_channels()
+        if self.work_queue is None:
+            self.redis.listen_for_events(self._event_handler, channels=channels)
+            return
+        try:
+            self.redis.listen_for_events(self._event_handler, channels=channels)
+        finally:
+            work_queue, self.work_queue = self.work_queue, None
+            logger.info(f"Draining the work queue ({work_queue.depth} events)...")
+            work_queue.close(self.config["work_queue"].get("drain_timeout", 30))
+            logger.info(f"Work queue stats: {work_queue.stats()}")
+
+    def _create_netting_window(self, instance: TradingInstance):
+        """
+        Create the netting window of the instance from the `netting` config, if it's set
+        """
+        netting_config = self.config.get("netting")
+        if not netting_config:
+            return None
+        return NettingWindow(
+            lambda events: self._process_netted_events(instance, events),
+            window_ms=netting_config.get("window_ms", 200),
+        )
+
+    def _close_netting_windows(self):
+        """
+        Trade the gathered events of each instance and close its netting window, raise the first error
+        """
+        errors = []
+        for instance in self.instances:
+            netting_window, instance.netting_window = instance.netting_window, None
+            if netting_window is None:
+                continue
+            try:
+                netting_window.close()
+            except Exception as error:
+                logger.error(f"Netting window of {instance} failed ({error})")
+                errors.append(error)
+        if errors:
+            raise errors[0]
+
+    def _event_channels(self) -> list:
+        """
+        Return the channels (streams with `redis_stream`) of the events: `redis_channel`, where SG publishes the
+        sentiments of a single `asset`, and, with `trading_strategies`, the `<redis_channel>_<asset>` channel
+        of each traded asset, where SG publishes the sentiments of an `asset` list
+        """
+        channels = [self.config["redis_channel"]]
+        if self.config.get("trading_strategies"):
+            channels += [
+                f"{self.config['redis_channel']}_{asset.lower()}"
+                for asset in self.instances_by_asset
+            ]
+        logger.info(f"Events channels: {', '.join(channels)}")
+        return channels
 
     def trade_based_on_redis(self):
         """
-        Listen for sentiments events from Redis and trades based on them
+        Listen for sentiments events from Redis and trades based on them.
+        With the `netting` config, the orders of each instance's events received within `window_ms` milliseconds
+        are netted into a single order, the gathered events are still traded on shutdown.
         """
-        self.redis.listen_for_events(self._event_handler)
+        for instance in self.instances:
+            instance.netting_window = self._create_netting_window(instance)
+        try:
+            self._consume_events()
+        finally:
+            self._close_netting_windows()
+
+    def _consume_events(self):
+        """
+        Listen for the pub/sub events, or, with the `redis_stream` config, read the events from the `redis_channel`
+        stream as a consumer of the `group` consumer group, see `RedisClient.consume_stream`. The stream consumer reads
+        the events at its own pace and acknowledges them once traded, so the work queue isn't used.
+        With `netting`, an entry is acknowledged once its netting windows are traded (deferred acknowledgement),
+        so the entries of the open windows are delivered again after a crash.
+        """
+        stream_config = self.config.get("redis_stream")
+        if not stream_config:
+            self._listen_for_events()
+            return
+        self.redis.consume_stream(
+            self._event_handler,
+            stream_config.get("group", "trading_bot"),
+            stream_config.get("consumer", socket.gethostname()),
+            replay_from=stream_config.get("replay_from"),
+            count=stream_config.get("count", 100),
+            block_ms=stream_config.get("block_ms", 5000),
+            claim_idle_ms=stream_config.get("claim_idle_ms", 60000),
+            streams=self._event_channels(),
+            defer_ack=bool(self.config.get("netting")),
+        )
+
+    def _set_ready(self, ready: bool):
+        """
+        Signal the readiness: `ready` event, `aitp_ready` gauge and, with the `warm_up` config, the `ready_file`
+        (created when ready, removed when not)
+        """
+        if ready:
+            self.ready.set()
+        else:
+            self.ready.clear()
+        metrics.set_gauge("aitp_ready", int(ready))
+        ready_file = (self.config.get("warm_up") or {}).get("ready_file")
+        if not ready_file:
+            return
+        if ready:
+            with open(ready_file, "w") as file:
+                file.write(f"{os.getpid()}\n")
+        elif os.path.exists(ready_file):
+            os.remove(ready_file)
+
+    def warm_up(self):
+        """
+        Open and check the Redis and Binance connections, sync the server time, load the exchange filters and prices,
+        prime the holding quantities and run the strategies decision once (without order),
+        so that the first trading decision doesn't pay for them. Then, signal the readiness.
+        """
+        start = time.perf_counter()
+        self.redis.warm_up()
+        self.binance.warm_up()
+        for instance in self.instances:
+            holding_quantity = instance.strategy_executor.holding_qty()
+            instance.strategy.order_strategy(Sentiment.BULLISH.value, holding_quantity)
+            logger.info(
+                f"Current {instance.strategy_executor.holding_qty_key}: {holding_quantity}"
+            )
+        logger.info(
+            f"Warmed up in {(time.perf_counter() - start) * 1000:.0f} ms, ready to trade"
+        )
+        self._set_ready(True)
+
+    def _start_keep_alive(self):
+        """
+        Ping Redis and Binance every `keep_alive_interval` seconds of the `warm_up` config, if it's set,
+        in a daemon thread, so that the connections don't go idle between infrequent events.
+        Returns the event stopping it.
+        """
+        stopped = threading.Event()
+        interval = (self.config.get("warm_up") or {}).get("keep_alive_interval")
+        if not interval:
+            return stopped
+
+        def keep_alive():
+            while not stopped.wait(interval):
+                try:
+                    self.redis.ping()
+                    self.binance.keep_alive()
+                except Exception as error:
+                    logger.warning(f"Keep-alive failed ({error})")
+
+        threading.Thread(target=keep_alive, name="keep-alive", daemon=True).start()
+        return stopped
 
     def start(self):
         """
-        Start trading
+        Start trading, once warmed up, see `warm_up`
         """
         logger.info("Start trading.")
+        start_metrics(self.config.get("metrics"))
         input_option = self.config["input_option"]
-        if input_option == "file":
-            self.trade_based_on_file()
-        else:
-            self.trade_based_on_redis()
+        keep_alive_stopped = None
+        try:
+            self.warm_up()
+            keep_alive_stopped = self._start_keep_alive()
+            if input_option == "file":
+                self.trade_based_on_file()
+            else:
+                self.trade_based_on_redis()
+        finally:
+            if keep_alive_stopped is not None:
+                keep_alive_stopped.set()
+            self._set_ready(False)
+            self.binance.close()
@@ -0,0 +1,102 @@
+import logging
+
+from aitradingprototype.common.enums import Sentiment
+from aitradingprototype.common.metrics import metrics
+from aitradingprototype.common.profiler import span
+from aitradingprototype.tb.enums import OrderAction
+from aitradingprototype.tb.strategy import Strategy
+from aitradingprototype.tb.strategy_executor import StrategyExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class TradingInstance:
+    """
+    Trading Instance
+    ----------------
+    A (symbol, strategy) pair traded by the Trading Bot on the sentiments of `asset`: its strategy, its strategy
+    executor, which keeps the pair's own holding quantity key, and its netting window, when the orders are netted.
+    """
+
+    def __init__(
+        self, asset: str, strategy: Strategy, strategy_executor: StrategyExecutor
+    ):
+        self.asset = asset
+        self.symbol = strategy.trading_spec["symbol"]
+        self.strategy = strategy
+        self.strategy_executor = strategy_executor
+        self.netting_window = None
+
+    def __repr__(self) -> str:
+        return f"{self.strategy.__class__.__name__}({self.symbol})"
+
+    def decide_order(self, sentiment: str) -> dict:
+        """
+        Return the strategy order for the sentiment and the current holding quantity
+        """
+        with metrics.timer("aitp_stage_seconds", stage="holding_qty"):
+            holding_quantity = self.strategy_executor.holding_qty()
+        logger.info(
+            f"Current {self.strategy_executor.holding_qty_key}: {holding_quantity}"
+        )
+        with metrics.timer("aitp_stage_seconds", stage="decide"):
+            strategy_order = self.strategy.order_strategy(sentiment, holding_quantity)
+        logger.debug(f"Strategy order specification: {strategy_order}")
+        return strategy_order
+
+    def process_sentiment(self, sentiment: str):
+        """
+        Process known sentiments and skip unknown ones.
+        Returns the order response when an order was posted.
+        """
+        if sentiment == Sentiment.UNKNOWN.value:
+            logger.info(
+                OrderAction.SKIP_ORDER.value.format(
+                    f"sentiment is {Sentiment.UNKNOWN.value}"
+                )
+            )
+        elif (
+            sentiment == Sentiment.BULLISH.value or sentiment == Sentiment.BEARISH.value
+        ):
+            with span("decide"):
+                strategy_order = self.decide_order(sentiment)
+            with span("execute"):
+                return self.strategy_executor.execute_order(strategy_order)
+        else:
+            logger.warning(
+                OrderAction.AVOID_ORDER.value.format(f"invalid sentiment {sentiment}"),
+            )
+
+    def process_netted_events(self, events: list) -> list:
+        """
+        Trade once based on the sentiments of the netting window events: their orders are netted into a single order,
+        see `SuccessiveStrategy.net_order_strategy`. Each event is logged with its own order.
+        Returns the events whose order was part of the posted net order.
+        """
+        with span("decide"):
+            with metrics.timer("aitp_stage_seconds", stage="holding_qty"):
+                holding_quantity = self.strategy_executor.holding_qty()
+            with metrics.timer("aitp_stage_seconds", stage="decide"):
+                strategy_order, orders = self.strategy.net_order_strategy(
+                    [event_data["sentiment"] for event_data in events],
+                    holding_quantity,
+                )
+        for event_data, order in zip(events, orders):
+            logger.info(
+                f"Netted event '{event_data.get('event_id')}' ({event_data['sentiment']}): "
+                f"{order.get('order') or order['reason']}"
+            )
+        logger.info(
+            f"Net order of {len(events)} events, current {self.strategy_executor.holding_qty_key}: "
+            f"{holding_quantity}, strategy order specification: {strategy_order}"
+        )
+        metrics.inc("aitp_netted_events_total", len(events))
+        with span("execute"):
+            response = self.strategy_executor.execute_order(strategy_order)
+        if response is None:
+            return []
+        return [
+            event_data
+            for event_data, order in zip(events, orders)
+            if order["action"] == OrderAction.POST_ORDER
+        ]
@@ -0,0 +1,213 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import websocket
+from binance.error import ClientError, ServerError
+
+from aitradingprototype.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WebSocketApiClient:
+    """
+    WebSocket API Client
+    --------------------
+    Sends Binance's WebSocket API requests over one persistent connection, opened and reopened by a daemon thread
+    (waiting `reconnect_wait` seconds, doubled after each failure up to `max_reconnect_wait`).
+    The responses are matched to the requests by their ID, so that concurrent requests share the connection.
+
+    The signed requests carry `apiKey`, `timestamp` and the `signature` of their sorted parameters, computed
+    with `sign(payload)` (the REST client's signing, HMAC, RSA or Ed25519).
+    Error responses raise `ClientError` (4XX) or `ServerError` (5XX) as the REST client does. The requests waiting
+    for a response when the connection is lost raise `ConnectionError`: they aren't sent again, as an order
+    may have been placed.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        sign,
+        timeout: float = 10,
+        reconnect_wait: float = 1,
+        max_reconnect_wait: float = 30,
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.sign = sign
+        self.timeout = timeout
+        self.reconnect_wait = reconnect_wait
+        self.max_reconnect_wait = max_reconnect_wait
+        self.connections = 0
+        self.time_offset = 0  # ms added to the local time of the signed requests, see `BinanceClient.sync_time`
+        self._ids = itertools.count(1)
+        self._pending = {}  # request ID: Future of the response
+        self._connection = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._connection_loop, name="websocket-api", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def connected(self) -> bool:
+        with self._condition:
+            return self._connection is not None
+
+    def _connect(self):
+        connection = websocket.create_connection(
+            self.url, timeout=self.timeout, enable_multithread=True
+        )
+        connection.settimeout(None)  # the server pings an idle connection
+        return connection
+
+    def _wait_reconnect(self, wait: float):
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed, wait)
+
+    def _connection_loop(self):
+        wait = self.reconnect_wait
+        while not self._closed:
+            try:
+                connection = self._connect()
+            except (websocket.WebSocketException, OSError) as error:
+                logger.warning(
+                    f"Can't connect to the WebSocket API '{self.url}' ({error}), retry in {wait}s"
+                )
+                self._wait_reconnect(wait)
+                wait = min(wait * 2, self.max_reconnect_wait)
+                continue
+            wait = self.reconnect_wait
+            with self._condition:
+                if self._closed:
+                    connection.close()
+                    return
+                self._connection = connection
+                self.connections += 1
+                self._condition.notify_all()
+            metrics.inc("aitp_websocket_api_connections_total")
+            logger.info(f"Connected to the WebSocket API '{self.url}'")
+            self._read(connection)
+            self._disconnected()
+
+    def _read(self, connection):
+        """
+        Hand the responses to their requests until the connection is lost or closed
+        """
+        try:
+            while True:
+                message = connection.recv()
+                if not message:  # close frame
+                    break
+                response = json.loads(message)
+                with self._condition:
+                    future = self._pending.pop(response.get("id"), None)
+                if future is not None:
+                    future.set_result(response)
+        except (websocket.WebSocketException, OSError, ValueError) as error:
+            if not self._closed:
+                logger.warning(f"WebSocket API connection lost ({error})")
+        finally:
+            connection.shutdown()
+
+    def _disconnected(self):
+        with self._condition:
+            self._connection = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(
+                ConnectionError(
+                    "WebSocket API connection lost before the response, the request outcome is unknown"
+                )
+            )
+
+    def _wait_connection(self):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._connection is not None or self._closed, self.timeout
+            )
+            if self._closed:
+                raise RuntimeError("The WebSocket API client is closed")
+            if self._connection is None:
+                raise ConnectionError(f"No WebSocket API connection to '{self.url}'")
+            return self._connection
+
+    def _signed(self, params: dict) -> dict:
+        params = {
+            **params,
+            "apiKey": self.api_key,
+            "timestamp": int(time.time() * 1000) + self.time_offset,
+        }
+        payload = "&".join(f"{key}={value}" for key, value in sorted(params.items()))
+        signature = self.sign(payload)
+        if isinstance(signature, bytes):
+            signature = signature.decode()
+        return {**params, "signature": signature}
+
+    @staticmethod
+    def _raise_error(response: dict):
+        status = response.get("status", 200)
+        if status < 400:
+            return
+        error = response.get("error", {})
+        if status < 500:
+            raise ClientError(
+                status, error.get("code"), error.get("msg"), {}, error.get("data")
+            )
+        raise ServerError(status, error.get("msg"))
+
+    def request(self, method: str, params: dict = None, signed: bool = False):
+        """
+        Send the request and return its response `result`, waiting up to `timeout` seconds
+        for the connection, then for the response
+        """
+        connection = self._wait_connection()
+        params = {
+            key: value for key, value in (params or {}).items() if value is not None
+        }
+        if signed:
+            params = self._signed(params)
+        future = Future()
+        with self._condition:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        try:
+            connection.send(
+                json.dumps({"id": request_id, "method": method, "params": params})
+            )
+            response = future.result(self.timeout)
+        except (websocket.WebSocketException, OSError, TimeoutError) as error:
+            with self._condition:
+                self._pending.pop(request_id, None)
+            raise ConnectionError(
+                f"WebSocket API request '{method}' failed ({error!r})"
+            ) from error
+        self._raise_error(response)
+        return response.get("result")
+
+    def ping(self):
+        """
+        Test the connectivity (`ping`), it keeps the connection from going idle
+        """
+        return self.request("ping")
+
+    def new_order(self, **params):
+        """
+        Place an order (`order.place`), with the REST `new_order` parameters and response
+        """
+        return self.request("order.place", params, signed=True)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            connection = self._connection
+            self._condition.notify_all()
+        if connection is not None:
+            connection.abort()
+        self._thread.join(self.timeout)
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from aitradingprototype.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class WorkQueue:
+    """
+    Work Queue
+    ----------
+    Bounded queue between an intake loop and a worker thread, which processes the items with `process`
+    in their arrival order, so that a slow processing doesn't stall the intake.
+
+    When `max_size` items are waiting, `put` applies the `overflow` policy:
+    - 'block': waits until the worker takes an item (backpressure to the intake)
+    - 'drop_oldest': drops the oldest waiting item
+    - 'coalesce': the item replaces, at its place in the queue, the oldest waiting item with the same
+      `coalesce_key(item)` (the newer supersedes it), otherwise the oldest waiting item is dropped
+
+    A processing error (any exception, `SystemExit` included) stops the worker, it's raised by the next `put`
+    or `close`, then the `put` of the stopped worker raise `RuntimeError`, whatever the policy.
+    `close` lets the worker process the waiting items (drain), for up to `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        process,
+        max_size: int = 1000,
+        overflow: str = "block",
+        coalesce_key=None,
+        name: str = "work-queue",
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Overflow policy '{overflow}' isn't supported, options: {', '.join(OVERFLOW_POLICIES)}"
+            )
+        self.process = process
+        self.max_size = max_size
+        self.overflow = overflow
+        self.coalesce_key = coalesce_key or (lambda item: None)
+        self.name = name
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._items = deque()  # (put time, item)
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._work_loop, name=name, daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self) -> int:
+        """
+        Items waiting to be processed
+        """
+        with self._condition:
+            return len(self._items)
+
+    def _raise_error(self):
+        """
+        Raise the processing error, or `RuntimeError` if the worker is stopped
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        if not self._worker.is_alive():
+            raise RuntimeError(f"Queue '{self.name}' worker is stopped")
+
+    def _set_depth(self):
+        metrics.set_gauge("aitp_work_queue_depth", len(self._items), queue=self.name)
+
+    def _make_room(self, item):
+        """
+        Apply the overflow policy to the full queue, return True if the item was coalesced into it
+        """
+        if self.overflow == "coalesce":
+            key = self.coalesce_key(item)
+            for index, (put_time, waiting_item) in enumerate(self._items):
+                if self.coalesce_key(waiting_item) == key:
+                    self._items[index] = (put_time, item)
+                    self.coalesced += 1
+                    metrics.inc("aitp_work_queue_coalesced_total", queue=self.name)
+                    logger.warning(
+                        f"Queue '{self.name}' is full, '{waiting_item}' is superseded by '{item}'"
+                    )
+                    return True
+        _, dropped_item = self._items.popleft()
+        self.dropped += 1
+        metrics.inc("aitp_work_queue_dropped_total", queue=self.name)
+        logger.warning(f"Queue '{self.name}' is full, '{dropped_item}' is dropped")
+        return False
+
+    def put(self, item):
+        """
+        Queue the item to process, applying the overflow policy when the queue is full
+        """
+        with self._condition:
+            self._raise_error()
+            if self.overflow == "block":
+                while len(self._items) >= self.max_size and self._worker.is_alive():
+                    self._condition.wait()
+                self._raise_error()
+            elif len(self._items) >= self.max_size and self._make_room(item):
+                return
+            self._items.append((time.monotonic(), item))
+            self._set_depth()
+            self._condition.notify_all()
+
+    def _next_item(self):
+        """
+        Wait for an item and return it with its put time, or (None, None) when closed without items
+        """
+        with self._condition:
+            while not self._items and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None, None
+            put_time, item = self._items.popleft()
+            self._set_depth()
+            self._condition.notify_all()
+            return put_time, item
+
+    def _work_loop(self):
+        while True:
+            put_time, item = self._next_item()
+            if put_time is None:
+                return
+            metrics.observe(
+                "aitp_stage_seconds", time.monotonic() - put_time, stage="queue_wait"
+            )
+            try:
+                self.process(item)
+            except (
+                BaseException
+            ) as error:  # a `SystemExit` would stop the worker silently
+                logger.error(f"Queue '{self.name}' worker stopped ({error})")
+                with self._condition:
+                    self._error = error
+                    self._condition.notify_all()
+                return
+            self.processed += 1
+
+    def close(self, timeout: float = None):
+        """
+        Process the waiting items, for up to `timeout` seconds, and stop the worker
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+        with self._condition:
+            if self._worker.is_alive() or (self._error is not None and self._items):
+                logger.warning(
+                    f"Queue '{self.name}' closed with {len(self._items)} items not processed"
+                )
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+
+    def stats(self) -> dict:
+        """
+        Return the processed, dropped, coalesced and waiting items
+        """
+        with self._condition:
+            return {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "depth": len(self._items),
+            }
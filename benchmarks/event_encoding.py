@@ -0,0 +1,69 @@
+"""
+Sentiment event encode / decode cost (microseconds per event) and size (bytes per event)
+for the 'json', 'binary' and 'lean' encodings, and the header decoding done by the Trading Bot.
+
+> python -m benchmarks.event_encoding --events 100000
+"""
+
+import argparse
+import time
+
+from aitradingprototype.common.event_codec import (
+    decode_event,
+    decode_event_header,
+    encode_event,
+)
+from aitradingprototype.common.utils import build_uuid
+
+
+def _events(count: int) -> list:
+    return [
+        {
+            "event_id": build_uuid(),
+            "event_time": 1692869093677 + index,
+            "collected_source": "NewsAPI",
+            "collected_time": 1686376494108 + index,
+            "published_time": 1685376494108 + index,
+            "headline": f"Bitcoin surges past resistance as institutional demand grows, headline {index}",
+            "sentiment": "bullish",
+            "asset": "BTC",
+            "classified_by": "openai",
+            "classification_latency_ms": 250.125,
+        }
+        for index in range(count)
+    ]
+
+
+def _microseconds_per_event(function, items: list) -> float:
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def run(events: int):
+    event_list = _events(events)
+    print(f"{events} events")
+    print(
+        f"{'encoding':>10} {'bytes':>8} {'encode us':>10} {'decode us':>10} {'header us':>10}"
+    )
+    for encoding in ("json", "binary", "lean"):
+        encoded = [encode_event(event, encoding) for event in event_list]
+        if encoding == "json":
+            encoded = [data.encode() for data in encoded]  # as received from Redis
+        size = sum(len(data) for data in encoded) / events
+        encode_time = _microseconds_per_event(
+            lambda event: encode_event(event, encoding), event_list
+        )
+        decode_time = _microseconds_per_event(decode_event, encoded)
+        header_time = _microseconds_per_event(decode_event_header, encoded)
+        print(
+            f"{encoding:>10} {size:>8.1f} {encode_time:>10.2f} {decode_time:>10.2f} {header_time:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+    run(args.events)
@@ -0,0 +1,75 @@
+"""
+Exchange filters lookup cost (microseconds per lookup) of the `FilterManager` index against
+a linear scan of the whole /exchangeInfo payload, as done before the index.
+
+> python -m benchmarks.filter_lookup --symbols 2000 --lookups 10000
+"""
+
+import argparse
+import time
+
+from aitradingprototype.tb.filter_manager import FilterManager
+
+_FILTER_TYPES = [
+    "PRICE_FILTER",
+    "LOT_SIZE",
+    "ICEBERG_PARTS",
+    "MARKET_LOT_SIZE",
+    "TRAILING_DELTA",
+    "PERCENT_PRICE_BY_SIDE",
+    "NOTIONAL",
+    "MAX_NUM_ORDERS",
+    "MAX_NUM_ALGO_ORDERS",
+]
+
+
+def _exchange_info(symbols: int) -> dict:
+    return {
+        "symbols": [
+            {
+                "symbol": f"SYM{index}USDT",
+                "filters": [
+                    {"filterType": filter_type} for filter_type in _FILTER_TYPES
+                ],
+            }
+            for index in range(symbols)
+        ]
+    }
+
+
+def _scan(exchange_info: dict, symbol: str, filter_type: str):
+    found_filter = None
+    for s in exchange_info["symbols"]:
+        if s["symbol"] == symbol:
+            for f in s["filters"]:
+                if f["filterType"] == filter_type:
+                    found_filter = f
+    return found_filter
+
+
+def _timed(function, lookups: int) -> float:
+    start = time.perf_counter()
+    for _ in range(lookups):
+        function()
+    return (time.perf_counter() - start) / lookups
+
+
+def run(symbols: int, lookups: int):
+    exchange_info = _exchange_info(symbols)
+    symbol = f"SYM{symbols // 2}USDT"
+    start = time.perf_counter()
+    filter_manager = FilterManager(symbol, exchange_info)
+    index_time = time.perf_counter() - start
+    scan_time = _timed(lambda: _scan(exchange_info, symbol, "LOT_SIZE"), lookups)
+    lookup_time = _timed(filter_manager.get_lot_size_filter, lookups)
+    print(f"{symbols} symbols, index built in {index_time * 1000:.1f} ms")
+    print(f"{'linear scan':>12} {scan_time * 1e6:>10.2f} us/lookup")
+    print(f"{'index':>12} {lookup_time * 1e6:>10.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+    run(args.symbols, args.lookups)
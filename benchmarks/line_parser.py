@@ -0,0 +1,64 @@
+"""
+Sentiment line parsing cost (microseconds per line) of `split_line` (with the int conversions)
+against `parse_line`, and lines per second of the `parse_file` bulk mode against reading and splitting each line.
+
+> python -m benchmarks.line_parser --lines 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from aitradingprototype.common.line_parser import parse_file, parse_line
+from aitradingprototype.common.utils import split_line
+
+
+def _split_line_record(line: str):
+    source, collected_time, published_time, headline, sentiment = split_line(line)
+    return source, int(collected_time), int(published_time), headline, sentiment
+
+
+def _read_split_lines(file_path: str) -> int:
+    count = 0
+    with open(file_path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                _split_line_record(line)
+                count += 1
+    return count
+
+
+def _timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run(lines: int):
+    sentiment_lines = [
+        f'"NewsAPI","{1686376494108 + i}","{1685376494108 + i}","Bitcoin surges past resistance, headline {i}","bullish"'
+        for i in range(lines)
+    ]
+    print(f"{lines} lines")
+    split_time = _timed(lambda: [_split_line_record(line) for line in sentiment_lines])
+    parse_time = _timed(lambda: [parse_line(line) for line in sentiment_lines])
+    print(f"{'split_line':>22} {split_time / lines * 1e6:>8.2f} us/line")
+    print(f"{'parse_line':>22} {parse_time / lines * 1e6:>8.2f} us/line")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "sentiments.csv")
+        with open(file_path, "w") as file:
+            file.write("\n".join(sentiment_lines) + "\n")
+        read_split_time = _timed(_read_split_lines, file_path)
+        parse_file_time = _timed(lambda: sum(1 for _ in parse_file(file_path)))
+    print(f"{'read + split_line':>22} {lines / read_split_time:>10.0f} lines/s")
+    print(f"{'parse_file':>22} {lines / parse_file_time:>10.0f} lines/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200000)
+    args = parser.parse_args()
+    run(args.lines)
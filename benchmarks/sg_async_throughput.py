@@ -0,0 +1,63 @@
+"""
+Sentiment generator throughput (headlines/sec) for several `max_concurrent_requests` values,
+against the local mock OpenAI endpoint.
+
+> python -m benchmarks.sg_async_throughput --headlines 200 --latency 0.2 --batch-size 10
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from aitradingprototype.sg import SentimentGenerator
+from aitradingprototype.sg.mock_openai_server import start_server
+
+
+def _write_headlines(path: str, count: int):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(f'"Bench","1697262400000","1687262400000","headline {i}"\n')
+
+
+def run(headlines: int, latency: float, concurrency_levels, batch_size: int):
+    server = start_server(latency=latency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        headlines_file = os.path.join(tmp_dir, "headlines.csv")
+        _write_headlines(headlines_file, headlines)
+        with open(headlines_file) as f:
+            lines = [line.strip() for line in f]
+
+        print(
+            f"{headlines} headlines, mock latency {latency * 1000:.0f} ms, batch size {batch_size}"
+        )
+        print(f"{'max_concurrent_requests':>24} {'seconds':>10} {'headlines/sec':>14}")
+        for max_in_flight in concurrency_levels:
+            config = {
+                "asset": "BTC",
+                "headlines_file": headlines_file,
+                "openai_api_key": "MOCK_OPENAI_API_KEY",
+                "openai_api_base": f"http://127.0.0.1:{server.server_port}/v1",
+                "reqs_min": 10**9,
+                "max_concurrent_requests": max_in_flight,
+                "batch_size": batch_size,
+                "batch_max_wait": 0.05,
+            }
+            sg = SentimentGenerator(config)
+            results = []
+            start = time.perf_counter()
+            sg.generate_sentiments(lines, results.append)
+            elapsed = time.perf_counter() - start
+            assert len(results) == headlines
+            print(f"{max_in_flight:>24} {elapsed:>10.2f} {headlines / elapsed:>14.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--headlines", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+    run(args.headlines, args.latency, args.concurrency, args.batch_size)
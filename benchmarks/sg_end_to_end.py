@@ -0,0 +1,113 @@
+"""
+Sentiment generator end to end benchmark against the local mock OpenAI server: throughput (headlines/sec),
+p50 / p99 latency from a headline read to its sentiment result, rate limiter wait time and injected errors.
+
+> python -m benchmarks.sg_end_to_end --headlines 500 --latency 0.2 --distribution lognormal --jitter 0.1 \
+    --rate-limit-rate 0.02 --reqs-min 600 --concurrency 16 --batch-size 5
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from aitradingprototype.sg import SentimentGenerator
+from aitradingprototype.sg.mock_openai_server import (
+    LATENCY_DISTRIBUTIONS,
+    label_for,
+    start_server,
+)
+
+
+def _percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def _write_headlines(path: str, count: int):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(f'"Bench","1697262400000","1687262400000","headline {i}"\n')
+
+
+def run(args):
+    server = start_server(
+        latency=args.latency,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        headlines_file = os.path.join(tmp_dir, "headlines.csv")
+        _write_headlines(headlines_file, args.headlines)
+        config = {
+            "asset": args.assets if len(args.assets) > 1 else args.assets[0],
+            "headlines_file": headlines_file,
+            "openai_api_key": "MOCK_OPENAI_API_KEY",
+            "openai_api_base": f"http://127.0.0.1:{server.server_port}/v1",
+            "reqs_min": args.reqs_min,
+            "max_concurrent_requests": args.concurrency,
+            "batch_size": args.batch_size,
+            "batch_max_wait": 0.05,
+            "api_retry_wait": 0.1,
+        }
+        sg = SentimentGenerator(config)
+        with open(headlines_file) as f:
+            lines = [line.strip() for line in f]
+
+        read_times, latencies, mismatches = [], [], 0
+
+        def timed_lines():
+            for line in lines:
+                read_times.append(time.perf_counter())
+                yield line
+
+        def on_sentiment_result(result: dict):
+            nonlocal mismatches
+            index = len(latencies) // len(sg.assets)
+            latencies.append(time.perf_counter() - read_times[index])
+            headline = lines[index].split('","')[-1].rstrip('"')
+            expected = label_for(headline, result["asset"])
+            mismatches += not result["sentiment_line"].endswith(f'"{expected}"')
+
+        start = time.perf_counter()
+        sg.generate_sentiments(timed_lines(), on_sentiment_result)
+        elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    rate_limiter_stats = sg.openai.min_rate_limiter.stats()
+    print(
+        f"{args.headlines} headlines, {len(sg.assets)} asset(s), {args.distribution} latency {args.latency * 1000:.0f} ms "
+        f"(jitter {args.jitter * 1000:.0f} ms), max_concurrent_requests {args.concurrency}, batch size {args.batch_size}"
+    )
+    print(f"throughput:        {args.headlines / elapsed:.1f} headlines/sec")
+    print(f"latency p50:       {_percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"latency p99:       {_percentile(latencies, 99) * 1000:.1f} ms")
+    print(
+        f"rate limiter wait: {rate_limiter_stats['wait_time']:.2f} s total, {rate_limiter_stats['waits']} waits, "
+        f"max {rate_limiter_stats['max_wait_time'] * 1000:.1f} ms"
+    )
+    print(f"mock server:       {server.stats()}, retried {sg.openai.api_errors}")
+    print(f"wrong labels:      {mismatches}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--headlines", type=int, default=500)
+    parser.add_argument("--assets", nargs="+", default=["BTC"])
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds")
+    parser.add_argument(
+        "--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal"
+    )
+    parser.add_argument("--jitter", type=float, default=0.1, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reqs-min", type=int, default=10**6)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=5)
+    run(parser.parse_args())
@@ -0,0 +1,68 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+import fakeredis
+import pytest
+
+from aitradingprototype.common import RedisClient
+from aitradingprototype.common.batch_publisher import BatchPublisher
+
+
+def test_batches_are_flushed_by_size_and_time():
+    redis_client = MagicMock()
+    publisher = BatchPublisher(redis_client, batch_size=3, max_wait=0.05)
+    for index in range(4):
+        publisher.publish("channel", {"index": index})
+    time.sleep(0.02)
+    # the full batch is published at once, the last event waits for more
+    redis_client.publish_messages.assert_called_once_with(
+        [("channel", json.dumps({"index": index})) for index in range(3)]
+    )
+    assert publisher.buffered == 1
+    time.sleep(0.1)
+    redis_client.publish_messages.assert_called_with(
+        [("channel", json.dumps({"index": 3}))]
+    )
+    assert publisher.buffered == 0
+    publisher.close()
+    assert publisher.stats()["published"] == 4
+    assert publisher.stats()["flushes"] == 2
+
+
+def test_close_publishes_the_buffered_events():
+    redis_client = MagicMock()
+    publisher = BatchPublisher(redis_client, batch_size=100, max_wait=60)
+    publisher.publish("channel", {"index": 0})
+    publisher.close()
+    redis_client.publish_messages.assert_called_once_with(
+        [("channel", json.dumps({"index": 0}))]
+    )
+
+
+def test_publish_error_is_raised():
+    redis_client = MagicMock()
+    redis_client.publish_messages.side_effect = ConnectionError("Redis is down")
+    publisher = BatchPublisher(redis_client, batch_size=1)
+    publisher.publish("channel", {"index": 0})
+    with pytest.raises(ConnectionError):
+        publisher.flush()
+    publisher.close()
+
+
+def test_redis_client_publishes_batches_with_a_pipeline():
+    redis_client = RedisClient("localhost", 6379, "channel", batch_size=10)
+    redis_client.client = fakeredis.FakeRedis(decode_responses=True)
+    pubsub = redis_client.client.pubsub()
+    pubsub.subscribe("channel")
+    pubsub.get_message(timeout=1)  # subscription confirmation
+
+    for index in range(10):
+        redis_client.publish_event(str(index), 0, "Source", 1, 1, "headline", "bullish")
+    redis_client.publisher.flush()
+    assert redis_client.buffered_events() == 0
+    event_ids = [json.loads(pubsub.get_message(timeout=1)["data"])["event_id"]]
+    while len(event_ids) < 10:
+        event_ids.append(json.loads(pubsub.get_message(timeout=1)["data"])["event_id"])
+    assert event_ids == [str(index) for index in range(10)]
+    redis_client.close()
@@ -0,0 +1,50 @@
+import os
+import time
+
+import pytest
+
+from aitradingprototype.common.checkpoint import Checkpoint
+
+
+def test_save_and_load(tmp_path):
+    file_path = str(tmp_path / "checkpoints" / "sg.json")
+    checkpoint = Checkpoint(file_path, every_lines=2, every_seconds=60)
+    assert checkpoint.load() is None
+
+    checkpoint.update({"offset": 10, "inode": 1, "line_hash": "a"})
+    assert not os.path.exists(file_path)
+    checkpoint.update({"offset": 20, "inode": 1, "line_hash": "b"})
+    assert Checkpoint(file_path).load() == {"offset": 20, "inode": 1, "line_hash": "b"}
+    assert not os.path.exists(file_path + ".tmp")
+
+    checkpoint.update({"offset": 30, "inode": 1, "line_hash": "c"})
+    checkpoint.save()
+    assert Checkpoint(file_path).load()["offset"] == 30
+
+
+def test_save_when_idle(tmp_path):
+    file_path = str(tmp_path / "sg.json")
+    checkpoint = Checkpoint(file_path, every_lines=100, every_seconds=0.1)
+    checkpoint.update({"offset": 10, "inode": 1, "line_hash": "a"})
+    time.sleep(0.3)
+    assert Checkpoint(file_path).load()["offset"] == 10
+    checkpoint.close()
+
+
+def test_before_save_error_skips_the_save(tmp_path):
+    file_path = str(tmp_path / "sg.json")
+
+    def before_save():
+        raise ConnectionError("Redis is down")
+
+    checkpoint = Checkpoint(file_path, every_lines=1, before_save=before_save)
+    with pytest.raises(ConnectionError):
+        checkpoint.update({"offset": 10, "inode": 1, "line_hash": "a"})
+    assert not os.path.exists(file_path)
+
+
+@pytest.mark.parametrize("content", ['{"offset": ', "[1, 2]", '{"offset": 10}'])
+def test_invalid_checkpoint(tmp_path, content):
+    file_path = tmp_path / "sg.json"
+    file_path.write_text(content)
+    assert Checkpoint(str(file_path)).load() is None
@@ -0,0 +1,106 @@
+import json
+import struct
+
+import pytest
+
+from aitradingprototype.common.event_codec import (
+    MAGIC,
+    decode_event,
+    decode_event_header,
+    encode_event,
+)
+
+EVENT = {
+    "event_id": "afd049cb-b19c-4cba-be14-5ddbf3f1aea0",
+    "event_time": 1692869093677,
+    "collected_source": "NewsAPI",
+    "collected_time": 1686376494108,
+    "published_time": 1685376494108,
+    "headline": "Bitcoin ETF approved, “historic” day",
+    "sentiment": "bullish",
+    "asset": "BTC",
+    "duplicate_of": "0c4f3b47-7a2b-4f5e-9a4c-1c1e2d3f4a5b",
+    "classified_by": "openai",
+    "classification_latency_ms": 12.5,
+}
+
+
+def test_binary_event_round_trip():
+    data = encode_event(EVENT, "binary")
+    assert isinstance(data, bytes)
+    assert decode_event(data) == EVENT
+    assert len(data) < len(json.dumps(EVENT).encode())
+
+
+def test_binary_event_optional_fields():
+    event = dict(EVENT, duplicate_of=None, classified_by=None)
+    del event["classification_latency_ms"]
+    decoded = decode_event(encode_event(event, "binary"))
+    assert decoded == dict(event, classification_latency_ms=None)
+
+
+def test_lean_event_has_only_the_trading_fields():
+    data = encode_event(EVENT, "lean")
+    assert decode_event(data) == decode_event_header(data)
+    assert decode_event(data) == {
+        key: EVENT[key]
+        for key in (
+            "event_id",
+            "event_time",
+            "collected_time",
+            "published_time",
+            "sentiment",
+            "asset",
+            "duplicate_of",
+        )
+    }
+    assert len(data) < len(encode_event(EVENT, "binary"))
+
+
+def test_decode_event_header():
+    header = decode_event_header(encode_event(EVENT, "binary"))
+    assert header["sentiment"] == "bullish"
+    assert header["duplicate_of"] == EVENT["duplicate_of"]
+    assert "headline" not in header
+    # JSON events are still decoded, as str or bytes
+    assert decode_event_header(json.dumps(EVENT)) == EVENT
+    assert decode_event_header(json.dumps(EVENT).encode()) == EVENT
+
+
+@pytest.mark.parametrize("encoding", ["binary", "lean"])
+def test_read_time_round_trip(encoding):
+    event = dict(EVENT, read_time=1692869093601)
+    data = encode_event(event, encoding)
+    assert decode_event(data)["read_time"] == event["read_time"]
+    assert decode_event_header(data)["read_time"] == event["read_time"]
+
+
+def test_version_1_event():
+    # version 1 header, without the read time, and a lean body (asset, no duplicate_of)
+    data = (
+        struct.pack(
+            ">BBBB16sqqq",
+            MAGIC,
+            1,
+            0x01,
+            2,
+            bytes.fromhex(EVENT["event_id"].replace("-", "")),
+            EVENT["event_time"],
+            EVENT["collected_time"],
+            EVENT["published_time"],
+        )
+        + bytes([3])
+        + b"BTC"
+    )
+    event = decode_event(data)
+    assert event["sentiment"] == "bearish"
+    assert event["asset"] == "BTC"
+    assert event["published_time"] == EVENT["published_time"]
+    assert "read_time" not in event
+
+
+def test_unsupported_version():
+    data = bytearray(encode_event(EVENT, "binary"))
+    data[1] = 3
+    with pytest.raises(ValueError):
+        decode_event(bytes(data))
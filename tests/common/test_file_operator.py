@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from aitradingprototype.common import FileOperator
+from aitradingprototype.common.file_watcher import PollingWatcher
+
+
+def follow(file_name, **kwargs):
+    """
+    Follow the file in a daemon thread and return the queue of its lines
+    """
+    lines = queue.Queue()
+
+    def run():
+        for line in FileOperator(file_name, "r").follow_line(**kwargs):
+            lines.put(line)
+
+    threading.Thread(target=run, daemon=True).start()
+    return lines
+
+
+def append(file_name, data):
+    with open(file_name, "a") as file:
+        file.write(data)
+
+
+@pytest.fixture
+def file_name(tmp_path):
+    file_name = str(tmp_path / "headlines.csv")
+    with open(file_name, "w") as file:
+        file.write("first\n\nsecond\n")
+    return file_name
+
+
+def test_new_lines_without_waiting_a_poll_interval(file_name):
+    lines = follow(file_name, wait_time=5)
+    assert [lines.get(timeout=1), lines.get(timeout=1)] == ["first", "second"]
+
+    start = time.monotonic()
+    append(file_name, "third\n")
+    assert lines.get(timeout=1) == "third"
+    assert time.monotonic() - start < 0.5
+
+
+def test_partial_line_is_buffered(file_name):
+    lines = follow(file_name, wait_time=0.05)
+    lines.get(timeout=1), lines.get(timeout=1)
+
+    append(file_name, "thi")
+    with pytest.raises(queue.Empty):
+        lines.get(timeout=0.2)
+    append(file_name, "rd\n")
+    assert lines.get(timeout=1) == "third"
+
+
+def test_truncation(file_name):
+    lines = follow(file_name, wait_time=0.05)
+    lines.get(timeout=1), lines.get(timeout=1)
+
+    with open(file_name, "w") as file:
+        file.write("new\n")
+    assert lines.get(timeout=1) == "new"
+
+
+def test_rotation(file_name):
+    lines = follow(file_name, wait_time=0.05)
+    lines.get(timeout=1), lines.get(timeout=1)
+
+    append(file_name, "last")
+    os.rename(file_name, file_name + ".1")
+    with open(file_name, "w") as file:
+        file.write("rotated\n")
+    assert [lines.get(timeout=1), lines.get(timeout=1)] == ["last", "rotated"]
+
+
+def test_polling_watcher_backoff():
+    watcher = PollingWatcher(min_wait=0.01, max_wait=0.04)
+    waits = []
+    for _ in range(4):
+        waits.append(watcher.current_wait)
+        watcher.wait()
+    assert waits == [0.01, 0.02, 0.04, 0.04]
+    watcher.reset()
+    assert watcher.current_wait == 0.01
+
+
+def test_resume_from_checkpoint_position(file_name):
+    lines = follow(file_name, wait_time=0.05)
+    lines.get(timeout=1)
+    position = lines.get(timeout=1).position
+    append(file_name, "third\n")
+
+    file_operator = FileOperator(file_name, "r")
+    assert file_operator.seek_position("checkpoint", position) == "checkpoint"
+    assert file_operator.offset == len("first\n\nsecond\n")
+    assert next(file_operator.follow_line()) == "third"
+
+
+def test_resume_after_long_line(tmp_path):
+    file_name = str(tmp_path / "sentiments.csv")
+    long_line = "x" * 200000
+    with open(file_name, "w") as file:
+        file.write(f"first\n{long_line}\nlast\n")
+    lines = follow(file_name, wait_time=0.05)
+    lines.get(timeout=1)
+    position = lines.get(timeout=1).position
+
+    file_operator = FileOperator(file_name, "r")
+    assert file_operator.seek_position("checkpoint", position, "fail") == "checkpoint"
+    assert next(file_operator.follow_line()) == "last"
+
+
+def test_invalid_checkpoint_position_fallback(file_name):
+    file_operator = FileOperator(file_name, "r")
+    position = {"offset": 6, "inode": file_operator.inode, "line_hash": "other line"}
+    assert file_operator.seek_position("checkpoint", position) == "start"
+    assert file_operator.offset == 0
+    assert next(file_operator.follow_line()) == "first"
+
+    file_operator = FileOperator(file_name, "r")
+    position = {"offset": 6, "inode": file_operator.inode + 1, "line_hash": None}
+    assert file_operator.seek_position("checkpoint", position, "end") == "end"
+    assert file_operator.offset == len("first\n\nsecond\n")
+
+    position = {"offset": 1000, "inode": file_operator.inode, "line_hash": None}
+    with pytest.raises(ValueError):
+        file_operator.seek_position("checkpoint", position, "fail")
+
+
+def test_read_from_end(file_name):
+    append(file_name, "partial")
+    file_operator = FileOperator(file_name, "r")
+    assert file_operator.seek_position("end") == "end"
+    append(file_name, " line\n")
+    assert next(file_operator.follow_line()) == "partial line"
@@ -0,0 +1,47 @@
+import pytest
+
+from aitradingprototype.common.line_parser import (
+    HeadlineRecord,
+    parse_file,
+    parse_line,
+)
+from aitradingprototype.common.utils import split_line
+
+LINES = [
+    '"NewsAPI","1640310400000","1630310400000","Test Headline","bullish"',
+    '"NewsAPI","1640310400000","1630310400000","Test, Headline","bearish"',
+    '"NewsAPI","1640310400000","1630310400000","Test"Headline"","unknown"',
+    '"NewsAPI","1640310400000","1630310400000","Test Headline"',
+]
+
+
+def test_parse_line_matches_split_line():
+    for line in LINES:
+        record = parse_line(line)
+        elements = split_line(line)
+        assert record[: len(elements)] == (
+            elements[0],
+            int(elements[1]),
+            int(elements[2]),
+            *elements[3:],
+        )
+    assert parse_line(LINES[0]) == HeadlineRecord(
+        "NewsAPI", 1640310400000, 1630310400000, "Test Headline", "bullish"
+    )
+    assert parse_line(LINES[3]).sentiment is None
+
+
+def test_parse_invalid_line():
+    with pytest.raises(ValueError):
+        parse_line("abc")
+    with pytest.raises(ValueError):
+        parse_line('"NewsAPI","not a time","1630310400000","Test Headline"')
+
+
+def test_parse_file(tmp_path):
+    file_path = tmp_path / "sentiments.csv"
+    # the last line has no ending newline
+    file_path.write_text("\n".join(LINES[:3] * 10) + "\n\n" + LINES[0])
+    # small chunks, the lines are split across the chunks
+    records = list(parse_file(str(file_path), chunk_size=16))
+    assert records == [parse_line(line) for line in LINES[:3] * 10 + LINES[:1]]
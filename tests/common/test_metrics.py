@@ -0,0 +1,69 @@
+import random
+import urllib.request
+
+import pytest
+
+from aitradingprototype.common.metrics import Histogram, Metrics
+
+
+def test_histogram_percentiles():
+    random.seed(1)
+    values = sorted(random.lognormvariate(-4, 1) for _ in range(10000))
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == len(values)
+    assert histogram.sum == pytest.approx(sum(values))
+    for percent in (50, 90, 99, 99.9):
+        expected = values[int(percent / 100 * len(values)) - 1]
+        assert histogram.percentile(percent) == pytest.approx(expected, rel=0.02)
+    assert histogram.percentile(100) == values[-1]
+
+
+def test_histogram_small_and_negative_values():
+    histogram = Histogram()
+    assert histogram.percentile(50) == 0.0
+    histogram.record(-1)  # clocks skew
+    histogram.record(0.000005)
+    assert histogram.percentile(50) == 0.0
+    assert histogram.percentile(100) == 0.000005
+
+
+def test_render_and_summary():
+    metrics = Metrics()
+    metrics.counter("aitp_orders_total", "Posted orders", side="BUY").inc()
+    metrics.inc("aitp_orders_total", side="BUY")
+    for _ in range(10):
+        metrics.observe("aitp_stage_seconds", 0.002, stage="order")
+    with metrics.timer("aitp_stage_seconds", stage="decide"):
+        pass
+
+    lines = metrics.render().splitlines()
+    assert lines[:3] == [
+        "# HELP aitp_orders_total Posted orders",
+        "# TYPE aitp_orders_total counter",
+        'aitp_orders_total{side="BUY"} 2',
+    ]
+    assert "# TYPE aitp_stage_seconds summary" in lines
+    assert 'aitp_stage_seconds{stage="order",quantile="0.99"} 0.002000' in lines
+    assert 'aitp_stage_seconds_count{stage="order"} 10' in lines
+    assert 'aitp_stage_seconds_count{stage="decide"} 1' in lines
+
+    summary = metrics.summary()
+    assert 'aitp_orders_total{side="BUY"}=2' in summary
+    assert 'aitp_stage_seconds{stage="order"} n=10 p50=2.0ms p99=2.0ms' in summary
+
+
+def test_metrics_endpoint():
+    metrics = Metrics()
+    metrics.inc("aitp_events_received_total")
+    server = metrics.start_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert "aitp_events_received_total 1" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,107 @@
+import os
+import pstats
+import signal
+import threading
+import time
+
+import pytest
+
+from aitradingprototype.common import profiler as profiler_module
+from aitradingprototype.common.metrics import Metrics
+from aitradingprototype.common.profiler import (
+    Profiler,
+    create_profiler,
+    enable_spans,
+    span,
+)
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """
+    Record the spans in a new registry and disable them after the test
+    """
+    metrics = Metrics()
+    monkeypatch.setattr(profiler_module, "metrics", metrics)
+    yield metrics
+    enable_spans(False)
+
+
+def _busy_function(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_spans(metrics):
+    with span("parse"):
+        pass
+    assert metrics.render() == "\n"  # disabled
+
+    enable_spans()
+    with span("parse"):
+        pass
+    assert metrics.histogram("aitp_span_seconds", span="parse").count == 1
+
+
+def test_cprofile_session(metrics, tmp_path):
+    profiler = Profiler(output_dir=str(tmp_path))
+    assert profiler.stop() is None
+    profiler.toggle()
+    assert profiler.running
+    with span("classify"):  # enabled during the session
+        _busy_function(0.01)
+    profiler.toggle()
+    assert not profiler.running
+
+    (file_name,) = os.listdir(tmp_path)
+    assert file_name.startswith(f"profile_{os.getpid()}_")
+    functions = {
+        function[2] for function in pstats.Stats(str(tmp_path / file_name)).stats
+    }
+    assert "_busy_function" in functions
+    assert metrics.histogram("aitp_span_seconds", span="classify").count == 1
+    with span("classify"):  # disabled again
+        pass
+    assert metrics.histogram("aitp_span_seconds", span="classify").count == 1
+
+
+def test_sampling_session_profiles_all_threads(metrics, tmp_path):
+    profiler = Profiler(
+        output_dir=str(tmp_path), mode="sampling", sample_interval=0.001
+    )
+    profiler.start()
+    worker = threading.Thread(target=_busy_function, args=(0.2,), name="worker")
+    worker.start()
+    worker.join()
+    file_path = profiler.stop()
+
+    assert file_path.endswith(".folded")
+    with open(file_path) as file:
+        stacks = file.read().splitlines()
+    assert any(
+        stack.startswith("worker;") and "_busy_function" in stack for stack in stacks
+    )
+    assert all(stack.rsplit(" ", 1)[1].isdigit() for stack in stacks)
+
+
+def test_signal_toggles_profiling(metrics, tmp_path):
+    previous_handler = signal.getsignal(signal.SIGUSR1)
+    try:
+        profiler = create_profiler({"output_dir": str(tmp_path), "spans": True})
+        assert not profiler.running
+        with span("publish"):  # enabled by the config
+            pass
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert profiler.running
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert not profiler.running
+        assert len(os.listdir(tmp_path)) == 1
+        assert metrics.histogram("aitp_span_seconds", span="publish").count == 1
+    finally:
+        signal.signal(signal.SIGUSR1, previous_handler)
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        Profiler(mode="tracing")
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+import fakeredis
+
+import pytest
+
+from aitradingprototype.common import RateLimiter
+
+
+def test_token_bucket_bursts_then_waits():
+    rate_limiter = RateLimiter(5, 0.5)
+    start = time.monotonic()
+    for _ in range(5):
+        rate_limiter.acquire()
+    assert time.monotonic() - start < 0.05
+
+    rate_limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+    stats = rate_limiter.stats()
+    assert stats["calls"] == 6
+    assert stats["waits"] == 1
+    assert stats["wait_time"] == pytest.approx(0.1, abs=0.05)
+
+
+def test_sliding_window_never_exceeds_limit():
+    rate_limiter = RateLimiter(3, 0.3, policy="sliding_window")
+    times = []
+    for _ in range(6):
+        rate_limiter.acquire()
+        times.append(time.monotonic())
+    for first, fourth in zip(times, times[3:]):
+        assert fourth - first >= 0.3
+
+
+def test_tokens_budget():
+    rate_limiter = RateLimiter(100, 0.5, max_tokens=100)
+    start = time.monotonic()
+    rate_limiter.acquire(80)
+    rate_limiter.acquire(40)
+    assert time.monotonic() - start >= 0.09
+
+    with pytest.raises(ValueError):
+        rate_limiter.acquire(101)
+
+
+def test_async_acquire_waits_without_blocking():
+    rate_limiter = RateLimiter(2, 0.2, policy="sliding_window")
+
+    async def acquire_all():
+        await asyncio.gather(*(rate_limiter.aacquire() for _ in range(4)))
+
+    start = time.monotonic()
+    asyncio.run(acquire_all())
+    assert time.monotonic() - start >= 0.19
+    assert rate_limiter.stats()["calls"] == 4
+
+
+def test_redis_shared_budget_script():
+    redis_client = MagicMock()
+    script = redis_client.register_script.return_value
+    script.side_effect = ["0.05", "0"]
+    rate_limiter = RateLimiter(3, 60, max_tokens=1000, redis_client=redis_client)
+
+    rate_limiter.acquire(10)
+
+    assert script.call_count == 2
+    assert script.call_args.kwargs == {
+        "keys": ["rate_limiter:token_bucket:0", "rate_limiter:token_bucket:1"],
+        "args": [3, 3 / 60, 1, 1000, 1000 / 60, 10],
+    }
+    assert rate_limiter.stats()["waits"] == 1
+
+
+@pytest.mark.parametrize("policy", ["token_bucket", "sliding_window"])
+def test_redis_scripts_share_budgets(policy):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    rate_limiters = [
+        RateLimiter(3, 0.3, max_tokens=100, policy=policy, redis_client=redis_client)
+        for _ in range(2)
+    ]
+    start = time.monotonic()
+    times = []
+    for index in range(6):
+        rate_limiters[index % 2].acquire(10)
+        times.append(time.monotonic() - start)
+    # 3 calls at once, then the shared calls budget makes the others wait
+    assert times[2] < 0.05
+    assert times[3] >= 0.09
+    assert times[5] >= 0.25
+
+    # the shared tokens budget has 40 tokens left at most
+    start = time.monotonic()
+    rate_limiters[0].acquire(95)
+    assert time.monotonic() - start >= 0.09
+    assert sum(r.stats()["calls"] for r in rate_limiters) == 7
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        RateLimiter(3, 60, policy="fixed_window")
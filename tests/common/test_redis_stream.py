@@ -0,0 +1,143 @@
+import json
+
+import fakeredis
+import pytest
+
+from aitradingprototype.common import RedisClient
+
+
+class StopConsuming(Exception):
+    pass
+
+
+@pytest.fixture
+def fake_server():
+    return fakeredis.FakeServer()
+
+
+def _stream_client(fake_server, **kwargs):
+    redis_client = RedisClient(
+        "localhost", 6379, "headlines_sentiment", transport="stream", **kwargs
+    )
+    redis_client.client = fakeredis.FakeRedis(server=fake_server, decode_responses=True)
+    redis_client._event_client = fakeredis.FakeRedis(server=fake_server)
+    return redis_client
+
+
+def _publish(redis_client, event_ids):
+    for event_id in event_ids:
+        redis_client.publish_event(event_id, 0, "Source", 1, 1, "headline", "bullish")
+
+
+def _consume(redis_client, consumer, events, **kwargs):
+    """
+    Consume until `events` event ids are handled, return them
+    """
+    event_ids = []
+
+    def event_handler(event):
+        event_ids.append(json.loads(event["data"])["event_id"])
+        if len(event_ids) == events:
+            raise StopConsuming
+
+    with pytest.raises(StopConsuming):
+        redis_client.consume_stream(
+            event_handler, "trading_bot", consumer, block_ms=10, **kwargs
+        )
+    return event_ids
+
+
+def test_stream_is_capped(fake_server):
+    producer = _stream_client(fake_server, stream_maxlen=10)
+    _publish(producer, [str(index) for index in range(100)])
+    # the trimming is approximate, by whole nodes
+    assert producer.client.xlen("headlines_sentiment") < 100
+
+
+def test_consumer_group_acknowledges_and_redelivers(fake_server):
+    producer = _stream_client(fake_server)
+    consumer = _stream_client(fake_server)
+    consumer._create_group("headlines_sentiment", "trading_bot")
+    _publish(producer, ["a", "b", "c"])
+
+    # "b" isn't acknowledged since its handling stopped the consumer
+    assert _consume(consumer, "tb-1", 2) == ["a", "b"]
+    # restarted, the consumer handles its pending "b" first
+    assert _consume(consumer, "tb-1", 2) == ["b", "c"]
+    pending = consumer.client.xpending("headlines_sentiment", "trading_bot")
+    assert pending["pending"] == 1  # "c"
+
+
+def test_consumer_group_reclaims_pending_entries(fake_server):
+    producer = _stream_client(fake_server)
+    consumer = _stream_client(fake_server)
+    consumer._create_group("headlines_sentiment", "trading_bot")
+    _publish(producer, ["a", "b"])
+    assert _consume(consumer, "tb-1", 1) == ["a"]
+
+    # "a" is pending in the stopped tb-1, tb-2 reclaims it, then reads "b"
+    assert _consume(consumer, "tb-2", 2, claim_idle_ms=0) == ["a", "b"]
+
+
+def test_consumer_group_replays_from_id(fake_server):
+    producer = _stream_client(fake_server)
+    consumer = _stream_client(fake_server)
+    _publish(producer, ["a", "b"])
+    # a new group only reads the entries added from now on, unless it replays the stream
+    assert _consume(consumer, "tb-1", 2, replay_from="0") == ["a", "b"]
+    # the existing group is moved back to the start of the stream
+    assert _consume(consumer, "tb-2", 2, replay_from="0") == ["a", "b"]
+
+
+def test_stream_backlog(fake_server):
+    producer = _stream_client(fake_server, stream_max_lag=2)
+    assert producer._stream_backlog("headlines_sentiment") == 0
+    producer._create_group("headlines_sentiment", "trading_bot")
+    _publish(producer, ["a", "b"])
+    assert producer._stream_backlog("headlines_sentiment") == 2
+    producer.client.xreadgroup(
+        "trading_bot", "tb-1", {"headlines_sentiment": ">"}, count=1
+    )
+    # read but not acknowledged entries are still part of the backlog
+    assert producer._stream_backlog("headlines_sentiment") == 2
+
+
+def test_consume_several_streams(fake_server):
+    producer = _stream_client(fake_server)
+    consumer = _stream_client(fake_server)
+    consumer._create_group("headlines_sentiment_btc", "trading_bot")
+    consumer._create_group("headlines_sentiment_eth", "trading_bot")
+    for channel in ["headlines_sentiment_btc", "headlines_sentiment_eth"]:
+        producer.publish_event(
+            channel, 0, "Source", 1, 1, "h", "bullish", channel=channel
+        )
+    event_ids = _consume(
+        consumer,
+        "tb-1",
+        2,
+        streams=["headlines_sentiment_btc", "headlines_sentiment_eth"],
+    )
+    assert sorted(event_ids) == ["headlines_sentiment_btc", "headlines_sentiment_eth"]
+
+
+def test_consumer_defers_the_acknowledgement(fake_server):
+    producer = _stream_client(fake_server)
+    consumer = _stream_client(fake_server)
+    consumer._create_group("headlines_sentiment", "trading_bot")
+    _publish(producer, ["a", "b"])
+    events = []
+
+    def event_handler(event):
+        events.append(event)
+        if len(events) == 2:
+            raise StopConsuming
+
+    with pytest.raises(StopConsuming):
+        consumer.consume_stream(
+            event_handler, "trading_bot", "tb-1", block_ms=10, defer_ack=True
+        )
+    pending = consumer.client.xpending("headlines_sentiment", "trading_bot")
+    assert pending["pending"] == 2
+    events[0]["ack"]()
+    pending = consumer.client.xpending("headlines_sentiment", "trading_bot")
+    assert pending["pending"] == 1
@@ -0,0 +1,73 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from aitradingprototype.sg.async_pipeline import AsyncPipeline
+
+
+def test_results_keep_input_order():
+    lines = [f"line {i}" for i in range(20)]
+
+    async def worker(line):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        return line.upper()
+
+    results = []
+    asyncio.run(AsyncPipeline(worker, results.append, 5).run(lines))
+    assert results == [line.upper() for line in lines]
+
+
+def test_in_flight_lines_are_bounded():
+    max_in_flight = 3
+    in_flight = 0
+    peak = 0
+
+    async def worker(line):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.005)
+        in_flight -= 1
+        return line
+
+    results = []
+    asyncio.run(AsyncPipeline(worker, results.append, max_in_flight).run(range(1, 30)))
+    assert len(results) == 29
+    assert peak == max_in_flight
+
+
+def test_empty_lines():
+    async def worker(line):
+        return line
+
+    results = []
+    asyncio.run(AsyncPipeline(worker, results.append, 2).run([]))
+    assert results == []
+
+
+def test_worker_error_is_raised_alone(caplog):
+    def slow_lines():
+        for i in range(10):
+            time.sleep(0.01)
+            yield f"line {i}"
+
+    async def worker(line):
+        if line == "line 2":
+            raise ValueError("worker error")
+        await asyncio.sleep(0.05)
+        return line
+
+    thread_errors = []
+    excepthook = threading.excepthook
+    threading.excepthook = thread_errors.append
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(AsyncPipeline(worker, lambda result: None, 3).run(slow_lines()))
+        time.sleep(0.1)  # the reader thread gets the next line after the loop stopped
+    finally:
+        threading.excepthook = excepthook
+    assert not thread_errors
+    assert not [r for r in caplog.records if r.name == "asyncio"]
@@ -0,0 +1,56 @@
+import random
+import time
+from unittest.mock import MagicMock
+
+from aitradingprototype.common.metrics import Metrics
+from aitradingprototype.sg import SentimentGenerator
+from aitradingprototype.sg.backfill import line_aligned_chunks
+
+
+def test_line_aligned_chunks():
+    data = b"first line\nsecond\nthird line\nlast"
+    chunks = line_aligned_chunks(data, 8)
+    assert chunks == [(0, 11), (11, 29), (29, 33)]
+    # the chunks cover all the data, and only the last one doesn't end with a newline
+    assert b"".join(data[start:end] for start, end in chunks) == data
+    assert line_aligned_chunks(data, 1 << 20) == [(0, len(data))]
+    assert line_aligned_chunks(b"", 8) == []
+
+
+def test_backfill_writes_ordered_sentiments(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    headlines_file = tmp_path / "headlines.csv"
+    headlines_file.write_text(
+        "".join(f'"Source","{i}","{i}","headline {i}"\n' for i in range(200))
+    )
+    config = {
+        "asset": "BTC",
+        "headlines_file": str(headlines_file),
+        "output_option": "file",
+        "openai_api_key": "MOCK_OPENAI_API_KEY",
+        "reqs_min": 3,
+        "batch_size": 3,
+        "backfill": {"workers": 4, "chunk_size": 256},
+    }
+    sg = SentimentGenerator(config)
+    metrics = Metrics()
+    monkeypatch.setattr("aitradingprototype.sg.sentiment_generator.metrics", metrics)
+
+    def request_asset_sentiments(headlines, assets):
+        time.sleep(random.uniform(0, 0.01))  # the batches complete out of order
+        return [{"BTC": headline.split()[-1]} for headline in headlines]
+
+    sg.openai = MagicMock()
+    sg.openai.request_asset_sentiments.side_effect = request_asset_sentiments
+    sg.openai.request_sentiment.side_effect = lambda headline, asset: headline.split()[
+        -1
+    ]
+    sg.backfill()
+
+    output_file = tmp_path / "output" / "sentiments_btc.csv"
+    assert output_file.read_text().splitlines() == [
+        f'"Source","{i}","{i}","headline {i}","{i}"' for i in range(200)
+    ]
+    # the historical headlines don't skew the live read stage
+    assert metrics.histogram("aitp_stage_seconds", stage="backfill_read").count == 200
+    assert metrics.histogram("aitp_stage_seconds", stage="read").count == 0
@@ -0,0 +1,58 @@
+from aitradingprototype.sg.headline_deduplicator import HeadlineDeduplicator
+
+
+def test_near_duplicate_is_tagged_with_original_event_id():
+    deduplicator = HeadlineDeduplicator(window=600, similarity=0.7)
+    assert (
+        deduplicator.find_duplicate(
+            "Bitcoin dips after the SEC reportedly says recent ETF applications from BlackRock and Fidelity are inadequate",
+            "event-1",
+            0,
+        )
+        is None
+    )
+    assert (
+        deduplicator.find_duplicate(
+            "Bitcoin dips after SEC reportedly says recent ETF applications from BlackRock, Fidelity are inadequate",
+            "event-2",
+            60,
+        )
+        == "event-1"
+    )
+
+
+def test_different_headlines_are_not_duplicates():
+    deduplicator = HeadlineDeduplicator(window=600, similarity=0.7)
+    headlines = [
+        "Twitter rival Damus will be removed from the App Store over Bitcoin tipping",
+        "SEC says spot bitcoin ETF filings are inadequate - WSJ",
+        "Ethereum staking withdrawals rise after Shanghai upgrade",
+    ]
+    for i, headline in enumerate(headlines):
+        assert deduplicator.find_duplicate(headline, f"event-{i}", i) is None
+
+
+def test_duplicates_outside_window_are_originals():
+    deduplicator = HeadlineDeduplicator(window=60)
+    assert deduplicator.find_duplicate("SEC sues Binance", "event-1", 0) is None
+    assert deduplicator.find_duplicate("SEC sues Binance", "event-2", 61) is None
+    assert deduplicator.find_duplicate("SEC sues Binance", "event-3", 62) == "event-2"
+
+
+def test_index_is_bounded():
+    deduplicator = HeadlineDeduplicator(window=600, max_entries=10)
+    for i in range(100):
+        deduplicator.find_duplicate(
+            f"headline number {i} about token {i * 7}", str(i), i
+        )
+    assert len(deduplicator._entries) == 10
+    assert len(deduplicator._entries_by_event_id) == 10
+    assert all(len(ids) <= 10 for ids in deduplicator._band_index.values())
+
+
+def test_original_sentiments_are_kept():
+    deduplicator = HeadlineDeduplicator()
+    deduplicator.find_duplicate("SEC sues Binance", "event-1", 0)
+    deduplicator.set_sentiments("event-1", {"BTC": "bearish"})
+    assert deduplicator.get_sentiments("event-1") == {"BTC": "bearish"}
+    assert deduplicator.get_sentiments("event-2") is None
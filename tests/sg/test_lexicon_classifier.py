@@ -0,0 +1,47 @@
+import pytest
+
+from aitradingprototype.sg.classifier import LexiconClassifier
+
+
+@pytest.fixture
+def sentiments_file(tmp_path):
+    lines = [
+        '"NewsAPI","1","1","Bitcoin surges to new record high","bullish"',
+        '"NewsAPI","2","2","Bitcoin rallies on ETF approval","bullish"',
+        '"NewsAPI","3","3","Bitcoin surges after ETF approval","bullish"',
+        '"NewsAPI","4","4","Bitcoin plunges as exchange hacked","bearish"',
+        '"NewsAPI","5","5","Bitcoin crashes after SEC lawsuit","bearish"',
+        '"NewsAPI","6","6","Bitcoin plunges after exchange lawsuit","bearish"',
+        "",
+        '"NewsAPI","7","7","Conference schedule announced","unknown"',
+    ]
+    file_path = tmp_path / "sentiments_btc.csv"
+    file_path.write_text("\n".join(lines) + "\n")
+    return str(file_path)
+
+
+def test_classify_confident_headlines(sentiments_file):
+    classifier = LexiconClassifier()
+    classifier.train_from_files("BTC", [sentiments_file])
+
+    sentiment, confidence = classifier.classify("Bitcoin surges on ETF approval", "BTC")
+    assert sentiment == "bullish"
+    assert confidence > 0.9
+
+    sentiment, confidence = classifier.classify("Bitcoin plunges after hack", "btc")
+    assert sentiment == "bearish"
+    assert confidence > 0.7
+
+
+def test_unknown_words_have_low_confidence(sentiments_file):
+    classifier = LexiconClassifier()
+    classifier.train_from_files("BTC", [sentiments_file])
+
+    _, confidence = classifier.classify("Completely unrelated words", "BTC")
+    assert confidence < 0.5
+
+
+def test_no_model_for_asset(sentiments_file):
+    classifier = LexiconClassifier()
+    classifier.train_from_files("BTC", [sentiments_file])
+    assert classifier.classify("Bitcoin surges", "ETH") == (None, 0.0)
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+from aitradingprototype.sg.line_batcher import LineBatcher
+
+
+def test_full_batches():
+    batches = list(LineBatcher(3, 10).batches(range(7)))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_batch_emitted_after_max_wait():
+    def slow_lines():
+        yield "a"
+        yield "b"
+        time.sleep(0.3)
+        yield "c"
+
+    start = time.monotonic()
+    batches = LineBatcher(10, 0.05).batches(slow_lines())
+    assert next(batches) == ["a", "b"]
+    assert time.monotonic() - start < 0.3
+    assert list(batches) == [["c"]]
+
+
+def test_reading_error_is_raised():
+    def failing_lines():
+        yield "a"
+        raise ValueError("read error")
+
+    with pytest.raises(ValueError):
+        list(LineBatcher(10, 1).batches(failing_lines()))
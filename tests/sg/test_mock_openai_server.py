@@ -0,0 +1,82 @@
+import openai
+import pytest
+
+from aitradingprototype.sg import SentimentGenerator
+from aitradingprototype.sg.mock_openai_server import label_for, start_server
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """
+    Start a mock OpenAI server with injected errors, restoring the OpenAI API base after the test
+    """
+    monkeypatch.setattr(openai, "api_base", openai.api_base)
+    server = start_server(
+        latency=0.01,
+        distribution="exponential",
+        error_rate=0.1,
+        rate_limit_rate=0.2,
+        retry_after=0,
+        seed=1,
+    )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _generate(server, tmp_path, assets, **config):
+    headlines_file = tmp_path / "headlines.csv"
+    headlines = [f"headline {i}" for i in range(30)]
+    headlines_file.write_text(
+        "".join(
+            f'"Source","{i}","{i}","{headline}"\n'
+            for i, headline in enumerate(headlines)
+        )
+    )
+    sg = SentimentGenerator(
+        {
+            "asset": assets,
+            "headlines_file": str(headlines_file),
+            "openai_api_key": "MOCK_OPENAI_API_KEY",
+            "openai_api_base": f"http://127.0.0.1:{server.server_port}/v1",
+            "reqs_min": 10**6,
+            "api_retries": 10,
+            "api_retry_wait": 0.01,
+            **config,
+        }
+    )
+    results = []
+    sg.generate_sentiments(headlines_file.read_text().splitlines(), results.append)
+    return headlines, results, sg
+
+
+@pytest.mark.parametrize(
+    "config",
+    [{}, {"batch_size": 4}, {"max_concurrent_requests": 4, "batch_size": 3}],
+)
+def test_pipeline_against_mock_server(mock_server, tmp_path, config):
+    headlines, results, sg = _generate(mock_server, tmp_path, "BTC", **config)
+    assert [result["sentiment_line"] for result in results] == [
+        f'"Source","{i}","{i}","{headline}","{label_for(headline, "BTC")}"'
+        for i, headline in enumerate(headlines)
+    ]
+    # the injected errors were retried
+    stats = mock_server.stats()
+    assert stats["errors"] + stats["rate_limited"] == sg.openai.api_errors > 0
+
+
+def test_multi_asset_pipeline_against_mock_server(mock_server, tmp_path):
+    headlines, results, _ = _generate(
+        mock_server, tmp_path, ["BTC", "ETH"], batch_size=5
+    )
+    assert [result["sentiment_line"].rsplit(",", 1)[1] for result in results] == [
+        f'"{label_for(headline, asset)}"'
+        for headline in headlines
+        for asset in ("BTC", "ETH")
+    ]
+
+
+def test_failed_request_is_raised_after_the_retries(mock_server, tmp_path):
+    mock_server.error_rate = 1.0
+    with pytest.raises(openai.error.APIError):
+        _generate(mock_server, tmp_path, "BTC", api_retries=1)
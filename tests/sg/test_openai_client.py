@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+import pytest
+
+from aitradingprototype.common import RateLimiter
+from aitradingprototype.sg import OpenAiClient
+from aitradingprototype.sg.sentiment_cache import SentimentCache
+
+
+def chat_completion(content):
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+@pytest.fixture
+def openai_client():
+    return OpenAiClient("MOCK_OPENAI_API_KEY", num_requests=100)
+
+
+def test_detect_sentiments_in_headlines_order(openai_client):
+    with patch(
+        "openai.ChatCompletion.create",
+        return_value=chat_completion("2: bearish\n1: bullish\n3: unknown."),
+    ):
+        sentiments = openai_client.detect_sentiments(["a", "b", "c"], "BTC")
+    assert sentiments == ["bullish", "bearish", "unknown"]
+
+
+def test_detect_sentiments_with_malformed_labels(openai_client):
+    content = "1: bullish\n2: moon\n3 bearish\n4: bearish\n4: bullish\n7: bearish"
+    with patch("openai.ChatCompletion.create", return_value=chat_completion(content)):
+        sentiments = openai_client.detect_sentiments(["a", "b", "c", "d"], "BTC")
+    assert sentiments == ["bullish", None, None, None]
+
+
+def test_request_sentiments_asks_again_only_malformed(openai_client):
+    responses = [
+        chat_completion("1: bullish\n2: ???\n3: bearish"),
+        chat_completion("1: unknown"),
+    ]
+    with patch("openai.ChatCompletion.create", side_effect=responses) as create:
+        sentiments = openai_client.request_sentiments(["a", "b", "c"], "BTC")
+    assert sentiments == ["bullish", "unknown", "bearish"]
+    assert create.call_count == 2
+    retry_user_content = create.call_args.kwargs["messages"][-1]["content"]
+    assert "1. b" in retry_user_content
+    assert "a" not in retry_user_content.splitlines()[1:]
+
+
+def test_request_sentiments_gives_up_after_retries(openai_client):
+    with patch(
+        "openai.ChatCompletion.create", return_value=chat_completion("nothing")
+    ) as create:
+        sentiments = openai_client.request_sentiments(["a", "b"], "BTC")
+    assert sentiments == ["unknown", "unknown"]
+    assert create.call_count == 1 + openai_client.batch_retries
+
+
+def test_cache_hit_skips_request_and_rate_limit(tmp_path):
+    cache = SentimentCache(str(tmp_path / "sentiments.db"))
+    openai_client = OpenAiClient("MOCK_OPENAI_API_KEY", num_requests=100, cache=cache)
+    with patch(
+        "openai.ChatCompletion.create", return_value=chat_completion("bullish")
+    ) as create:
+        assert openai_client.request_sentiment("headline", "BTC") == "bullish"
+        assert openai_client.request_sentiment("Headline ", "BTC") == "bullish"
+    assert create.call_count == 1
+    assert openai_client.min_rate_limiter.stats()["calls"] == 1
+
+
+def test_batch_requests_only_cache_misses(tmp_path):
+    cache = SentimentCache(str(tmp_path / "sentiments.db"))
+    openai_client = OpenAiClient("MOCK_OPENAI_API_KEY", num_requests=100, cache=cache)
+    with patch("openai.ChatCompletion.create", return_value=chat_completion("bearish")):
+        openai_client.request_sentiment("b", "BTC")
+    with patch(
+        "openai.ChatCompletion.create",
+        return_value=chat_completion("1: bullish\n2: unknown"),
+    ) as create:
+        sentiments = openai_client.request_sentiments(["a", "b", "c"], "BTC")
+    assert sentiments == ["bullish", "bearish", "unknown"]
+    user_content = create.call_args.kwargs["messages"][-1]["content"]
+    assert user_content.splitlines()[1:] == ["1. a", "2. c"]
+
+
+def test_detect_asset_sentiments_in_single_request(openai_client):
+    content = "1 BTC: bullish\n1 ETH: bearish\n2 btc: unknown\n2 ETH: moon"
+    with patch(
+        "openai.ChatCompletion.create", return_value=chat_completion(content)
+    ) as create:
+        sentiments = openai_client.detect_asset_sentiments(["a", "b"], ["BTC", "ETH"])
+    assert sentiments == [
+        {"BTC": "bullish", "ETH": "bearish"},
+        {"BTC": "unknown", "ETH": None},
+    ]
+    assert create.call_count == 1
+
+
+def test_request_asset_sentiments_asks_again_only_malformed(openai_client):
+    responses = [
+        chat_completion("1 BTC: bullish\n1 ETH: bearish\n2 BTC: unknown"),
+        chat_completion("1: bullish"),
+    ]
+    with patch("openai.ChatCompletion.create", side_effect=responses) as create:
+        sentiments = openai_client.request_asset_sentiments(["a", "b"], ["BTC", "ETH"])
+    assert sentiments == [
+        {"BTC": "bullish", "ETH": "bearish"},
+        {"BTC": "unknown", "ETH": "bullish"},
+    ]
+    retry_user_content = create.call_args.kwargs["messages"][-1]["content"]
+    assert retry_user_content.splitlines() == [
+        'For each of these headlines, generate sentiment about "ETH":',
+        "1. b",
+    ]
+
+
+def test_tokens_budget():
+    openai_client = OpenAiClient(
+        "MOCK_OPENAI_API_KEY", rate_limiter=RateLimiter(100, 60, max_tokens=100)
+    )
+    with pytest.raises(ValueError):
+        openai_client.check_tokens_budget(10, ["BTC", "ETH"])
+    openai_client.check_tokens_budget(2, ["BTC"])
+
+    with patch("openai.ChatCompletion.create", return_value=chat_completion("bullish")):
+        assert (
+            openai_client.request_sentiment("long headline " * 100, "BTC") == "bullish"
+        )
+    assert openai_client.min_rate_limiter.stats()["calls"] == 1
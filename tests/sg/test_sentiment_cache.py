@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from aitradingprototype.sg.sentiment_cache import SentimentCache
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / "cache" / "sentiments.db")
+
+
+def test_key_is_normalized():
+    key = SentimentCache.build_key("Bitcoin  ETF approved", "BTC", "gpt-3.5-turbo", 1)
+    assert key == SentimentCache.build_key(
+        " bitcoin etf Approved ", "btc", "gpt-3.5-turbo", 1
+    )
+    assert key != SentimentCache.build_key(
+        "Bitcoin ETF approved", "ETH", "gpt-3.5-turbo", 1
+    )
+    assert key != SentimentCache.build_key("Bitcoin ETF approved", "BTC", "gpt-4", 1)
+    assert key != SentimentCache.build_key(
+        "Bitcoin ETF approved", "BTC", "gpt-3.5-turbo", 2
+    )
+
+
+def test_hits_and_misses(cache_file):
+    cache = SentimentCache(cache_file)
+    assert cache.get("key") is None
+    cache.put("key", "bullish")
+    assert cache.get("key") == "bullish"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_persists_across_restarts(cache_file):
+    cache = SentimentCache(cache_file)
+    cache.put("key", "bearish")
+    cache.close()
+
+    cache = SentimentCache(cache_file)
+    assert cache.get("key") == "bearish"
+
+
+def test_memory_tier_is_lru(cache_file):
+    cache = SentimentCache(cache_file, memory_size=2)
+    cache.put("a", "bullish")
+    cache.put("b", "bullish")
+    cache.get("a")
+    cache.put("c", "bullish")
+    assert cache.stats()["memory_entries"] == 2
+    assert "a" in cache._memory
+    assert "b" not in cache._memory
+    # evicted from memory, but still on disk
+    assert cache.get("b") == "bullish"
+
+
+def test_expired_entries(cache_file):
+    cache = SentimentCache(cache_file, ttl=0.05)
+    cache.put("key", "bullish")
+    time.sleep(0.1)
+    assert cache.get("key") is None
+
+
+def test_disk_tier_max_size(cache_file):
+    cache = SentimentCache(cache_file, memory_size=1, max_size=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, "bullish")
+    cache.close()
+
+    cache = SentimentCache(cache_file, max_size=2)
+    assert cache.get("a") is None
+    assert cache.get("b") == "bullish"
+    assert cache.get("c") == "bullish"
@@ -1,3 +1,6 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -23,6 +26,11 @@ def sample_config():
     }
 
 
+@asynccontextmanager
+async def _null_async_context():
+    yield
+
+
 @pytest.fixture
 def headline_file_line():
     """
@@ -121,3 +129,262 @@ def test_push_redis(sample_config, headline_file_line):
 
     # Call the push_redis method
     sg.push_redis()
+    # the events carry the headline read time, to measure the whole pipeline
+    for call in mock_redis_client.publish_event.call_args_list:
+        assert call.kwargs["read_time"] <= call.args[1]
+
+
+def test_generate_sentiments_with_concurrent_requests(sample_config):
+    config = sample_config
+    config["max_concurrent_requests"] = 4
+    sg = SentimentGenerator(config)
+
+    # Mock openai_client to return the sentiment after a delay
+    async def request_sentiment(headline, asset):
+        await asyncio.sleep(0.01 if headline == "headline 0" else 0)
+        return "bullish"
+
+    mock_openai_client = MagicMock()
+    mock_openai_client.arequest_sentiment = request_sentiment
+    mock_openai_client.session = _null_async_context
+    sg.openai = mock_openai_client
+
+    lines = [
+        f'"Source","1697262400000","1687262400000","headline {i}"' for i in range(3)
+    ]
+    sentiment_lines = []
+    sg.generate_sentiments(
+        lines, lambda result: sentiment_lines.append(result["sentiment_line"])
+    )
+
+    assert sentiment_lines == [line + ',"bullish"' for line in lines]
+
+
+def test_generate_sentiments_in_batches(sample_config):
+    config = sample_config
+    config["batch_size"] = 2
+    config["batch_max_wait"] = 1
+    sg = SentimentGenerator(config)
+
+    # Mock openai_client to return one sentiment per headline of the batch
+    mock_openai_client = MagicMock()
+    mock_openai_client.request_asset_sentiments.side_effect = (
+        lambda headlines, assets: [{"BTC": "bearish"}] * len(headlines)
+    )
+    mock_openai_client.request_sentiment.return_value = "bullish"
+    sg.openai = mock_openai_client
+
+    lines = [
+        f'"Source","1697262400000","1687262400000","headline {i}"' for i in range(3)
+    ]
+    sentiment_lines = []
+    sg.generate_sentiments(
+        lines, lambda result: sentiment_lines.append(result["sentiment_line"])
+    )
+
+    assert sentiment_lines == [
+        lines[0] + ',"bearish"',
+        lines[1] + ',"bearish"',
+        lines[2] + ',"bullish"',
+    ]
+    mock_openai_client.request_asset_sentiments.assert_called_once_with(
+        ["headline 0", "headline 1"], ["BTC"]
+    )
+
+
+def test_multi_asset_sentiments(sample_config):
+    config = sample_config
+    config["asset"] = ["BTC", "ETH"]
+    sg = SentimentGenerator(config)
+
+    # Mock openai_client to return a sentiment per asset
+    mock_openai_client = MagicMock()
+    mock_openai_client.request_asset_sentiments.return_value = [
+        {"BTC": "bullish", "ETH": "bearish"}
+    ]
+    sg.openai = mock_openai_client
+
+    line = '"Source","1697262400000","1687262400000","headline"'
+    sentiment_lines = []
+    sg.generate_sentiments(
+        [line],
+        lambda result: sentiment_lines.append(
+            (result["asset"], result["sentiment_line"])
+        ),
+    )
+
+    assert sentiment_lines == [
+        ("BTC", line + ',"bullish"'),
+        ("ETH", line + ',"bearish"'),
+    ]
+    mock_openai_client.request_asset_sentiments.assert_called_once_with(
+        ["headline"], ["BTC", "ETH"]
+    )
+    assert sg._redis_channel("ETH") == "headlines_sentiment_eth"
+
+
+def test_push_redis_multi_asset(sample_config, headline_file_line):
+    config = sample_config
+    config["asset"] = ["BTC", "ETH"]
+    sg = SentimentGenerator(config)
+
+    mock_headlines_file_operator = MagicMock()
+    mock_headlines_file_operator.follow_line.return_value = [headline_file_line]
+    sg.headlines_file_operator = mock_headlines_file_operator
+
+    mock_openai_client = MagicMock()
+    mock_openai_client.request_asset_sentiments.return_value = [
+        {"BTC": "bullish", "ETH": "bearish"}
+    ]
+    sg.openai = mock_openai_client
+
+    mock_redis_client = MagicMock()
+    sg.redis = mock_redis_client
+
+    sg.push_redis()
+
+    published = [
+        (call.kwargs["asset"], call.kwargs["channel"], call.args[-1])
+        for call in mock_redis_client.publish_event.call_args_list
+    ]
+    assert published == [
+        ("BTC", "headlines_sentiment_btc", "bullish"),
+        ("ETH", "headlines_sentiment_eth", "bearish"),
+    ]
+
+
+def test_near_duplicate_headlines(sample_config):
+    config = sample_config
+    config["headline_dedup"] = {"window": 600, "similarity": 0.7, "action": "tag"}
+    sg = SentimentGenerator(config)
+
+    # Mock openai_client to return a predefined sentiment
+    mock_openai_client = MagicMock()
+    mock_openai_client.request_sentiment.return_value = "bearish"
+    sg.openai = mock_openai_client
+
+    lines = [
+        '"NewsAPI","1697262400000","1687262400000","SEC says spot bitcoin ETF filings are inadequate - WSJ"',
+        '"Other","1697262460000","1687262460000","SEC says spot Bitcoin ETF filings are inadequate: WSJ"',
+        '"NewsAPI","1697262520000","1687262520000","Ethereum upgrade goes live on mainnet"',
+    ]
+    results = []
+    sg.generate_sentiments(lines, results.append)
+
+    assert mock_openai_client.request_sentiment.call_count == 2
+    assert results[1]["duplicate_of"] == results[0]["event_id"]
+    assert results[1]["sentiment_line"].endswith(',"bearish"')
+    assert results[0]["duplicate_of"] is None
+    assert results[2]["duplicate_of"] is None
+
+    # dropped instead of tagged
+    config["headline_dedup"]["action"] = "drop"
+    sg = SentimentGenerator(config)
+    sg.openai = mock_openai_client
+    results = []
+    sg.generate_sentiments(lines, results.append)
+    assert [result["duplicate_of"] for result in results] == [None, None]
+
+
+def test_local_classifier_escalates_when_unsure(sample_config, tmp_path):
+    sentiments_file = tmp_path / "sentiments_btc.csv"
+    sentiments_file.write_text(
+        '"NewsAPI","1","1","Bitcoin surges to record high","bullish"\n'
+        '"NewsAPI","2","2","Bitcoin surges on ETF approval","bullish"\n'
+        '"NewsAPI","3","3","Bitcoin plunges after hack","bearish"\n'
+    )
+    config = sample_config
+    config["local_classifier"] = {
+        "training_files": {"BTC": [str(sentiments_file)]},
+        "min_confidence": 0.8,
+    }
+    sg = SentimentGenerator(config)
+
+    # Mock openai_client to return a predefined sentiment
+    mock_openai_client = MagicMock()
+    mock_openai_client.request_sentiment.return_value = "unknown"
+    sg.openai = mock_openai_client
+
+    lines = [
+        '"Source","1697262400000","1687262400000","Bitcoin surges to record high"',
+        '"Source","1697262400000","1687262400000","Mining difficulty adjusts"',
+    ]
+    results = []
+    sg.generate_sentiments(lines, results.append)
+
+    assert [result["classified_by"] for result in results] == ["local", "openai"]
+    assert results[0]["sentiment_line"].endswith(',"bullish"')
+    assert results[1]["sentiment_line"].endswith(',"unknown"')
+    assert all(result["classification_latency_ms"] >= 0 for result in results)
+    mock_openai_client.request_sentiment.assert_called_once_with(
+        "Mining difficulty adjusts", "BTC"
+    )
+
+
+class StopGenerating(Exception):
+    pass
+
+
+def test_write_file_resumes_from_checkpoint(sample_config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    headlines_file = tmp_path / "headlines.csv"
+    headlines_file.write_text(
+        '"Source","1","1","first"\n"Source","2","2","second"\n"Source","3","3","third"\n'
+    )
+    config = sample_config
+    config["headlines_file"] = str(headlines_file)
+    config["checkpoint"] = {"file": str(tmp_path / "sg_checkpoint.json")}
+    output_file = tmp_path / "output" / "sentiments_btc.csv"
+
+    def run(sentiments, read_from="checkpoint"):
+        config["read_from"] = read_from
+        sg = SentimentGenerator(config)
+        sg.openai = MagicMock()
+        sg.openai.request_sentiment.side_effect = sentiments + [StopGenerating]
+        with pytest.raises(StopGenerating):
+            sg.start()
+        return output_file.read_text().splitlines()
+
+    assert run(["bullish"]) == ['"Source","1","1","first","bullish"']
+    # resumed after "first", the output file is appended
+    assert run(["bearish"]) == [
+        '"Source","1","1","first","bullish"',
+        '"Source","2","2","second","bearish"',
+    ]
+    # read again from the start, the output file is replaced
+    assert run(["bearish"], read_from="start") == ['"Source","1","1","first","bearish"']
+
+
+def test_buffered_events_published_before_checkpoint_save(
+    sample_config, tmp_path, monkeypatch
+):
+    headlines_file = tmp_path / "headlines.csv"
+    headlines_file.write_text(
+        '"Source","1","1","first"\n"Source","2","2","second"\n"Source","3","3","third"\n'
+    )
+    config = sample_config
+    config["headlines_file"] = str(headlines_file)
+    config["output_option"] = "redis"
+    config["reqs_min"] = 600
+    config["checkpoint"] = {
+        "file": str(tmp_path / "sg_checkpoint.json"),
+        "every_lines": 1,
+    }
+    calls = []
+    replace = os.replace
+
+    def save(source, destination):
+        calls.append("save")
+        replace(source, destination)
+
+    monkeypatch.setattr("aitradingprototype.common.checkpoint.os.replace", save)
+    sg = SentimentGenerator(config)
+    sg.openai = MagicMock()
+    sg.openai.request_sentiment.side_effect = ["bullish", "bearish", StopGenerating]
+    sg.redis = MagicMock()
+    sg.redis.publish_event.side_effect = lambda *args, **kwargs: calls.append("publish")
+    sg.redis.flush_events.side_effect = lambda: calls.append("flush")
+    with pytest.raises(StopGenerating):
+        sg.start()
+    # a headline position is saved once its buffered event is published
+    assert calls == ["publish", "flush", "save", "publish", "flush", "save"]
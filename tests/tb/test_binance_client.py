@@ -0,0 +1,110 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from binance.error import ClientError
+
+from aitradingprototype.tb.binance_client import BinanceClient
+from aitradingprototype.tb.filter_manager import FilterManager
+from aitradingprototype.tb.mock_binance_server import start_server
+from tests.tb.test_filter_manager import _exchange_info
+
+
+def _binance_client(exchange_filters=None):
+    with patch("aitradingprototype.tb.binance_client.Client") as MockClient:
+        binance = BinanceClient(
+            "https://testnet.binance.vision",
+            {"symbol": "BTCUSDT", "base_asset": "BTC"},
+            "api_key",
+            "secret_key",
+            exchange_filters=exchange_filters,
+        )
+    client = MockClient.return_value
+    client.exchange_info.return_value = _exchange_info(["BTCUSDT"])
+    client.ticker_price.return_value = {"price": "25000"}
+    client.new_order.return_value = {
+        "side": "BUY",
+        "fills": [{"price": "26000", "qty": "0.00123"}],
+    }
+    return binance, client
+
+
+def _order(quantity):
+    return {"symbol": "BTCUSDT", "side": "BUY", "type": "MARKET", "quantity": quantity}
+
+
+def test_order_rejected_before_posting():
+    binance, client = _binance_client()
+    assert binance.post_order(_order(0.0003)) is None
+    assert binance.post_order(_order(0.000001)) is None
+    client.new_order.assert_not_called()
+    # the price is fetched once within price_ttl
+    client.ticker_price.assert_called_once_with("BTCUSDT")
+
+
+def test_order_quantity_rounded_to_step_size():
+    binance, client = _binance_client()
+    binance.post_order(_order(0.0012345))
+    client.new_order.assert_called_once_with(**_order("0.00123"))
+    # the fill price is the recent price
+    assert binance.recent_price() == "26000"
+    client.ticker_price.assert_called_once()
+
+
+def test_pre_trade_check_disabled():
+    binance, client = _binance_client({"pre_trade_check": False})
+    binance.post_order(_order(0.0003))
+    client.new_order.assert_called_once_with(**_order(0.0003))
+    client.exchange_info.assert_not_called()
+
+
+def test_order_error_is_raised():
+    binance, client = _binance_client()
+    client.new_order.side_effect = ClientError(
+        400, -2010, "Account has insufficient balance", {}
+    )
+    with pytest.raises(ClientError):
+        binance.post_order(_order(0.001))
+
+
+def test_order_transports():
+    server = start_server(secret_key="secret_key")
+    for websocket_api in (
+        None,
+        {"url": f"ws://127.0.0.1:{server.server_port}/ws-api/v3"},
+    ):
+        binance = BinanceClient(
+            f"http://127.0.0.1:{server.server_port}",
+            {"symbol": "BTCUSDT", "base_asset": "BTC"},
+            "api_key",
+            "secret_key",
+            exchange_filters={"pre_trade_check": False},
+            websocket_api=websocket_api,
+        )
+        response = binance.post_order(_order("0.001"))
+        assert response["executedQty"] == "0.001"
+        # the NOTIONAL error of the exchange is handled as before
+        binance._set_price("25000")
+        binance.fm = FilterManager("BTCUSDT", _exchange_info(["BTCUSDT"]))
+        assert binance.post_order(_order("0.0001")) is None
+        binance.close()
+    assert server.stats()["orders"] == 2
+    assert server.stats()["connections"] == 1
+    server.shutdown()
+    server.server_close()
+
+
+def test_warm_up(caplog):
+    binance, client = _binance_client()
+    client.time.return_value = {"serverTime": int(time.time() * 1000) + 5000}
+    with caplog.at_level("WARNING"):
+        binance.warm_up()
+    # the clock offset is measured halfway through the request
+    assert 4900 <= binance.time_offset <= 5100
+    assert "off the Binance server time" in caplog.text
+    client.exchange_info.assert_called_once_with(symbols=["BTCUSDT"])
+    client.ticker_price.assert_called_once_with("BTCUSDT")
+    # the first order doesn't fetch anything
+    binance.post_order(_order(0.001))
+    client.exchange_info.assert_called_once()
+    client.ticker_price.assert_called_once()
@@ -0,0 +1,121 @@
+import json
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+from aitradingprototype.tb.filter_manager import ExchangeInfoCache, FilterManager
+
+
+def _exchange_info(symbols, min_notional="10.00000000"):
+    return {
+        "symbols": [
+            {
+                "symbol": symbol,
+                "filters": [
+                    {"filterType": "PRICE_FILTER", "tickSize": "0.01000000"},
+                    {
+                        "filterType": "LOT_SIZE",
+                        "minQty": "0.00001000",
+                        "maxQty": "9000.00000000",
+                        "stepSize": "0.00001000",
+                    },
+                    {"filterType": "NOTIONAL", "minNotional": min_notional},
+                ],
+            }
+            for symbol in symbols
+        ]
+    }
+
+
+def test_filters_lookup():
+    filter_manager = FilterManager("BTCUSDT", _exchange_info(["ETHUSDT", "BTCUSDT"]))
+    assert filter_manager.get_lot_size_filter()["stepSize"] == "0.00001000"
+    assert filter_manager.get_notional_filter("ETHUSDT")["minNotional"] == "10.00000000"
+    assert filter_manager.get_filter("MAX_NUM_ORDERS") is None
+    assert filter_manager.get_lot_size_filter("BNBUSDT") is None
+    assert filter_manager.calc_min_qty("25000") == Decimal("0.00040")
+
+
+def test_exchange_info_is_cached_on_disk(tmp_path):
+    cache_file = str(tmp_path / "exchange_info.json")
+    client = MagicMock()
+    client.exchange_info.return_value = _exchange_info(["BTCUSDT"])
+    assert ExchangeInfoCache(client, ["BTCUSDT"], cache_file).get() == _exchange_info(
+        ["BTCUSDT"]
+    )
+    client.exchange_info.assert_called_once_with(symbols=["BTCUSDT"])
+
+    # a restart reads the cache file
+    client = MagicMock()
+    assert ExchangeInfoCache(client, ["BTCUSDT"], cache_file).get() == _exchange_info(
+        ["BTCUSDT"]
+    )
+    client.exchange_info.assert_not_called()
+    # another symbol or an expired cache is fetched again
+    client.exchange_info.return_value = _exchange_info(["BTCUSDT", "ETHUSDT"])
+    ExchangeInfoCache(client, ["BTCUSDT", "ETHUSDT"], cache_file).get()
+    with open(cache_file) as file:
+        assert json.load(file)["symbols"] == ["BTCUSDT", "ETHUSDT"]
+    ExchangeInfoCache(client, ["BTCUSDT"], cache_file, ttl=0).get()
+    assert client.exchange_info.call_count == 2
+
+
+def test_background_refresh():
+    client = MagicMock()
+    client.exchange_info.return_value = _exchange_info(["BTCUSDT"], "5.00000000")
+    filter_manager = FilterManager("BTCUSDT", _exchange_info(["BTCUSDT"]))
+    filter_manager.start_refresh(ExchangeInfoCache(client, ["BTCUSDT"]), 0.01)
+    time.sleep(0.1)
+    filter_manager.stop_refresh()
+    assert filter_manager.get_notional_filter()["minNotional"] == "5.00000000"
+
+
+def test_validate_quantity():
+    filter_manager = FilterManager("BTCUSDT", _exchange_info(["BTCUSDT"]))
+    # rounded down to the stepSize
+    assert filter_manager.validate_quantity(0.0012345, "25000") == (
+        Decimal("0.00123"),
+        None,
+    )
+    quantity, reason = filter_manager.validate_quantity("0.000009")
+    assert quantity == Decimal("0") and "minQty" in reason
+    _, reason = filter_manager.validate_quantity(9001)
+    assert "maxQty" in reason
+    # 0.0003 * 25000 = 7.5 < 10
+    _, reason = filter_manager.validate_quantity(0.0003, "25000")
+    assert "minNotional" in reason and "0.0004" in reason
+    # without a price, the NOTIONAL filter isn't checked
+    assert filter_manager.validate_quantity(0.0003)[1] is None
+
+
+def test_validate_market_lot_size():
+    exchange_info = _exchange_info(["BTCUSDT"])
+    exchange_info["symbols"][0]["filters"].append(
+        {
+            "filterType": "MARKET_LOT_SIZE",
+            "minQty": "0.00000000",
+            "maxQty": "100.00000000",
+            "stepSize": "0.00000000",
+        }
+    )
+    filter_manager = FilterManager("BTCUSDT", exchange_info)
+    _, reason = filter_manager.validate_quantity(101)
+    assert "MARKET_LOT_SIZE maxQty" in reason
+    # the MARKET_LOT_SIZE filter only applies to MARKET orders
+    assert filter_manager.validate_quantity(101, order_type="LIMIT")[1] is None
+
+
+@pytest.mark.parametrize(
+    "content", ['{"fetched_time": ', '{"symbols": ["BTCUSDT"]}', "[]", "{}"]
+)
+def test_invalid_exchange_info_cache_is_fetched_again(tmp_path, content):
+    cache_file = tmp_path / "exchange_info.json"
+    cache_file.write_text(content)
+    client = MagicMock()
+    client.exchange_info.return_value = _exchange_info(["BTCUSDT"])
+    assert ExchangeInfoCache(client, ["BTCUSDT"], str(cache_file)).get() == (
+        _exchange_info(["BTCUSDT"])
+    )
+    client.exchange_info.assert_called_once()
@@ -0,0 +1,81 @@
+import threading
+from unittest.mock import MagicMock
+
+import fakeredis
+
+from aitradingprototype.common import RedisClient
+from aitradingprototype.tb.holding_ledger import HoldingLedger
+
+KEY = "aitp_successivestrategy_holding_qty_btc"
+
+
+def _redis_client(server) -> RedisClient:
+    redis_client = RedisClient("localhost", 6379, "channel")
+    redis_client.client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    return redis_client
+
+
+def test_add_is_exact():
+    redis_client = _redis_client(fakeredis.FakeServer())
+    for _ in range(3):
+        redis_client.add_to_key(KEY, 0.1)
+    assert redis_client.add_to_key(KEY, -0.000999) == 0.299001
+    assert redis_client.client.get(KEY) == "0.29900100"
+    # a value written by the previous versions
+    redis_client.set_key(KEY, 0.0009990000000000001)
+    assert redis_client.increment_key(KEY, 0.001) == 0.001999
+    assert redis_client.decrement_key(KEY, 0.001999) == 0.0
+
+
+def test_concurrent_updates_are_not_lost():
+    server = fakeredis.FakeServer()
+    ledgers = [HoldingLedger(_redis_client(server), KEY) for _ in range(4)]
+
+    def trade(ledger):
+        for _ in range(50):
+            ledger.add(0.001)
+            ledger.add(-0.0005)
+
+    threads = [threading.Thread(target=trade, args=(ledger,)) for ledger in ledgers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _redis_client(server).get_float_key(KEY) == 0.1
+
+
+def test_quantity_is_cached():
+    redis_client = _redis_client(fakeredis.FakeServer())
+    redis_client.get_float_key = MagicMock(wraps=redis_client.get_float_key)
+    ledger = HoldingLedger(redis_client, KEY)
+    assert ledger.quantity() == 0.0
+    ledger.add(0.001)
+    assert ledger.quantity() == ledger.quantity() == 0.001
+    # write-through, Redis is only read once
+    redis_client.get_float_key.assert_called_once_with(KEY)
+
+
+def test_cache_ttl_sees_the_other_bots_updates():
+    server = fakeredis.FakeServer()
+    ledger = HoldingLedger(_redis_client(server), KEY, cache_ttl=0)
+    other_ledger = HoldingLedger(_redis_client(server), KEY)
+    ledger.add(0.001)
+    other_ledger.add(0.002)
+    assert ledger.quantity() == 0.003
+
+    cached_ledger = HoldingLedger(_redis_client(server), KEY)
+    assert cached_ledger.quantity() == 0.003
+    other_ledger.add(0.002)
+    assert cached_ledger.quantity() == 0.003
+    cached_ledger.invalidate()
+    assert cached_ledger.quantity() == 0.005
+
+
+def test_redis_warm_up_loads_the_script():
+    server = fakeredis.FakeServer()
+    redis_client = _redis_client(server)
+    redis_client._event_client = fakeredis.FakeRedis(server=server)
+    redis_client.warm_up()
+    assert redis_client.client.script_exists(redis_client._add_decimal_script.sha) == [
+        True
+    ]
@@ -0,0 +1,30 @@
+import time
+
+import pytest
+
+from aitradingprototype.tb.netting_window import NettingWindow
+
+
+def test_items_within_the_window_are_handed_together():
+    windows = []
+    netting_window = NettingWindow(windows.append, window_ms=50)
+    for item in range(3):
+        netting_window.add(item)
+    time.sleep(0.01)
+    assert windows == []  # the window is still open
+    time.sleep(0.1)
+    netting_window.add(3)
+    netting_window.close()  # hands the open window right away
+    assert windows == [[0, 1, 2], [3]]
+
+
+def test_window_error_is_raised():
+    def on_window(items):
+        raise ConnectionError("Binance is down")
+
+    netting_window = NettingWindow(on_window, window_ms=1)
+    netting_window.add(0)
+    time.sleep(0.05)
+    with pytest.raises(ConnectionError):
+        netting_window.add(1)
+    netting_window.close()
@@ -149,3 +149,44 @@ def test_order_alternations_with_bearish_start():
                 )["action"]
                 == OrderAction.POST_ORDER
             )
+
+
+def test_net_order_respects_the_total_quantity_limit():
+    trading_spec = create_trading_spec(
+        symbol="BTCUSDT", base_asset="BTC", quantity=0.001, total_quantity_limit=0.003
+    )
+    order_strategy = SuccessiveStrategy(trading_spec)
+    net_order, orders = order_strategy.net_order_strategy(
+        ["bullish", "bullish", "bearish", "bullish", "bullish", "unknown"],
+        holding_quantity=0.001,
+    )
+    # +0.001, +0.001, -0.001, +0.001, skipped (limit), skipped (unknown)
+    assert [order["action"] for order in orders] == [OrderAction.POST_ORDER] * 4 + [
+        OrderAction.SKIP_ORDER
+    ] * 2
+    assert net_order == {
+        "action": OrderAction.POST_ORDER,
+        "order": {
+            "symbol": "BTCUSDT",
+            "side": "BUY",
+            "type": "MARKET",
+            "quantity": 0.002,
+        },
+    }
+
+
+def test_net_order_sells_the_holding_quantity_at_most():
+    trading_spec = create_trading_spec(
+        symbol="BTCUSDT", base_asset="BTC", quantity=0.001, total_quantity_limit=0.01
+    )
+    order_strategy = SuccessiveStrategy(trading_spec)
+    net_order, _ = order_strategy.net_order_strategy(
+        ["bearish"] * 5, holding_quantity=0.002
+    )
+    assert net_order["order"]["side"] == "SELL"
+    assert net_order["order"]["quantity"] == 0.002
+
+    net_order, _ = order_strategy.net_order_strategy(
+        ["bullish", "bearish"], holding_quantity=0.002
+    )
+    assert net_order["action"] == OrderAction.SKIP_ORDER
@@ -1,7 +1,13 @@
+import json
+import queue
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
 
+from aitradingprototype.common.metrics import Metrics
+from aitradingprototype.tb.enums import OrderAction
 from aitradingprototype.tb.trading_bot import TradingBot
 
 
@@ -57,6 +63,9 @@ def test_tb_init(mock_tb_config):
             secret_key=mock_tb_config["secret_key"],
             private_key_path=mock_tb_config["private_key_path"],
             private_key_password=mock_tb_config["private_key_password"],
+            exchange_filters=None,
+            websocket_api=None,
+            symbols=["BTCUSDT"],
         )
         MockSuccessiveStrategy.assert_called_once_with(
             mock_tb_config["trading_strategy"]
@@ -65,6 +74,7 @@ def test_tb_init(mock_tb_config):
             tb.binance,
             tb.redis,
             f"aitp_{MockSuccessiveStrategy.return_value.__class__.__name__.lower()}_holding_qty_{mock_tb_config['trading_strategy']['base_asset'].lower()}",
+            holding_cache_ttl=None,
         )
 
 
@@ -73,4 +83,371 @@ def test_tb_trade_based_on_redis(mock_tb_config):
     tb.redis = MagicMock()
     tb.trade_based_on_redis()
     # Verify that tb.redis.listen_for_events is called with tb._event_handler
-    tb.redis.listen_for_events.assert_called_once_with(tb._event_handler)
+    tb.redis.listen_for_events.assert_called_once_with(
+        tb._event_handler, channels=["headlines_sentiment"]
+    )
+
+
+def test_tb_trade_based_on_redis_stream(mock_tb_config):
+    mock_tb_config["redis_stream"] = {"group": "trading_bot", "consumer": "tb-1"}
+    tb = TradingBot(mock_tb_config)
+    tb.redis = MagicMock()
+    tb.trade_based_on_redis()
+    tb.redis.listen_for_events.assert_not_called()
+    tb.redis.consume_stream.assert_called_once_with(
+        tb._event_handler,
+        "trading_bot",
+        "tb-1",
+        replay_from=None,
+        count=100,
+        block_ms=5000,
+        claim_idle_ms=60000,
+        streams=["headlines_sentiment"],
+        defer_ack=False,
+    )
+
+
+def test_tb_acknowledges_the_netted_stream_entries(mock_multi_tb_config):
+    mock_multi_tb_config["netting"] = {"window_ms": 60000}
+    tb = TradingBot(mock_multi_tb_config)
+    for instance in tb.instances:
+        instance.strategy_executor = MagicMock()
+        instance.strategy_executor.holding_qty.return_value = 0.0
+    acks = []
+
+    def consume_stream(event_handler, *args, defer_ack, **kwargs):
+        assert defer_ack
+        for index, asset in enumerate(["BTC", "ETH", "SOL"]):
+            event_data = {
+                "event_id": str(index),
+                "sentiment": "bullish",
+                "asset": asset,
+            }
+            event_handler(
+                {
+                    "type": "message",
+                    "data": json.dumps(event_data),
+                    "ack": lambda index=index: acks.append(str(index)),
+                }
+            )
+        # the untraded asset is acknowledged, the others wait for their windows
+        assert acks == ["2"]
+        raise KeyboardInterrupt
+
+    mock_multi_tb_config["redis_stream"] = {"group": "trading_bot"}
+    tb.redis.consume_stream = consume_stream
+    with pytest.raises(KeyboardInterrupt):
+        tb.trade_based_on_redis()
+    # the BTC event is acknowledged once both BTC windows are traded
+    assert sorted(acks) == ["0", "1", "2"]
+
+
+def test_tb_trades_queued_events_and_drains_on_shutdown(mock_tb_config):
+    mock_tb_config["work_queue"] = {"max_size": 10, "overflow": "block"}
+    tb = TradingBot(mock_tb_config)
+    processed = []
+
+    def process_sentiment(sentiment):
+        time.sleep(0.01)  # slow order, the events are still read
+        processed.append(sentiment)
+
+    tb.instances[0].process_sentiment = process_sentiment
+
+    def listen_for_events(event_handler, channels):
+        for sentiment in ["bullish", "bearish", "bullish"]:
+            event_handler(
+                {"type": "message", "data": json.dumps({"sentiment": sentiment})}
+            )
+        assert tb.work_queue.depth > 0
+        raise KeyboardInterrupt
+
+    tb.redis.listen_for_events = listen_for_events
+    with pytest.raises(KeyboardInterrupt):
+        tb.trade_based_on_redis()
+    assert processed == ["bullish", "bearish", "bullish"]
+    assert tb.work_queue is None
+
+
+def test_tb_nets_the_orders_of_the_window_events(mock_tb_config, caplog):
+    mock_tb_config["netting"] = {"window_ms": 60000}
+    tb = TradingBot(mock_tb_config)
+    instance = tb.instances[0]
+    instance.strategy_executor = MagicMock()
+    instance.strategy_executor.holding_qty.return_value = 0.0
+
+    def listen_for_events(event_handler, channels):
+        for index, sentiment in enumerate(["bullish", "bullish", "bearish", "bullish"]):
+            event_data = {"event_id": str(index), "sentiment": sentiment}
+            event_handler({"type": "message", "data": json.dumps(event_data)})
+        raise KeyboardInterrupt
+
+    tb.redis.listen_for_events = listen_for_events
+    with caplog.at_level("INFO"), pytest.raises(KeyboardInterrupt):
+        tb.trade_based_on_redis()
+    # the window is closed on shutdown, a single order for the 4 events
+    instance.strategy_executor.execute_order.assert_called_once_with(
+        {
+            "action": OrderAction.POST_ORDER,
+            "order": {
+                "symbol": "BTCUSDT",
+                "side": "BUY",
+                "type": "MARKET",
+                "quantity": 0.002,
+            },
+        }
+    )
+    assert "Netted event '2' (bearish)" in caplog.text
+    assert instance.netting_window is None
+
+
+def test_tb_skips_near_duplicate_events(mock_tb_config):
+    tb = TradingBot(mock_tb_config)
+    tb.instances[0].process_sentiment = MagicMock()
+    event = {
+        "type": "message",
+        "data": '{"event_id": "b", "sentiment": "bullish", "duplicate_of": "a"}',
+    }
+    tb._event_handler(event)
+    tb.instances[0].process_sentiment.assert_not_called()
+
+    event["data"] = '{"event_id": "a", "sentiment": "bullish"}'
+    tb._event_handler(event)
+    tb.instances[0].process_sentiment.assert_called_once_with("bullish")
+
+
+def test_tb_records_headline_to_fill_latency(mock_tb_config, monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr("aitradingprototype.tb.trading_bot.metrics", metrics)
+    tb = TradingBot(mock_tb_config)
+    tb.instances[0].process_sentiment = MagicMock(return_value={"side": "BUY"})
+    now_ms = int(time.time() * 1000)
+    event = {
+        "type": "message",
+        "data": json.dumps(
+            {
+                "event_id": "a",
+                "event_time": now_ms - 100,
+                "published_time": now_ms - 60000,
+                "read_time": now_ms - 1000,
+                "sentiment": "bullish",
+            }
+        ),
+    }
+    tb._event_handler(event)
+    assert metrics.counter("aitp_events_received_total").value == 1
+    transport = metrics.histogram("aitp_stage_seconds", stage="transport")
+    # the percentiles are within 2%
+    assert 0.098 <= transport.percentile(50) < 1
+    assert metrics.histogram("aitp_headline_to_fill_seconds").percentile(50) >= 60
+    assert 1 <= metrics.histogram("aitp_read_to_fill_seconds").percentile(50) < 2
+
+    # no order posted
+    tb.instances[0].process_sentiment.return_value = None
+    tb._event_handler(event)
+    assert metrics.counter("aitp_events_received_total").value == 2
+    assert metrics.histogram("aitp_headline_to_fill_seconds").count == 1
+
+
+class StopTrading(Exception):
+    pass
+
+
+def test_tb_trade_based_on_file_resumes_from_checkpoint(mock_tb_config, tmp_path):
+    sentiments_file = tmp_path / "sentiments_btc.csv"
+    sentiments_file.write_text(
+        '"NewsAPI","1","1","first","bullish"\n'
+        '"NewsAPI","2","2","second","bearish"\n'
+        '"NewsAPI","3","3","third","unknown"\n'
+    )
+    config = mock_tb_config
+    config["input_option"] = "file"
+    config["sentiments_file"] = str(sentiments_file)
+    config["checkpoint"] = {"file": str(tmp_path / "tb_checkpoint.json")}
+
+    tb = TradingBot(config)
+    tb.instances[0].process_sentiment = MagicMock(side_effect=[None, StopTrading])
+    with pytest.raises(StopTrading):
+        tb.trade_based_on_file()
+
+    # the second line wasn't processed, it's processed again after the restart
+    tb = TradingBot(config)
+    tb.instances[0].process_sentiment = MagicMock(side_effect=[None, StopTrading])
+    with pytest.raises(StopTrading):
+        tb.trade_based_on_file()
+    assert [c.args[0] for c in tb.instances[0].process_sentiment.call_args_list] == [
+        "bearish",
+        "unknown",
+    ]
+
+
+def test_tb_mismatched_checkpoint_reads_new_sentiments_only(mock_tb_config, tmp_path):
+    sentiments_file = tmp_path / "sentiments_btc.csv"
+    sentiments_file.write_text('"NewsAPI","1","1","first","bullish"\n')
+    checkpoint_file = tmp_path / "tb_checkpoint.json"
+    checkpoint_file.write_text(
+        f'{{"offset": 10, "inode": {sentiments_file.stat().st_ino}, "line_hash": "other"}}'
+    )
+    config = mock_tb_config
+    config["sentiments_file"] = str(sentiments_file)
+    config["checkpoint"] = {"file": str(checkpoint_file)}
+
+    tb = TradingBot(config)
+    processed = queue.Queue()
+
+    def process_sentiment(sentiment):
+        processed.put(sentiment)
+        raise StopTrading
+
+    def trade():
+        with pytest.raises(StopTrading):
+            tb.trade_based_on_file()
+
+    tb.instances[0].process_sentiment = process_sentiment
+    threading.Thread(target=trade, daemon=True).start()
+    time.sleep(0.2)
+    with open(sentiments_file, "a") as file:
+        file.write('"NewsAPI","2","2","second","bearish"\n')
+    assert processed.get(timeout=2) == "bearish"
+
+    config["checkpoint"]["on_mismatch"] = "fail"
+    with pytest.raises(ValueError):
+        TradingBot(config).trade_based_on_file()
+
+
+@pytest.fixture
+def mock_multi_tb_config(mock_tb_config):
+    """
+    Trade BTCUSDT, ETHUSDT and a second BTC strategy with its own holding quantity key
+    """
+    del mock_tb_config["trading_strategy"]
+    mock_tb_config["trading_strategies"] = [
+        {
+            "symbol": "BTCUSDT",
+            "base_asset": "BTC",
+            "order_quantity": 0.001,
+            "total_quantity_limit": 0.01,
+        },
+        {
+            "symbol": "ETHUSDT",
+            "base_asset": "ETH",
+            "order_quantity": 0.01,
+            "total_quantity_limit": 0.1,
+        },
+        {
+            "name": "successive",
+            "symbol": "BTCFDUSD",
+            "base_asset": "BTC",
+            "order_quantity": 0.002,
+            "total_quantity_limit": 0.01,
+            "instance_id": "fdusd",
+        },
+    ]
+    return mock_tb_config
+
+
+def test_tb_routes_the_events_by_asset(mock_multi_tb_config):
+    tb = TradingBot(mock_multi_tb_config)
+    # a single Binance client for all the symbols
+    assert tb.binance.symbols == ["BTCUSDT", "ETHUSDT", "BTCFDUSD"]
+    assert [i.strategy_executor.binance for i in tb.instances] == [tb.binance] * 3
+    assert [i.strategy_executor.holding_qty_key for i in tb.instances] == [
+        "aitp_successivestrategy_holding_qty_btc",
+        "aitp_successivestrategy_holding_qty_eth",
+        "aitp_successivestrategy_holding_qty_btc_fdusd",
+    ]
+    for instance in tb.instances:
+        instance.process_sentiment = MagicMock(return_value=None)
+
+    def listen_for_events(event_handler, channels):
+        # the channel of a single asset SG, and the channels of an asset list SG
+        assert channels == [
+            "headlines_sentiment",
+            "headlines_sentiment_btc",
+            "headlines_sentiment_eth",
+        ]
+        for asset, sentiment in [("ETH", "bullish"), ("BTC", "bearish"), ("SOL", "")]:
+            event_data = {"sentiment": sentiment, "asset": asset}
+            event_handler({"type": "message", "data": json.dumps(event_data)})
+
+    tb.redis = MagicMock()
+    tb.redis.listen_for_events = listen_for_events
+    tb.trade_based_on_redis()
+    btc, eth, btc_fdusd = tb.instances
+    eth.process_sentiment.assert_called_once_with("bullish")
+    btc.process_sentiment.assert_called_once_with("bearish")
+    btc_fdusd.process_sentiment.assert_called_once_with("bearish")
+
+
+def test_tb_single_strategy_list_listens_to_the_base_channel(mock_multi_tb_config):
+    mock_multi_tb_config["trading_strategies"] = mock_multi_tb_config[
+        "trading_strategies"
+    ][:1]
+    tb = TradingBot(mock_multi_tb_config)
+    # a single asset SG publishes to `redis_channel`
+    assert tb._event_channels() == ["headlines_sentiment", "headlines_sentiment_btc"]
+
+
+def test_tb_nets_the_orders_of_each_instance(mock_multi_tb_config):
+    mock_multi_tb_config["netting"] = {"window_ms": 60000}
+    tb = TradingBot(mock_multi_tb_config)
+    for instance in tb.instances:
+        instance.strategy_executor = MagicMock()
+        instance.strategy_executor.holding_qty.return_value = 0.0
+
+    def listen_for_events(event_handler, channels):
+        for asset in ["BTC", "ETH", "BTC"]:
+            event_data = {"sentiment": "bullish", "asset": asset}
+            event_handler({"type": "message", "data": json.dumps(event_data)})
+
+    tb.redis.listen_for_events = listen_for_events
+    tb.trade_based_on_redis()
+    quantities = [
+        i.strategy_executor.execute_order.call_args.args[0]["order"]["quantity"]
+        for i in tb.instances
+    ]
+    assert quantities == [0.002, 0.01, 0.004]
+
+
+def test_tb_strategies_config_errors(mock_multi_tb_config):
+    strategies = mock_multi_tb_config["trading_strategies"]
+    del strategies[2]["instance_id"]
+    with pytest.raises(ValueError, match="holding quantity key"):
+        TradingBot(mock_multi_tb_config)
+    strategies[2]["name"] = "unknown"
+    with pytest.raises(ValueError, match="isn't supported"):
+        TradingBot(mock_multi_tb_config)
+    del strategies[2]
+    with pytest.raises(ValueError, match="single trading strategy"):
+        TradingBot(mock_multi_tb_config).trade_based_on_file()
+
+
+def test_tb_warms_up_before_trading(mock_tb_config, tmp_path):
+    ready_file = tmp_path / "tb.ready"
+    mock_tb_config["warm_up"] = {
+        "ready_file": str(ready_file),
+        "keep_alive_interval": 0.01,
+    }
+    tb = TradingBot(mock_tb_config)
+    tb.redis = MagicMock()
+    tb.binance = MagicMock()
+    executor = tb.instances[0].strategy_executor = MagicMock()
+    executor.holding_qty.return_value = 0.005
+
+    def trade_based_on_redis():
+        # warmed up before the events are read
+        tb.redis.warm_up.assert_called_once_with()
+        tb.binance.warm_up.assert_called_once_with()
+        executor.holding_qty.assert_called_once_with()
+        assert tb.ready.is_set() and ready_file.exists()
+        time.sleep(0.1)
+        raise StopTrading
+
+    tb.trade_based_on_redis = trade_based_on_redis
+    with pytest.raises(StopTrading):
+        tb.start()
+    # the connections are kept alive, no order is posted
+    assert tb.redis.ping.call_count > 1
+    assert tb.binance.keep_alive.call_count > 1
+    executor.execute_order.assert_not_called()
+    assert not tb.ready.is_set() and not ready_file.exists()
+    tb.binance.close.assert_called_once_with()
@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from binance.error import ClientError
+from binance.lib.authentication import hmac_hashing
+
+from aitradingprototype.tb.mock_binance_server import start_server
+from aitradingprototype.tb.websocket_api_client import WebSocketApiClient
+
+
+@pytest.fixture
+def mock_server():
+    server = start_server(latency=0.01, secret_key="secret_key")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **kwargs):
+    return WebSocketApiClient(
+        f"ws://127.0.0.1:{server.server_port}/ws-api/v3",
+        "api_key",
+        lambda payload: hmac_hashing("secret_key", payload),
+        timeout=2,
+        reconnect_wait=0.01,
+        **kwargs,
+    )
+
+
+def _order(quantity="0.001"):
+    return {"symbol": "BTCUSDT", "side": "BUY", "type": "MARKET", "quantity": quantity}
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_orders_share_one_connection(mock_server):
+    client = _client(mock_server)
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(lambda _: client.new_order(**_order()), range(8)))
+    client.close()
+    # each response is matched to its request
+    assert sorted(response["orderId"] for response in responses) == list(range(1, 9))
+    assert responses[0]["fills"][0]["price"] == "25000.00000000"
+    assert mock_server.stats()["connections"] == 1
+
+
+def test_error_response(mock_server):
+    client = _client(mock_server)
+    with pytest.raises(ClientError) as error:
+        client.new_order(**_order("0.0001"))
+    assert error.value.error_code == -1013
+    assert error.value.error_message == "Filter failure: NOTIONAL"
+    client.sign = lambda payload: "invalid"
+    with pytest.raises(ClientError) as error:
+        client.new_order(**_order())
+    assert error.value.error_code == -1022
+    client.close()
+
+
+def test_ping_and_time_offset(mock_server):
+    client = _client(mock_server)
+    assert client.ping() == {}
+    client.time_offset = -60000
+    # the signature covers the shifted timestamp
+    assert client.new_order(**_order())["status"] == "FILLED"
+    client.close()
+
+
+def test_reconnect(mock_server):
+    client = _client(mock_server)
+    client.new_order(**_order())
+    mock_server.drop_connections()
+    assert _wait_for(lambda: client.connections == 2)
+    assert client.new_order(**_order())["orderId"] == 2
+    client.close()
+    assert not client.connected
+
+
+def test_no_connection():
+    client = WebSocketApiClient(
+        "ws://127.0.0.1:1/ws-api/v3", "api_key", str, timeout=0.05
+    )
+    with pytest.raises(ConnectionError):
+        client.new_order(**_order())
+    client.close()
+    with pytest.raises(RuntimeError):
+        client.new_order(**_order())
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from aitradingprototype.common.metrics import Metrics
+from aitradingprototype.tb.work_queue import WorkQueue
+
+
+class Worker:
+    """
+    Process the items once released, in order
+    """
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.items = []
+
+    def process(self, item):
+        self.released.wait()
+        self.items.append(item)
+
+
+def _fill(work_queue, worker, items):
+    work_queue.put(items[0])
+    while work_queue.depth:  # the worker is now blocked on the first item
+        time.sleep(0.001)
+    for item in items[1:]:
+        work_queue.put(item)
+
+
+def test_block_overflow_waits_for_the_worker():
+    worker = Worker()
+    work_queue = WorkQueue(worker.process, max_size=2)
+    _fill(work_queue, worker, [0, 1, 2])
+    put_thread = threading.Thread(target=work_queue.put, args=(3,))
+    put_thread.start()
+    put_thread.join(0.05)
+    assert put_thread.is_alive()  # blocked, the queue is full
+    worker.released.set()
+    put_thread.join(1)
+    work_queue.close()
+    assert worker.items == [0, 1, 2, 3]
+
+
+def test_drop_oldest_overflow():
+    worker = Worker()
+    work_queue = WorkQueue(worker.process, max_size=2, overflow="drop_oldest")
+    _fill(work_queue, worker, [0, 1, 2, 3])
+    worker.released.set()
+    work_queue.close()
+    assert worker.items == [0, 2, 3]
+    assert work_queue.stats() == {
+        "processed": 3,
+        "dropped": 1,
+        "coalesced": 0,
+        "depth": 0,
+    }
+
+
+def test_coalesce_overflow():
+    worker = Worker()
+    work_queue = WorkQueue(
+        worker.process,
+        max_size=2,
+        overflow="coalesce",
+        coalesce_key=lambda item: item["asset"],
+    )
+    _fill(
+        work_queue,
+        worker,
+        [
+            {"asset": "BTC", "sentiment": "bullish"},
+            {"asset": "BTC", "sentiment": "bearish"},
+            {"asset": "ETH", "sentiment": "bearish"},
+            {
+                "asset": "BTC",
+                "sentiment": "bullish",
+            },  # supersedes the waiting BTC event
+            {"asset": "SOL", "sentiment": "bullish"},  # no SOL event, drops the oldest
+        ],
+    )
+    worker.released.set()
+    work_queue.close()
+    assert worker.items == [
+        {"asset": "BTC", "sentiment": "bullish"},
+        {"asset": "ETH", "sentiment": "bearish"},
+        {"asset": "SOL", "sentiment": "bullish"},
+    ]
+    assert work_queue.coalesced == work_queue.dropped == 1
+
+
+def test_close_drains_the_waiting_items(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr("aitradingprototype.tb.work_queue.metrics", metrics)
+    worker = Worker()
+    work_queue = WorkQueue(worker.process, max_size=10)
+    _fill(work_queue, worker, list(range(5)))
+    assert metrics.gauge("aitp_work_queue_depth", queue="work-queue").value == 4
+    threading.Timer(0.05, worker.released.set).start()
+    work_queue.close()
+    assert worker.items == list(range(5))
+    assert metrics.gauge("aitp_work_queue_depth", queue="work-queue").value == 0
+    assert metrics.histogram("aitp_stage_seconds", stage="queue_wait").count == 5
+
+
+def test_processing_error_is_raised():
+    def process(item):
+        raise ConnectionError("Binance is down")
+
+    work_queue = WorkQueue(process, max_size=1)
+    work_queue.put(0)
+    time.sleep(0.05)
+    with pytest.raises(ConnectionError):
+        work_queue.put(1)
+    work_queue.close()
+
+
+@pytest.mark.parametrize("overflow", ["block", "drop_oldest", "coalesce"])
+def test_worker_exit_is_raised(overflow):
+    def process(item):
+        raise SystemExit(1)
+
+    work_queue = WorkQueue(process, max_size=1, overflow=overflow)
+    work_queue.put(0)
+    time.sleep(0.05)
+    with pytest.raises(SystemExit):
+        work_queue.put(1)
+    # the worker is stopped, the next items aren't queued
+    with pytest.raises(RuntimeError):
+        work_queue.put(2)
+    assert work_queue.depth == 0
+    work_queue.close()
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        WorkQueue(print, overflow="drop_newest")